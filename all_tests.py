@@ -6,14 +6,30 @@
 import unittest
 
 import dir_archive_test
+import dir_tree_visitor_test
+import dir_walker_test
+import dir_watcher_test
+import disk_usage_test
+import file_index_test
+import file_table_test
+import parallel_gzip_test
 import path2listtest
+import path_matcher_test
 import pyfib_test
+import rm_gen_bin_test
+import tgz_index_test
+import zip_central_dir_test
 
 
 def suite():
     """Returns the suite of unit tests."""
-    suites = [dir_archive_test.suite(), path2listtest.suite(),
-              pyfib_test.suite()]
+    suites = [dir_archive_test.suite(), dir_tree_visitor_test.suite(),
+              dir_walker_test.suite(), dir_watcher_test.suite(),
+              disk_usage_test.suite(), file_index_test.suite(),
+              file_table_test.suite(), parallel_gzip_test.suite(),
+              path2listtest.suite(), path_matcher_test.suite(),
+              pyfib_test.suite(), rm_gen_bin_test.suite(),
+              tgz_index_test.suite(), zip_central_dir_test.suite()]
     return unittest.TestSuite(suites)
 
 
@@ -4,23 +4,104 @@
 """Manages an archive in a particular format."""
 
 
+import asyncio
+from bisect import bisect_right
+from collections import deque, namedtuple
+from collections.abc import Mapping
+from concurrent.futures import (Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor)
 from datetime import datetime
+import fnmatch
+from functools import partial
+import glob
+import gzip
+import hashlib
+import heapq
+import io
+import json
+import lzma
+import mmap
 import os
+import re
+import shutil
+import stat
+import struct
+import sys
 import tarfile
+import tempfile
+import threading
 import time
 import zipfile
+import zlib
+
+from parallel_gzip import BLOCK_SIZE, ParallelGzipFile, crc32_combine
+from tgz_index import (CHECKPOINT_SPACING, TRAILER_SIZE, Checkpoint,
+                       GzipStreamReader, IndexingTarFile, TgzIndex)
+from zip_central_dir import ZipCentralDirectory
+
+
+# The size of the blocks read from a file when compressing it.
+CHUNK_SIZE = 1 << 20
+
+# Members larger than this size are compressed by the writer itself
+# instead of being shipped to (and back from) a worker process.
+PARALLEL_MEMBER_LIMIT = 64 << 20
+
+# The default amount of file data read ahead in locality order, and the
+# number of threads reading it.
+READAHEAD_SIZE = 64 << 20
+READ_JOBS = 4
+
+# The default number of seconds between the checkpoints of a resumable
+# archive.
+COMMIT_INTERVAL = 60.0
+
+# The default amount of decompressed content a MemoryTree keeps in
+# memory before spilling to a temporary directory.
+MEMORY_BUDGET = 256 << 20
+
+# The most bytes the headers of a .zip member take besides its name
+# (twice): its local header, data descriptor and central directory
+# entry, each with a ZIP64 extra field.
+ZIP_MEMBER_OVERHEAD = 30 + 20 + 24 + 46 + 28
+
+# The most bytes of the end records of a .zip volume, ZIP64 included.
+ZIP_VOLUME_RESERVE = 56 + 20 + 22
+
+# The most bytes of the end of archive blocks of a .tar stream, padded
+# to a record, and of the gzip header and trailer TarFile writes around
+# a stream.
+TAR_TRAILER_SIZE = tarfile.RECORDSIZE + tarfile.BLOCKSIZE
+GZIP_WRAPPER_SIZE = 10 + 1 + 8
+
+# zipfile has no public way to write or read a member still compressed
+# nor to compress as it does. read_compressed, write_compressed and
+# compress_chunks use these private internals of the ZipFile class
+# instead, known to exist in CPython from the first to the last version
+# here (see raw_zip_supported).
+RAW_ZIP_VERSIONS = ((3, 6), (3, 13))
+RAW_ZIP_INTERNALS = ('_lock', 'fp', 'start_dir', '_writecheck',
+                     '_didModify', '_seekable', '_allowZip64')
+
+# The ZipInfo attributes journaled to rebuild the central directory.
+ZIP_INFO_FIELDS = ('filename', 'compress_type', 'CRC', 'compress_size',
+                   'file_size', 'header_offset', 'flag_bits',
+                   'external_attr', 'internal_attr', 'create_system',
+                   'create_version', 'extract_version', 'volume')
 
 
 class Archive(object):
     """Common functions for all archives."""
 
-    def __init__(self, dir_name, archive_base):
-        """Archive(dir_name, archive_base) -> o
+    def __init__(self, dir_name, archive_base, jobs=1):
+        """Archive(dir_name, archive_base, jobs=1) -> o
 
         Constructs an instance. If archive_base is None, the archive
         base is dir_name. If dir_name is '/' (root) and archive_base is
         None, the archive_base is 'root'. If dir_name is '.' (the current
-        directory), raises ValueError."""
+        directory), raises ValueError. Jobs is the number of worker
+        processes used to (de)compress members; 1 does all the work in
+        the calling process."""
         
         if (dir_name == '.') or (dir_name == os.getcwd()):
             raise ValueError('Directory cannot be' +
@@ -35,6 +116,94 @@ class Archive(object):
         if self.dir_name == '/':
             self._archive_base = 'root'
 
+        if jobs < 1:
+            raise ValueError('Jobs must be at least 1.')
+        self.jobs = jobs
+        self.observers = []
+        self.stats = ArchiveStats()
+        self._lock = threading.Lock()
+
+    def add_observer(self, observer):
+        """Report my progress to observer, an ArchiveObserver."""
+        self.observers.append(observer)
+
+    def observe(self, action, *args):
+        """Run action(*args) as one observed run.
+
+        Resets my stats and tells my observers when the run starts and
+        when it finishes, even if action raises an error."""
+        self.stats = ArchiveStats()
+        for observer in list(self.observers):
+            observer.started(self)
+        try:
+            result = action(*args)
+        except BaseException as error:
+            self.stats.finish(error)
+            for observer in list(self.observers):
+                observer.finished(self, self.stats)
+            raise
+        self.stats.finish()
+        for observer in list(self.observers):
+            observer.finished(self, self.stats)
+        return result
+
+    async def archive_async(self, fileobj=None, executor=None):
+        """Coroutine archiving like archive(fileobj) without blocking the
+        event loop (see run_async)."""
+        return await self.run_async(self.archive, fileobj,
+                                    executor=executor)
+
+    async def extract_async(self, executor=None, **kwargs):
+        """Coroutine extracting like extract(**kwargs) without blocking
+        the event loop (see run_async)."""
+        return await self.run_async(partial(self.extract, **kwargs),
+                                    executor=executor)
+
+    async def run_async(self, action, *args, executor=None):
+        """Coroutine running action(*args), a blocking run of mine, in
+        executor (by default, that of the event loop).
+
+        All file I/O and (de)compression happen in the executor and in
+        my own worker pools. If the awaiting task is cancelled, the run
+        stops after its current member, raising ArchiveCancelled to my
+        observers, and is cleaned up (no partial archive or volume is
+        left) before CancelledError is raised."""
+        loop = asyncio.get_running_loop()
+        canceller = Canceller()
+        self.add_observer(canceller)
+        future = loop.run_in_executor(executor, partial(action, *args))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            canceller.cancel()
+            await asyncio.wait([future])
+            if not future.cancelled():
+                # Retrieve the ArchiveCancelled of the run so that it is
+                # not logged as never retrieved.
+                future.exception()
+            raise
+        finally:
+            self.observers.remove(canceller)
+
+    def progress(self):
+        """Returns an AsyncProgress reporting my next run to the event
+        loop running this call."""
+        progress = AsyncProgress(self, asyncio.get_running_loop())
+        self.add_observer(progress)
+        return progress
+
+    def member_done(self, name, bytes_read, bytes_written, seconds):
+        """Count the member name and tell my observers about it.
+
+        Bytes_read is the size of the member content, bytes_written the
+        size of its compressed data and seconds the time spent
+        compressing it. May be called from several threads."""
+        member = MemberStats(name, bytes_read, bytes_written, seconds)
+        with self._lock:
+            self.stats.add(member)
+            for observer in list(self.observers):
+                observer.member_done(self, member, self.stats)
+
     def archive_ext(self):
         raise NotImplementedError
 
@@ -42,20 +211,42 @@ class Archive(object):
         """Returns the archive filename."""
         return self._archive_base + self.archive_ext()
 
+    def volume_filename(self, number):
+        """Returns the filename of my volume number (from 1)."""
+        return '{0}.{1:03}{2}'.format(self._archive_base, number,
+                                      self.archive_ext())
+
+    def volume_filenames(self):
+        """Returns the sorted filenames of my existing volumes."""
+        pattern = re.compile(re.escape(self._archive_base) + r'\.(\d{3,})' +
+                             re.escape(self.archive_ext()) + '$')
+        matches = [pattern.match(filename) for filename in
+                   glob.glob(glob.escape(self._archive_base) + '.*' +
+                             glob.escape(self.archive_ext()))]
+        return [match.group(0) for match in
+                sorted((match for match in matches if match),
+                       key=lambda match: int(match.group(1)))]
+
+    def remove_volumes(self):
+        """Remove my existing volumes."""
+        for filename in self.volume_filenames():
+            os.remove(filename)
+
 
 class TgzArchive(Archive):
     """Manages a .tgz archive."""
 
     EXT = '.tgz'
     
-    def __init__(self, archive_base, dir_name=None):
-        """TgzArchive(archive_base, dir_name=None) -> o
+    def __init__(self, archive_base, dir_name=None, jobs=1):
+        """TgzArchive(archive_base, dir_name=None, jobs=1) -> o
 
         Constructs an instance from a archive_base. ArchiveBase is the
         archive filename without the extension. Note that dir_name is
         only used by child classes.
         """
-        super(TgzArchive, self).__init__(dir_name, archive_base)
+        super(TgzArchive, self).__init__(dir_name, archive_base, jobs)
+        self._index = None
 
     def archive_ext(self):
         """Returns the format-specific extension.
@@ -63,38 +254,621 @@ class TgzArchive(Archive):
         The returned value includes the leading dot ('.')
         """
         return TgzArchive.EXT
-    
+
+    def index_filename(self):
+        """Returns the filename of my random-access index."""
+        return self.archive_filename() + TgzIndex.EXT
+
+    def build_index(self):
+        """Build and save the random-access index of my archive.
+
+        Reads the whole archive once. Use TgzDirArchive(index=True) to
+        write a finer-grained index while archiving."""
+        index = TgzIndex.build(self.archive_filename())
+        index.save(self.index_filename())
+        self._index = index
+        return index
+
+    def load_index(self):
+        """Returns my random-access index, loading it once."""
+        if self._index is None:
+            self._index = TgzIndex.load(self.index_filename())
+        return self._index
+
+    def open_member(self, name):
+        """Returns a read-only file object for the member file name.
+
+        Uses my index to only decompress from the checkpoint nearest
+        the member. Close the returned object when done."""
+        return self.load_index().open_member(self.archive_filename(), name)
+
+    def extract_member(self, name):
+        """Extract the single member name into the current working
+        directory using my index."""
+        with open(self.archive_filename(), 'rb') as tgz_file:
+            tar_file, tar_info = self.load_index().open_tar(tgz_file, name)
+            try:
+                tar_file.extract(tar_info)
+            finally:
+                tar_file.close()
+
+    def verify(self):
+        """Check my archive without writing any file.
+
+        Decompresses the whole archive in memory, checking every tar
+        header and the CRC-32 of the gzip stream. If I have more than
+        one job and an index, the stream is checked between index
+        checkpoints by a pool of jobs threads. Returns a VerifyReport.
+        """
+        report = VerifyReport(self.archive_filename())
+        index = self._index
+        if (index is None) and os.path.isfile(self.index_filename()):
+            index = self.load_index()
+        if (self.jobs > 1) and index and (len(index.checkpoints) > 1):
+            self.verify_segments(index, report)
+        else:
+            self.verify_stream(report)
+        return report
+
+    def verify_stream(self, report):
+        """Check my archive in a single pass, adding to report."""
+        name = None
+        try:
+            with open(self.archive_filename(), 'rb') as tgz_file:
+                reader = GzipStreamReader(tgz_file, Checkpoint(0, 0, None))
+                tar_file = tarfile.open(fileobj=reader, mode='r|')
+                try:
+                    for member in tar_file:
+                        name = member.name
+                        report.members += 1
+                        if not member.isreg():
+                            # Links have no content and cannot be read.
+                            continue
+                        member_file = tar_file.extractfile(member)
+                        while member_file.read(CHUNK_SIZE):
+                            pass
+                    name = None
+                    # Finish the stream so the gzip trailer is checked.
+                    while reader.read(CHUNK_SIZE):
+                        pass
+                finally:
+                    tar_file.close()
+                report.bytes = reader.tell()
+        except EOFError as error:
+            report.add_problem(name, 'truncated', str(error))
+        except (tarfile.TarError, zlib.error) as error:
+            report.add_problem(name, 'corrupt', str(error))
+        except OSError as error:
+            report.add_problem(name, 'unreadable', str(error))
+
+    def verify_segments(self, index, report):
+        """Check my archive between the checkpoints of index on a pool
+        of threads, adding to report."""
+        names = sorted(index.members, key=index.members.get)
+        offsets = [index.members[name] for name in names]
+        checkpoints = index.checkpoints
+        report.members = len(names)
+
+        executor = ThreadPoolExecutor(max_workers=self.jobs)
+        try:
+            futures = []
+            for position, checkpoint in enumerate(checkpoints):
+                start = checkpoint.uncompressed_offset
+                end = (checkpoints[position + 1].uncompressed_offset if
+                       position + 1 < len(checkpoints) else None)
+                headers = offsets[bisect_right(offsets, start - 1):
+                                  (bisect_right(offsets, end - 1) if
+                                   end is not None else len(offsets))]
+                futures.append(executor.submit(verify_tgz_segment,
+                                               self.archive_filename(),
+                                               checkpoint, end, headers))
+            crc = 0
+            for future in futures:
+                segment_crc, size, problems = future.result()
+                crc = crc32_combine(crc, segment_crc, size)
+                report.bytes += size
+                for offset, kind, message in problems:
+                    position = bisect_right(offsets, offset) - 1
+                    report.add_problem(names[position] if position >= 0 else
+                                       None, kind, message)
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+        if report.is_ok() and (checkpoints[0].window is not None):
+            # Raw deflate segments skip the CRC check of zlib; check the
+            # CRC of the whole (single member) stream against its trailer.
+            with open(self.archive_filename(), 'rb') as tgz_file:
+                tgz_file.seek(-TRAILER_SIZE, os.SEEK_END)
+                expected_crc, expected_size = \
+                    struct.unpack('<LL', tgz_file.read(TRAILER_SIZE))
+            if ((crc != expected_crc) or
+                ((report.bytes & 0xffffffff) != expected_size)):
+                report.add_problem(None, 'corrupt', 'CRC-32 of the gzip' +
+                                   ' stream does not match its trailer.')
+
     def extract(self):
+        """Extract my archive into the current working directory.
+
+        If I have more than one job, regular files are written by a
+        pool of jobs threads while this thread decompresses. If my
+        archive was split into volumes, extracts them instead. My
+        observers are told of every member extracted."""
+        self.observe(self._extract)
+
+    def _extract(self):
+        """Extract my archive as extract() does."""
+        if (not os.path.exists(self.archive_filename()) and
+            self.volume_filenames()):
+            self.extract_volumes()
+            return
+        if self.jobs > 1:
+            self.extract_parallel()
+            return
+
         tgz_archive = tarfile.open(self.archive_filename(), 'r:*')
         try:
-            tgz_archive.extractall()
+            tgz_archive.extractall(members=self.reported_members(
+                tgz_archive))
+        finally:
+            tgz_archive.close()
+
+    def reported_members(self, tgz_archive):
+        """Yield the members of tgz_archive, reporting each one once the
+        next one is asked for."""
+        for member in tgz_archive:
+            start = time.perf_counter()
+            yield member
+            self.member_done(member.name, member.size, member.size,
+                             time.perf_counter() - start)
+
+    def extract_volumes(self):
+        """Extract all my volumes, jobs volumes at a time.
+
+        Each volume is extracted by its own worker process. The times
+        of directories are set last, as files of other volumes may
+        have been written into them."""
+        volume_filenames = self.volume_filenames()
+        directories = []
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            for volume_filename, directory_times in zip(
+                    volume_filenames, executor.map(extract_tgz_volume,
+                                                   volume_filenames)):
+                directories.extend(directory_times)
+                size = os.path.getsize(volume_filename)
+                self.member_done(volume_filename, size, size, 0.0)
+        for target, mtime in sorted(directories, reverse=True):
+            os.utime(target, (mtime, mtime))
+
+    def extract_parallel(self):
+        """Extract my archive writing files on a pool of threads.
+
+        The archive is decompressed once, in order. Directories are
+        created as they are met; the attributes of files and
+        directories are set in one pass at the end, deepest directories
+        last, so writing files does not disturb directory times."""
+        tgz_archive = tarfile.open(self.archive_filename(), 'r|*')
+        executor = ThreadPoolExecutor(max_workers=self.jobs)
+        try:
+            pending = deque()
+            extracted = []
+            for member in self.reported_members(tgz_archive):
+                target = tar_member_path(member)
+                if member.isdir():
+                    if not os.path.isdir(target):
+                        os.makedirs(target)
+                elif member.isreg() and (member.size <=
+                                         PARALLEL_MEMBER_LIMIT):
+                    data = tgz_archive.extractfile(member).read()
+                    parent = os.path.dirname(target)
+                    if parent and not os.path.isdir(parent):
+                        os.makedirs(parent)
+                    pending.append(executor.submit(write_file, target,
+                                                   data))
+                    if len(pending) > 4 * self.jobs:
+                        pending.popleft().result()
+                else:
+                    # Links may refer to files still being written.
+                    while pending:
+                        pending.popleft().result()
+                    if os.path.lexists(target) and not os.path.isdir(target):
+                        # Linking over an existing file would make the
+                        # stream seek back to copy the link target.
+                        os.remove(target)
+                    tgz_archive.extract(member, set_attrs=False)
+                extracted.append((member, target))
+            while pending:
+                pending.popleft().result()
+
+            files = [item for item in extracted if not item[0].isdir()]
+            directories = sorted((item for item in extracted if
+                                  item[0].isdir()),
+                                 key=lambda item: item[1], reverse=True)
+            for member, target in files + directories:
+                if not member.issym():
+                    tgz_archive.chown(member, target, False)
+                    tgz_archive.chmod(member, target)
+                    tgz_archive.utime(member, target)
+        finally:
+            executor.shutdown(cancel_futures=True)
+            tgz_archive.close()
+
+    def extract_to_memory(self, budget=MEMORY_BUDGET):
+        """Returns a TgzMemoryTree of my archive instead of writing it
+        into the current working directory."""
+        return TgzMemoryTree(self.archive_filename(), budget)
+
+    def to_zip(self, archive_base=None, policy=None):
+        """Convert my archive into a .zip archive; returns its ZipArchive.
+
+        The .zip archive is named after archive_base (by default, my
+        own archive base). Members are streamed from my archive into
+        the new one without touching the disk otherwise; file times
+        and empty directories are kept. Policy, a CompressionPolicy,
+        chooses how each file is compressed, judging content from its
+        first bytes; by default files are deflated."""
+        zip_archive = ZipArchive(archive_base or self._archive_base,
+                                 jobs=self.jobs)
+        self.observe(self._to_zip, zip_archive.archive_filename(), policy)
+        return zip_archive
+
+    def _to_zip(self, zip_filename, policy):
+        """Stream the members of my archive into the file zip_filename."""
+        tgz_archive = tarfile.open(self.archive_filename(), 'r|*')
+        zip_file = zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED)
+        try:
+            # Whether a directory is empty is only known once the
+            # next member, possibly beneath it, is read.
+            pending_dir = None
+            for member in tgz_archive:
+                if (pending_dir and not member.name.startswith(
+                        pending_dir.name.rstrip('/') + '/')):
+                    self._zip_tar_member(zip_file, tgz_archive, pending_dir,
+                                         policy)
+                pending_dir = None
+                if member.isdir():
+                    pending_dir = member
+                elif member.isreg() or member.issym() or member.islnk():
+                    self._zip_tar_member(zip_file, tgz_archive, member,
+                                         policy)
+                else:
+                    raise ValueError('Cannot convert special member {0}.'.
+                                     format(member.name))
+            if pending_dir:
+                self._zip_tar_member(zip_file, tgz_archive, pending_dir,
+                                     policy)
+            zip_file.close()
+        except:
+            zip_file.close()
+            os.remove(zip_filename)
+            raise
         finally:
             tgz_archive.close()
+        self.stats.archive_size = os.path.getsize(zip_filename)
+
+    def _zip_tar_member(self, zip_file, tgz_archive, member, policy):
+        """Write the tar member of the streaming tgz_archive into
+        zip_file.
+
+        Directories are written as ZipDirArchive writes empty
+        directories; symbolic links as Info-ZIP does, their target
+        being their content. A hard link is written as a copy of its
+        target, an earlier member; ValueError is raised if there is
+        none."""
+        start = time.perf_counter()
+        zip_info = zipfile.ZipInfo(member.name.rstrip('/'),
+                                   zip_date_time(member.mtime))
+        if member.isdir():
+            zip_info.filename += '/'
+            zip_info.external_attr = 48
+            zip_file.writestr(zip_info, b'')
+        elif member.issym():
+            zip_info.external_attr = (stat.S_IFLNK | 0o777) << 16
+            zip_file.writestr(zip_info, member.linkname.encode('utf-8'),
+                              compress_type=zipfile.ZIP_STORED)
+        else:
+            zip_info.external_attr = (stat.S_IFREG | member.mode) << 16
+            if member.islnk():
+                source = self._link_target(zip_file, member)
+                size = zip_file.getinfo(member.linkname).file_size
+            else:
+                source = tgz_archive.extractfile(member)
+                size = member.size
+            chunk = source.read(CHUNK_SIZE)
+            compress_type, compresslevel = zipfile.ZIP_DEFLATED, None
+            if policy is not None:
+                compress_type, compresslevel = policy.compression(
+                    member.name, chunk)
+            zip_info.compress_type = compress_type
+            if compresslevel is not None:
+                # As ZipFile.writestr does.
+                set_compresslevel(zip_info, compresslevel)
+            zip_info.file_size = size
+            with zip_file.open(zip_info, 'w', force_zip64=(
+                    size > zipfile.ZIP64_LIMIT)) as target:
+                while chunk:
+                    target.write(chunk)
+                    chunk = source.read(CHUNK_SIZE)
+            source.close()
+        self.member_done(zip_info.filename, zip_info.file_size,
+                         zip_info.compress_size, time.perf_counter() - start)
+
+    def _link_target(self, zip_file, member):
+        """Returns a file object reading the content of the target of
+        the hard link member from zip_file.
+
+        Zip_file cannot be read while a member is being written, so the
+        content is copied into a temporary file first."""
+        try:
+            source = zip_file.open(member.linkname)
+        except KeyError:
+            raise ValueError('Hard link {0} to missing member {1}.'.
+                             format(member.name, member.linkname))
+        with source:
+            copy = tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE)
+            shutil.copyfileobj(source, copy, CHUNK_SIZE)
+        copy.seek(0)
+        return copy
 
 
 class TgzDirArchive(TgzArchive):
     """Manages an .tgz (.tar.gz) archive of a directory."""
 
-    def __init__(self, dir_name, archive_base=None):
-        """TgzDirArchive(dir_name, archive_base=None) -> o
+    def __init__(self, dir_name, archive_base=None, jobs=1,
+                 block_size=BLOCK_SIZE, index=False, read_order=None,
+                 readahead=READAHEAD_SIZE, resumable=False,
+                 commit_interval=COMMIT_INTERVAL, volume_size=None,
+                 volumes=None):
+        """TgzDirArchive(dir_name, archive_base=None, jobs=1, ...) -> o
 
         Constructs an instance. If archive_base is None, the archive
-        base is dir_name.
+        base is dir_name. If jobs is greater than 1, the tar stream is
+        cut into blocks of block_size bytes which are gzipped by jobs
+        worker threads. If index is True, archiving also writes a
+        random-access index (which implies the block engine). If
+        read_order is 'inode', files are read ahead, readahead bytes
+        at a time, in inode order (see ReadAhead). If resumable is
+        True, the members added are committed to a journal every
+        commit_interval seconds so an interrupted run can resume (see
+        archive_resumable); this cannot be combined with index. If
+        volume_size or volumes is supplied, the archive is split into
+        volumes (see archive_volumes).
         """
-        super(TgzDirArchive, self).__init__(archive_base, dir_name=dir_name)
+        super(TgzDirArchive, self).__init__(archive_base, dir_name=dir_name,
+                                            jobs=jobs)
+        if index and resumable:
+            raise ValueError('Cannot index a resumable archive; use' +
+                             ' build_index() once it is complete.')
+        if (volume_size or volumes) and (index or resumable):
+            raise ValueError('Cannot index or resume a split archive.')
+        if volume_size and volumes:
+            raise ValueError('Supply a volume size or a volume count,' +
+                             ' not both.')
+        self.volume_size = volume_size
+        self.volumes = volumes
+        self.block_size = block_size
+        self.index = index
+        self.read_order = check_read_order(read_order)
+        self.readahead = readahead
+        self.resumable = resumable
+        self.commit_interval = commit_interval
+
+    def archive(self, fileobj=None):
+        """Archives my dir_name into my archive filename.
+
+        If fileobj is supplied, writes the archive into fileobj instead
+        in a single streaming pass, without a temporary file. Fileobj
+        only needs a write() method so it may be a pipe or a socket.
+        My observers follow the run."""
+        self.observe(self._archive, fileobj)
+
+    def _archive(self, fileobj):
+        """Archive into fileobj or, if it is None, my archive filename."""
+        if fileobj is not None:
+            if self.index or self.resumable or self.is_split():
+                raise ValueError('Cannot index, resume or split an' +
+                                 ' archive written into a file object.')
+            self.archive_to(fileobj)
+            return
+        if self.is_split():
+            self.archive_volumes()
+            return
+        if self.resumable:
+            self.archive_resumable()
+            return
 
-    def archive(self):
-        """Archives my dir_name into my archive filename."""
         tgz_tar_gz_filename = self.tar_gz_filename()
-        tgz_archive = tarfile.open(tgz_tar_gz_filename, 'w:gz')
         try:
-            tgz_archive.add(self.dir_name)
-        finally:
-            tgz_archive.close()
-            
+            with open(tgz_tar_gz_filename, 'wb') as tar_gz_file:
+                index = self.archive_to(tar_gz_file)
+        except:
+            os.remove(tgz_tar_gz_filename)
+            raise
+
         if os.path.exists(self.archive_filename()):
             os.remove(self.archive_filename())
         os.rename(tgz_tar_gz_filename, self.archive_filename())
+        if index:
+            index.save(self.index_filename())
+            self._index = index
+
+    def is_split(self):
+        """Determines if I split my archive into volumes."""
+        return bool(self.volume_size or self.volumes)
+
+    def archive_volumes(self):
+        """Archive my dir_name into volumes written concurrently.
+
+        The members, in the order TarFile.add adds them, are cut into
+        runs (see split_volumes) each written into its own .tgz volume
+        by one of jobs threads. Every volume is a complete .tgz file
+        of at most volume_size bytes, if supplied.
+        """
+        pathnames = list(tar_walk(self.dir_name))
+        estimator = tarfile.TarFile(fileobj=io.BytesIO(), mode='w')
+        costs = [tar_member_cost(estimator, pathname) for
+                 pathname in pathnames]
+        ranges = split_volumes(costs, self.volume_size, self.volumes,
+                               GZIP_WRAPPER_SIZE +
+                               deflate_bound(TAR_TRAILER_SIZE), pathnames)
+        self.remove_volumes()
+        try:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                futures = [executor.submit(self.tar_volume, number,
+                                           pathnames[start:end])
+                           for number, (start, end) in
+                           enumerate(ranges, 1)]
+                for future in futures:
+                    future.result()
+        except:
+            # A failed or cancelled run leaves no volumes behind.
+            self.remove_volumes()
+            raise
+        self.stats.archive_size = sum(os.path.getsize(filename) for
+                                      filename in self.volume_filenames())
+
+    def tar_volume(self, number, pathnames):
+        """Write the members pathnames into my volume number."""
+        with open(self.volume_filename(number), 'wb') as volume_file:
+            output = CountingWriter(volume_file)
+            tgz_archive = ObservedTarFile.open(fileobj=output, mode='w|gz')
+            tgz_archive.observe(self.member_done, output)
+            try:
+                self.tar_members(tgz_archive, pathnames)
+            finally:
+                tgz_archive.close()
+
+    def journal_filename(self):
+        """Returns the filename of the journal of my partial archive."""
+        return self.archive_filename() + ArchiveJournal.EXT
+
+    def archive_resumable(self):
+        """Archive my dir_name so that an interrupted run can resume.
+
+        The archive is written into my .tar.gz file as a series of gzip
+        members. Every commit_interval seconds the current gzip member
+        is ended, the file is synced and the members added so far are
+        appended to my journal. If my journal and .tar.gz file are
+        found, the .tar.gz file is cut back to the last checkpoint and
+        the members it holds are skipped. Members already committed are
+        kept as they were archived."""
+        journal = ArchiveJournal(self.journal_filename())
+        partial_filename = self.tar_gz_filename()
+        records = []
+        if os.path.isfile(partial_filename):
+            records = journal.records('tgz')
+        if records:
+            tar_gz_file = open(partial_filename, 'r+b')
+            tar_gz_file.truncate(records[-1]['compressed_offset'])
+            tar_gz_file.seek(records[-1]['compressed_offset'])
+            tar_offset = records[-1]['tar_offset']
+        else:
+            journal.start('tgz')
+            tar_gz_file = open(partial_filename, 'w+b')
+            tar_offset = 0
+        try:
+            output = CountingWriter(tar_gz_file)
+            if self.jobs > 1:
+                open_member = partial(ParallelGzipFile, jobs=self.jobs,
+                                      block_size=self.block_size)
+            else:
+                open_member = partial(gzip.GzipFile, mode='wb')
+            gzip_file = GzipMemberWriter(output, open_member, tar_offset)
+            tgz_archive = ObservedTarFile(fileobj=gzip_file, mode='w')
+            tgz_archive.observe(self.member_done, output)
+            checkpointer = TarCheckpointer(
+                tgz_archive, gzip_file, tar_gz_file, journal,
+                self.commit_interval,
+                [name for record in records for name in record['names']])
+            self.tar_tree(tgz_archive, checkpointer)
+            gzip_file.close()
+        finally:
+            tar_gz_file.close()
+
+        os.replace(partial_filename, self.archive_filename())
+        journal.remove()
+        self.stats.archive_size = os.path.getsize(self.archive_filename())
+
+    def archive_to(self, fileobj):
+        """Writes the .tgz archive of my dir_name into fileobj.
+
+        If I have more than one job, the gzip blocks are compressed in
+        parallel. If I index, returns the TgzIndex of the archive."""
+        output = CountingWriter(fileobj)
+        if not (self.index or (self.jobs > 1)):
+            tgz_archive = ObservedTarFile.open(fileobj=output, mode='w|gz')
+            tgz_archive.observe(self.member_done, output)
+            self.tar_tree(tgz_archive)
+            self.stats.archive_size = output.count
+            return None
+
+        gzip_file = ParallelGzipFile(output, jobs=self.jobs,
+                                     block_size=self.block_size,
+                                     checkpoint_spacing=(CHECKPOINT_SPACING if
+                                                         self.index else
+                                                         None))
+        try:
+            tgz_archive = ObservedTarFile(fileobj=gzip_file, mode='w')
+            tgz_archive.observe(self.member_done, output)
+            self.tar_tree(tgz_archive)
+        finally:
+            gzip_file.close()
+        self.stats.archive_size = output.count
+        if not self.index:
+            return None
+        return TgzIndex([Checkpoint(*checkpoint) for
+                         checkpoint in gzip_file.checkpoints],
+                        tgz_archive.member_offsets)
+
+    def tar_tree(self, tgz_archive, checkpointer=None):
+        """Adds my dir_name to tgz_archive and closes tgz_archive.
+
+        If supplied, checkpointer is the TarCheckpointer of a
+        resumable run."""
+        try:
+            if self.read_order or checkpointer:
+                self.tar_members(tgz_archive, list(tar_walk(self.dir_name)),
+                                 checkpointer)
+            else:
+                tgz_archive.add(self.dir_name)
+        finally:
+            tgz_archive.close()
+
+    def tar_members(self, tgz_archive, pathnames, checkpointer=None):
+        """Add the paths pathnames to tgz_archive member by member.
+
+        Directories are added without their content. If I have a
+        read_order, the content of files is read ahead in that order.
+        If supplied, checkpointer is told of every member added and
+        the members it has committed are skipped."""
+        if checkpointer:
+            pathnames = [pathname for pathname in pathnames if
+                         tar_arcname(pathname) not in checkpointer.committed]
+        reader = None
+        if self.read_order:
+            reader = ReadAhead([pathname for pathname in pathnames if
+                                os.path.isfile(pathname) and
+                                not os.path.islink(pathname)],
+                               self.readahead)
+        try:
+            for pathname in pathnames:
+                tarinfo = tgz_archive.gettarinfo(pathname)
+                if tarinfo is None:
+                    # TarFile.add skips sockets and the like too.
+                    continue
+                if not tarinfo.isreg():
+                    tgz_archive.addfile(tarinfo)
+                else:
+                    data = reader.take(pathname) if reader else None
+                    if (data is not None) and (len(data) == tarinfo.size):
+                        tgz_archive.addfile(tarinfo, io.BytesIO(data))
+                    else:
+                        with open(pathname, 'rb') as source:
+                            tgz_archive.addfile(tarinfo, source)
+                if checkpointer:
+                    checkpointer.member_done(tarinfo.name)
+        finally:
+            if reader:
+                reader.close()
 
     def tar_gz_filename(self):
         """Returns my .tar.gz filename."""
@@ -106,14 +880,15 @@ class ZipArchive(Archive):
 
     EXT = '.zip'
     
-    def __init__(self, archive_base, dir_name=None):
-        """ZipArchive(archive_base, dir_name=None) -> o
+    def __init__(self, archive_base, dir_name=None, jobs=1):
+        """ZipArchive(archive_base, dir_name=None, jobs=1) -> o
 
         Constructs an instance from archive_base. ArchiveBase is the
         archive filename without the extension. Note that dir_name is
         only used by child classes.
         """
-        super(ZipArchive, self).__init__(dir_name, archive_base)
+        super(ZipArchive, self).__init__(dir_name, archive_base, jobs)
+        self._listing = None
 
     def archive_ext(self):
         """Returns the format-specific extension.
@@ -121,22 +896,367 @@ class ZipArchive(Archive):
         The returned value includes the leading dot ('.')
         """
         return ZipArchive.EXT
+
+    def listing(self):
+        """Returns the ZipCentralDirectory of my archive.
+
+        The listing memory-maps the archive and parses its members
+        lazily so it stays cheap for archives with millions of members.
+        It is opened once; call close() to release it."""
+        if self._listing is None:
+            self._listing = ZipCentralDirectory(self.archive_filename())
+        return self._listing
+
+    def close(self):
+        """Release my listing, if open."""
+        if self._listing is not None:
+            self._listing.close()
+            self._listing = None
+
+    def ls(self):
+        """Yield the names of my members in archive order."""
+        return iter(self.listing())
+
+    def exists(self, name):
+        """Determines if my archive has a member named name."""
+        return self.listing().exists(name)
+
+    def read_member(self, name):
+        """Returns the content of my member name.
+
+        Raises KeyError if I have no such member."""
+        return self.listing().read(name)
+
+    def verify(self):
+        """Check every member of my archive without writing any file.
+
+        Each member is decompressed in memory and checked against its
+        CRC-32 and size. If I have more than one job, members are
+        checked by a pool of jobs worker processes. Returns a
+        VerifyReport."""
+        report = VerifyReport(self.archive_filename())
+        try:
+            with ZipCentralDirectory(self.archive_filename()) as listing:
+                infolist = list(listing.entries())
+        except (zipfile.BadZipFile, OSError) as error:
+            report.add_problem(None, 'unreadable', str(error))
+            return report
+
+        if self.jobs > 1:
+            executor = ProcessPoolExecutor(max_workers=self.jobs)
+        else:
+            executor = InlineExecutor()
+        batch_size = max(1, min(256, len(infolist) // (4 * self.jobs)))
+        try:
+            futures = [executor.submit(verify_zip_members,
+                                       self.archive_filename(),
+                                       infolist[start:start + batch_size])
+                       for start in range(0, len(infolist), batch_size)]
+            for future in futures:
+                size, problems = future.result()
+                report.bytes += size
+                for problem in problems:
+                    report.add_problem(*problem)
+        finally:
+            executor.shutdown(cancel_futures=True)
+        report.members = len(infolist)
+        return report
     
-    def extract(self):
-        """Extract my archive into the current working directory."""
+    def extract(self, sync=False, delete=False, checksum=False):
+        """Extract my archive into the current working directory.
+
+        If I have more than one job, members are extracted by a pool
+        of jobs worker processes. If sync is True, only writes the
+        members missing or different on disk (see extract_sync) and
+        returns a SyncResult. If my archive was split into volumes,
+        extracts them instead. My observers are told of every member
+        extracted."""
+        return self.observe(self._extract, sync, delete, checksum)
+
+    def _extract(self, sync, delete, checksum):
+        """Extract my archive as extract() does."""
+        if sync:
+            return self.extract_sync(delete, checksum)
+        if (not os.path.exists(self.archive_filename()) and
+            self.volume_filenames()):
+            self.extract_volumes()
+            return
+        if self.jobs > 1:
+            self.extract_parallel()
+            return
+
         zip_file = zipfile.ZipFile(self.archive_filename(), 'r')
         try:
             infolist = zip_file.infolist()
             for member in infolist:
+                start = time.perf_counter()
                 if not self.is_zipped_dir(member):
                     zip_file.extract(member)
                 else:
                     dir_name = member.filename
-                    os.mkdir(dir_name)
+                    if not os.path.isdir(dir_name):
+                        os.makedirs(dir_name)
                 self.touch(member)
+                self.member_done(member.filename, member.compress_size,
+                                 member.file_size,
+                                 time.perf_counter() - start)
+        finally:
+            zip_file.close()
+
+    def report_batch(self, infos, names, seconds):
+        """Report the members names, of the ZipInfo dictionary infos,
+        extracted as one batch in seconds."""
+        for name in names:
+            info = infos[name]
+            self.member_done(name, info.compress_size, info.file_size,
+                             seconds / len(names))
+
+    def extract_parallel(self):
+        """Extract my archive using a pool of worker processes.
+
+        All directories are created first in one pass. The workers
+        then extract batches of files, each opening the archive
+        itself. Finally, all time stamps are set in one pass."""
+        zip_file = zipfile.ZipFile(self.archive_filename(), 'r')
+        try:
+            infolist = zip_file.infolist()
         finally:
             zip_file.close()
 
+        directories = set()
+        filenames = []
+        for member in infolist:
+            if self.is_zipped_dir(member) or member.is_dir():
+                directories.add(zip_member_path(member.filename))
+            else:
+                directories.add(os.path.dirname(
+                    zip_member_path(member.filename)))
+                filenames.append(member.filename)
+        for dir_name in sorted(directories):
+            if dir_name and not os.path.isdir(dir_name):
+                os.makedirs(dir_name)
+
+        infos = dict((member.filename, member) for member in infolist)
+        batch_size = max(1, min(256, len(filenames) // (4 * self.jobs)))
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            start = time.perf_counter()
+            batches = [filenames[first:first + batch_size] for
+                       first in range(0, len(filenames), batch_size)]
+            futures = [executor.submit(extract_zip_members,
+                                       self.archive_filename(), batch)
+                       for batch in batches]
+            for future, batch in zip(futures, batches):
+                future.result()
+                self.report_batch(infos, batch, time.perf_counter() - start)
+                start = time.perf_counter()
+
+        self.touch_all(infolist)
+
+    def extract_to_memory(self, budget=MEMORY_BUDGET):
+        """Returns a ZipMemoryTree of my archive instead of writing it
+        into the current working directory."""
+        return ZipMemoryTree(self.archive_filename(), budget)
+
+    def to_tgz(self, archive_base=None):
+        """Convert my archive into a .tgz archive; returns its TgzArchive.
+
+        The .tgz archive is named after archive_base (by default, my
+        own archive base). Members are streamed from my archive into
+        the new one without touching the disk otherwise; file times
+        and empty directories are kept. Deflated members are not
+        compressed again: their deflate data is copied as a gzip member
+        of its own (see add_deflated_member). If I have more than one
+        job, the rest is gzipped in parallel blocks."""
+        tgz_archive = TgzArchive(archive_base or self._archive_base,
+                                 jobs=self.jobs)
+        self.observe(self._to_tgz, tgz_archive.archive_filename())
+        return tgz_archive
+
+    def _to_tgz(self, tgz_filename):
+        """Stream the members of my archive into the file tgz_filename."""
+        if self.jobs > 1:
+            open_member = partial(ParallelGzipFile, jobs=self.jobs)
+        else:
+            open_member = partial(gzip.GzipFile, mode='wb')
+        directory = ZipCentralDirectory(self.archive_filename())
+        try:
+            with open(tgz_filename, 'wb') as tgz_file:
+                try:
+                    output = CountingWriter(tgz_file)
+                    gzip_file = GzipMemberWriter(output, open_member)
+                    for zip_info in directory.entries():
+                        written = output.count
+                        start = time.perf_counter()
+                        self._tar_zip_member(gzip_file, directory, zip_info)
+                        self.member_done(zip_info.filename,
+                                         zip_info.file_size,
+                                         output.count - written,
+                                         time.perf_counter() - start)
+                    end_tar_stream(gzip_file)
+                    gzip_file.close()
+                except:
+                    tgz_file.close()
+                    os.remove(tgz_filename)
+                    raise
+        finally:
+            directory.close()
+        self.stats.archive_size = os.path.getsize(tgz_filename)
+
+    def _tar_zip_member(self, gzip_file, directory, zip_info):
+        """Write the member zip_info of directory, a ZipCentralDirectory,
+        as a tar member into gzip_file, a GzipMemberWriter."""
+        if zip_info.flag_bits & 0x01:
+            raise ValueError('Cannot convert encrypted member {0}.'.
+                             format(zip_info.filename))
+        tar_info = tarfile.TarInfo(zip_info.filename.rstrip('/'))
+        tar_info.mtime = self.zip_to_stat_time(zip_info.date_time)
+        mode = zip_info.external_attr >> 16
+        if zip_info.filename.endswith('/'):
+            tar_info.type = tarfile.DIRTYPE
+            tar_info.mode = stat.S_IMODE(mode) or 0o755
+            add_tar_member(gzip_file, tar_info)
+        elif stat.S_ISLNK(mode):
+            tar_info.type = tarfile.SYMTYPE
+            tar_info.linkname = directory.read(
+                zip_info.filename).decode('utf-8')
+            add_tar_member(gzip_file, tar_info)
+        else:
+            tar_info.mode = stat.S_IMODE(mode) or 0o644
+            tar_info.size = zip_info.file_size
+            if zip_info.compress_type == zipfile.ZIP_DEFLATED:
+                with directory.raw_data(zip_info) as raw:
+                    add_deflated_member(gzip_file, tar_info, raw,
+                                        zip_info.CRC)
+            else:
+                add_tar_member(gzip_file, tar_info,
+                               directory.read_chunks(zip_info))
+
+    def extract_volumes(self):
+        """Extract all my volumes, jobs volumes at a time.
+
+        Each volume is extracted by its own worker process once all
+        the directories of all the volumes are made."""
+        volume_filenames = self.volume_filenames()
+        for volume_filename in volume_filenames:
+            with ZipCentralDirectory(volume_filename) as directory:
+                for name in directory:
+                    target = os.path.dirname(zip_member_path(name))
+                    if target:
+                        os.makedirs(target, exist_ok=True)
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            for volume_filename, _ in zip(
+                    volume_filenames, executor.map(extract_zip_volume,
+                                                   volume_filenames)):
+                size = os.path.getsize(volume_filename)
+                self.member_done(volume_filename, size, size, 0.0)
+
+    def extract_sync(self, delete=False, checksum=False):
+        """Bring the extracted tree up to date with my archive.
+
+        A file whose size and time match its member is left alone; if
+        only its time differs, it is left alone if its CRC-32 matches
+        (and checksum is True, CRCs are compared even when the times
+        match). Other members are written, by a pool of jobs worker
+        processes if I have more than one job. If delete is True,
+        files and directories not in my archive are removed from the
+        top-level directories of my archive. Returns a SyncResult."""
+        zip_file = zipfile.ZipFile(self.archive_filename(), 'r')
+        try:
+            infolist = zip_file.infolist()
+        finally:
+            zip_file.close()
+
+        files = []
+        directories = set()
+        dir_members = []
+        for member in infolist:
+            target = zip_member_path(member.filename)
+            if self.is_zipped_dir(member) or member.is_dir():
+                directories.add(target)
+                dir_members.append(member)
+            else:
+                directories.add(os.path.dirname(target))
+                files.append((member.filename, target, member.file_size,
+                              member.CRC,
+                              self.zip_to_stat_time(member.date_time)))
+        for dir_name in list(directories):
+            while dir_name:
+                directories.add(dir_name)
+                dir_name = os.path.dirname(dir_name)
+        directories.discard('')
+        for dir_name in sorted(directories):
+            if os.path.lexists(dir_name) and not os.path.isdir(dir_name):
+                os.remove(dir_name)
+            if not os.path.isdir(dir_name):
+                os.makedirs(dir_name)
+
+        if self.jobs > 1:
+            executor = ProcessPoolExecutor(max_workers=self.jobs)
+        else:
+            executor = InlineExecutor()
+        batch_size = max(1, min(256, len(files) // (4 * self.jobs)))
+        try:
+            futures = [executor.submit(compare_zip_members,
+                                       files[start:start + batch_size],
+                                       checksum)
+                       for start in range(0, len(files), batch_size)]
+            states = [state for future in futures for
+                      state in future.result()]
+
+            written = []
+            unchanged = []
+            for (filename, target, _, _, stat_time), state in zip(files,
+                                                                  states):
+                if state == 'same':
+                    unchanged.append(target)
+                elif state == 'touch':
+                    os.utime(target, (stat_time, stat_time))
+                    unchanged.append(target)
+                else:
+                    if os.path.islink(target) or os.path.isdir(target):
+                        remove_path(target)
+                    written.append(filename)
+            infos = dict((member.filename, member) for member in infolist)
+            start = time.perf_counter()
+            batches = [written[first:first + batch_size] for
+                       first in range(0, len(written), batch_size)]
+            futures = [executor.submit(extract_zip_members,
+                                       self.archive_filename(), batch)
+                       for batch in batches]
+            for future, batch in zip(futures, batches):
+                future.result()
+                self.report_batch(infos, batch, time.perf_counter() - start)
+                start = time.perf_counter()
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+        written_names = set(written)
+        self.touch_all([member for member in infolist if
+                        member.filename in written_names] + dir_members)
+
+        deleted = []
+        if delete:
+            expected = set(target for _, target, _, _, _ in files)
+            roots = set(path.split(os.sep)[0] for path in directories)
+            for root in sorted(roots):
+                deleted.extend(remove_extra_paths(root, expected,
+                                                  directories))
+        return SyncResult([zip_member_path(name) for name in written],
+                          unchanged, deleted)
+
+    def touch_all(self, infolist):
+        """Set the date and time of all the extracted (already) members.
+
+        Files are touched before the directories containing them."""
+        stat_times = {}
+        for member in sorted(infolist, key=self.is_zipped_dir):
+            if member.date_time not in stat_times:
+                stat_times[member.date_time] = \
+                    self.zip_to_stat_time(member.date_time)
+            stat_time = stat_times[member.date_time]
+            os.utime(zip_member_path(member.filename),
+                     (stat_time, stat_time))
+
     def is_zipped_dir(self, member):
         """Determines if the member is a zipped (empty) directory."""
         result = False
@@ -154,11 +1274,9 @@ class ZipArchive(Archive):
 
     def zip_to_stat_time(self, zip_time):
         """Convert zip_time to a file 'stat' time."""
-        # Convert zip_time (6-tuple) to datetime.
-        date_time = datetime(*zip_time)
-
-        # Convert datetime to tuple like time.localtime()
-        time_tuple = date_time.timetuple()
+        # Convert zip_time (6-tuple) to a tuple like time.localtime()
+        # with an unknown day of the week, day of the year and DST.
+        time_tuple = tuple(zip_time) + (0, 0, -1)
 
         # Convert tuple to time integer.
         time_seconds = time.mktime(time_tuple)
@@ -170,23 +1288,266 @@ class ZipArchive(Archive):
 class ZipDirArchive(ZipArchive):
     """Manages an .zip (.tar.gz) archive of a directory."""
 
-    def __init__(self, dir_name, archive_base=None):
-        """ZipDirArchive(dir_name, archive_base=None) -> o
+    MANIFEST_EXT = '.manifest'
+
+    def __init__(self, dir_name, archive_base=None, jobs=1,
+                 incremental=False, policy=None, read_order=None,
+                 readahead=READAHEAD_SIZE, resumable=False,
+                 commit_interval=COMMIT_INTERVAL, volume_size=None,
+                 volumes=None):
+        """ZipDirArchive(dir_name, archive_base=None, jobs=1, ...) -> o
 
         Constructs an instance. If archive_base is None, the archive
-        base is dir_name.
+        base is dir_name. If jobs is greater than 1, members are
+        compressed in parallel by a pool of jobs worker processes. If
+        incremental is True, archiving keeps a manifest next to the
+        archive and reuses the compressed data of unchanged files. If
+        policy, a CompressionPolicy, is supplied, it chooses the codec
+        and level of each member; otherwise all members are deflated.
+        If read_order is 'inode', members are written sorted by path
+        and files are read ahead, readahead bytes at a time, in inode
+        order (see ReadAhead). If resumable is True, the members
+        written are committed to a journal every commit_interval
+        seconds so an interrupted run can resume (see
+        archive_resumable); this cannot be combined with incremental.
+        If volume_size or volumes is supplied, the archive is split
+        into volumes (see archive_volumes).
         """
-        super(ZipDirArchive, self).__init__(archive_base, dir_name=dir_name)
+        super(ZipDirArchive, self).__init__(archive_base, dir_name=dir_name,
+                                            jobs=jobs)
+        if incremental and resumable:
+            raise ValueError('Cannot archive both incrementally and' +
+                             ' resumably.')
+        if (volume_size or volumes) and (incremental or resumable):
+            raise ValueError('Cannot archive a split archive' +
+                             ' incrementally or resumably.')
+        if volume_size and volumes:
+            raise ValueError('Supply a volume size or a volume count,' +
+                             ' not both.')
+        self.volume_size = volume_size
+        self.volumes = volumes
+        self.incremental = incremental
+        self.resumable = resumable
+        self.commit_interval = commit_interval
+        self.policy = policy
+        self.read_order = check_read_order(read_order)
+        self.readahead = readahead
+        self._manifest = None
+
+    def archive(self, fileobj=None):
+        """Archive the directory using the zip format.
+
+        If fileobj is supplied, writes the archive into fileobj instead
+        of my archive filename. Fileobj needs write() and flush()
+        methods; if it cannot seek, as with a pipe or a socket, the
+        archive is still written in a single streaming pass. My
+        observers follow the run."""
+        self.observe(self._archive, fileobj)
+
+    def _archive(self, fileobj):
+        """Archive into fileobj or, if it is None, my archive filename."""
+        if self.incremental or self.resumable or self.is_split():
+            if fileobj is not None:
+                raise ValueError('Cannot archive incrementally, resumably' +
+                                 ' or in volumes into a file object.')
+            if self.is_split():
+                self.archive_volumes()
+                return
+            if self.incremental:
+                self.archive_incremental()
+            else:
+                self.archive_resumable()
+        elif fileobj is not None:
+            self.zip_into(fileobj)
+        else:
+            # Zip into a new file so that a failed or cancelled run
+            # leaves no complete-looking archive behind.
+            new_filename = self.archive_filename() + '.new'
+            try:
+                self.zip_into(new_filename)
+                os.replace(new_filename, self.archive_filename())
+            except:
+                if os.path.exists(new_filename):
+                    os.remove(new_filename)
+                raise
+        if fileobj is None and not self.is_split():
+            self.stats.archive_size = os.path.getsize(
+                self.archive_filename())
+
+    def zip_into(self, file):
+        """Zip the directory into file, a filename or a file object."""
+        zip_file = zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED)
+        try:
+            if (self.jobs > 1) or self.read_order:
+                self.zip_members(zip_file, self.dir_name)
+            else:
+                self.zip_tree(zip_file, self.dir_name)
+        finally:
+            zip_file.close()
+
+    def archive_incremental(self):
+        """Archive the directory, only compressing new or changed files.
+
+        A file is unchanged if its size and modification time match my
+        manifest; its compressed data is copied from my previous
+        archive. Files deleted since the previous archive are dropped.
+        The new archive replaces the previous one when complete."""
+        archive_filename = self.archive_filename()
+        manifest = self.read_manifest()
+        previous = None
+        if manifest and os.path.isfile(archive_filename):
+            previous = zipfile.ZipFile(archive_filename, 'r')
+
+        new_filename = archive_filename + '.new'
+        self._manifest = {}
+        try:
+            zip_file = zipfile.ZipFile(new_filename, 'w', zipfile.ZIP_DEFLATED)
+            try:
+                self.zip_members(zip_file, self.dir_name, previous,
+                                 manifest if previous else {})
+            finally:
+                zip_file.close()
+                if previous:
+                    previous.close()
+            os.replace(new_filename, archive_filename)
+            self.write_manifest(self._manifest)
+        except:
+            if os.path.exists(new_filename):
+                os.remove(new_filename)
+            raise
+        finally:
+            self._manifest = None
+
+    def is_split(self):
+        """Determines if I split my archive into volumes."""
+        return bool(self.volume_size or self.volumes)
+
+    def archive_volumes(self):
+        """Archive the directory into volumes written concurrently.
+
+        The members, in os.walk order, are cut into runs (see
+        split_volumes) each zipped into its own volume by one of jobs
+        threads. Every volume is a complete .zip file of at most
+        volume_size bytes, if supplied."""
+        members = list(self.tree_members(self.dir_name))
+        ranges = split_volumes([self.member_cost(pathname, is_empty_dir)
+                                for pathname, is_empty_dir in members],
+                               self.volume_size, self.volumes,
+                               ZIP_VOLUME_RESERVE,
+                               [pathname for pathname, _ in members])
+        self.remove_volumes()
+        try:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                futures = [executor.submit(self.zip_volume, number,
+                                           members[start:end])
+                           for number, (start, end) in
+                           enumerate(ranges, 1)]
+                for future in futures:
+                    future.result()
+        except:
+            # A failed or cancelled run leaves no volumes behind.
+            self.remove_volumes()
+            raise
+        self.stats.archive_size = sum(os.path.getsize(filename) for
+                                      filename in self.volume_filenames())
+
+    def member_cost(self, pathname, is_empty_dir):
+        """Returns the most bytes the member zipping pathname may take
+        in one of my volumes (see zip_member_cost)."""
+        if is_empty_dir:
+            return zip_member_cost(zip_arcname(pathname, True), 0,
+                                   zipfile.ZIP_STORED)
+        compress_type = zipfile.ZIP_DEFLATED
+        if self.policy is not None:
+            compress_type = self.policy.compression(pathname)[0]
+        return zip_member_cost(zip_arcname(pathname),
+                               os.path.getsize(pathname), compress_type)
 
-    def archive(self):
-        """Archive the directory using the zip format."""
-        zip_file = zipfile.ZipFile(self.archive_filename(), 'w',
+    def zip_volume(self, number, members):
+        """Zip members, (pathname, is_empty_dir) pairs, into my volume
+        number."""
+        zip_file = zipfile.ZipFile(self.volume_filename(number), 'w',
                                    zipfile.ZIP_DEFLATED)
         try:
-            self.zip_tree(zip_file, self.dir_name)
+            self.zip_member_list(zip_file, members)
         finally:
             zip_file.close()
 
+    def archive_resumable(self):
+        """Archive the directory so that an interrupted run can resume.
+
+        The archive is written into a .partial file. Every
+        commit_interval seconds the file is synced and the members
+        written so far are appended to my journal. If my journal and
+        .partial file are found, the .partial file is cut back to the
+        last checkpoint and the members it holds are skipped. Members
+        already committed are kept as they were archived."""
+        journal = ArchiveJournal(self.journal_filename())
+        partial_filename = self.partial_filename()
+        records = []
+        if os.path.isfile(partial_filename):
+            records = journal.records('zip')
+        if records:
+            partial_file = open(partial_filename, 'r+b')
+            partial_file.truncate(records[-1]['end'])
+            partial_file.seek(records[-1]['end'])
+        else:
+            journal.start('zip')
+            partial_file = open(partial_filename, 'w+b')
+        try:
+            zip_file = zipfile.ZipFile(partial_file, 'w',
+                                       zipfile.ZIP_DEFLATED)
+            try:
+                for record in records:
+                    for member in record['members']:
+                        zip_info = zip_info_from_record(member)
+                        zip_file.filelist.append(zip_info)
+                        zip_file.NameToInfo[zip_info.filename] = zip_info
+                checkpointer = ZipCheckpointer(
+                    zip_file, partial_file, journal, self.commit_interval,
+                    zip_file.NameToInfo)
+                self.zip_members(zip_file, self.dir_name,
+                                 checkpointer=checkpointer)
+            finally:
+                zip_file.close()
+        finally:
+            partial_file.close()
+
+        os.replace(partial_filename, self.archive_filename())
+        journal.remove()
+
+    def journal_filename(self):
+        """Returns the filename of the journal of my partial archive."""
+        return self.archive_filename() + ArchiveJournal.EXT
+
+    def partial_filename(self):
+        """Returns the filename of my partial archive."""
+        return self.archive_filename() + '.partial'
+
+    def manifest_filename(self):
+        """Returns the filename of my incremental manifest."""
+        return self.archive_filename() + ZipDirArchive.MANIFEST_EXT
+
+    def read_manifest(self):
+        """Returns my manifest mapping member names to file metadata.
+
+        Each value is a dictionary with the keys 'size', 'mtime_ns',
+        'sha1', 'compress_type' and 'compresslevel'. If I have no
+        manifest, returns an empty dictionary."""
+        try:
+            with open(self.manifest_filename(), 'r') as manifest_file:
+                return json.load(manifest_file)['members']
+        except (IOError, OSError, ValueError, KeyError):
+            return {}
+
+    def write_manifest(self, members):
+        """Replace my manifest by one recording members."""
+        manifest_filename = self.manifest_filename()
+        with open(manifest_filename + '.new', 'w') as manifest_file:
+            json.dump({'version': 1, 'members': members}, manifest_file,
+                      sort_keys=True)
+        os.replace(manifest_filename + '.new', manifest_filename)
+
     def store_empty_dir(self, zip_file, dir_name):
         """Store the empty directory dir_name."""
         dir_modified_time = datetime.fromtimestamp(os.stat(dir_name).st_mtime)
@@ -196,20 +1557,1643 @@ class ZipDirArchive(ZipArchive):
         zip_info = zipfile.ZipInfo(dir_name + os.sep, zip_time)
         zip_info.external_attr = 48
         zip_file.writestr(zip_info, '')
+        self.member_done(zip_info.filename, 0, 0, 0.0)
 
-    def zip_tree(self, zip_file, top):
-        """Zip all files (recursively) beneath root into zip_file."""
-        ## assert os.listdir(top), "Cannot zip empty root directory."
+    def tree_members(self, top):
+        """Yield (pathname, is_empty_dir) for each member beneath top.
+
+        Members are produced in os.walk order. Only empty directories
+        are members; other directories are implied by their files."""
         for root, dirs, files in os.walk(top):
             # if the root directory contains something
             if dirs or files:
-                # zip all the files...
+                # yield all the files...
                 for filename in files:
-                    pathname = os.path.join(root, filename)
-                    zip_file.write(pathname)
+                    yield os.path.join(root, filename), False
             # else the root directory is empty
             else:
+                yield root, True
+
+    def zip_tree(self, zip_file, top):
+        """Zip all files (recursively) beneath root into zip_file."""
+        ## assert os.listdir(top), "Cannot zip empty root directory."
+        self.zip_member_list(zip_file, self.tree_members(top))
+
+    def zip_member_list(self, zip_file, members):
+        """Zip members, (pathname, is_empty_dir) pairs, into zip_file."""
+        for pathname, is_empty_dir in members:
+            if is_empty_dir:
                 # store the empty directory
-                self.store_empty_dir(zip_file, root)
-        
+                self.store_empty_dir(zip_file, pathname)
+            else:
+                compress_type, compresslevel = self.compression(zip_file,
+                                                                pathname)
+                start = time.perf_counter()
+                zip_file.write(pathname, compress_type=compress_type,
+                               compresslevel=compresslevel)
+                zip_info = zip_file.filelist[-1]
+                self.member_done(zip_info.filename, zip_info.file_size,
+                                 zip_info.compress_size,
+                                 time.perf_counter() - start)
+
+    def zip_members(self, zip_file, top, previous=None, manifest=None,
+                    checkpointer=None):
+        """Zip all files beneath top into zip_file member by member.
+
+        If I have more than one job, worker processes read and compress
+        the files; this process alone writes the finished members into
+        zip_file in os.walk order. To bound memory, at most a few
+        members per worker are in flight and very large files are
+        compressed here instead. Files matching manifest are copied,
+        still compressed, from the previous ZipFile. If I have a
+        read_order, members are written sorted by path and the files
+        are read ahead in that order instead. If supplied,
+        checkpointer is told of every member written and the members
+        it has committed are skipped."""
+        members = self.tree_members(top)
+        if checkpointer:
+            members = ((pathname, is_empty_dir) for
+                       pathname, is_empty_dir in members if
+                       zip_arcname(pathname, is_empty_dir) not in
+                       checkpointer.committed)
+        reader = None
+        if self.read_order:
+            members = sorted(members)
+            reader = ReadAhead([pathname for pathname, is_empty_dir in
+                                members if not is_empty_dir and
+                                self._needs_reading(zip_file, pathname,
+                                                    previous, manifest)],
+                               self.readahead)
+        if self.jobs > 1:
+            executor = ProcessPoolExecutor(max_workers=self.jobs)
+        else:
+            executor = InlineExecutor()
+        window = 4 * self.jobs
+        try:
+            pending = deque()
+            for pathname, is_empty_dir in members:
+                pending.append(self._submit_member(executor, zip_file,
+                                                   pathname, is_empty_dir,
+                                                   previous, manifest,
+                                                   reader))
+                if len(pending) > window:
+                    pending.popleft()()
+                    if checkpointer:
+                        checkpointer.member_done()
+            while pending:
+                pending.popleft()()
+                if checkpointer:
+                    checkpointer.member_done()
+        finally:
+            executor.shutdown(cancel_futures=True)
+            if reader:
+                reader.close()
+
+    def _needs_reading(self, zip_file, pathname, previous, manifest):
+        """Determines if the file pathname must be read to be zipped."""
+        if not (manifest and raw_zip_supported(zip_file)):
+            return True
+        arcname = zipfile.ZipInfo.from_file(pathname).filename
+        return self._unchanged_entry(arcname, os.stat(pathname),
+                                     self.compression(zip_file, pathname),
+                                     previous, manifest) is None
+
+    def _unchanged_entry(self, arcname, file_stat, compression, previous,
+                         manifest):
+        """Returns the manifest entry of arcname if the file, with
+        file_stat, can be copied from previous; otherwise None.
+
+        The member must also have been compressed as compression,
+        (compress_type, compresslevel), says now."""
+        entry = manifest.get(arcname) if manifest else None
+        if (entry and
+            (entry['size'] == file_stat.st_size) and
+            (entry['mtime_ns'] == file_stat.st_mtime_ns) and
+            ((entry.get('compress_type'), entry.get('compresslevel')) ==
+             tuple(compression)) and
+            (arcname in previous.NameToInfo)):
+            return entry
+        return None
+
+    def _submit_member(self, executor, zip_file, pathname, is_empty_dir,
+                       previous, manifest, reader=None):
+        """Start producing the member pathname.
+
+        If supplied, reader is the ReadAhead holding the content of
+        pathname. Returns a callable that writes the member into
+        zip_file."""
+        if is_empty_dir:
+            return partial(self.store_empty_dir, zip_file, pathname)
+
+        file_stat = os.stat(pathname)
+        zip_info = zipfile.ZipInfo.from_file(pathname)
+        compress_type, compresslevel = self.compression(zip_file, pathname)
+        zip_info.compress_type = compress_type
+        set_compresslevel(zip_info, compresslevel)
+
+        raw = raw_zip_supported(zip_file)
+        entry = None
+        if raw and previous and raw_zip_supported(previous):
+            entry = self._unchanged_entry(zip_info.filename, file_stat,
+                                          (compress_type, compresslevel),
+                                          previous, manifest)
+        if entry:
+            return partial(self._copy_member, zip_file, previous,
+                           zip_info.filename, entry)
+        data = reader.take(pathname) if reader else None
+        if (zip_info.file_size > PARALLEL_MEMBER_LIMIT) or not raw:
+            # Without the internals of zipfile, ZipFile compresses.
+            return partial(self._write_file, zip_file, pathname, zip_info,
+                           file_stat)
+        if data is not None:
+            future = executor.submit(compress_data, data, compress_type,
+                                     compresslevel)
+        else:
+            future = executor.submit(compress_file, pathname, compress_type,
+                                     compresslevel)
+        return partial(self._write_future, zip_file, zip_info, file_stat,
+                       future)
+
+    def compression(self, zip_file, pathname):
+        """Returns (compress_type, compresslevel) for the file pathname.
+
+        Without a policy, returns the defaults of zip_file."""
+        if self.policy is None:
+            return zip_file.compression, zip_file.compresslevel
+        return self.policy.compression(pathname)
+
+    def _copy_member(self, zip_file, previous, arcname, entry):
+        """Copy the compressed member arcname from previous to zip_file."""
+        zip_info = previous.getinfo(arcname)
+        start = time.perf_counter()
+        write_compressed(zip_file, copy_zip_info(zip_info),
+                         read_compressed(previous, zip_info))
+        self._record(arcname, entry)
+        # Nothing was read from the file nor compressed.
+        self.member_done(arcname, 0, zip_info.compress_size,
+                         time.perf_counter() - start)
+
+    def _write_file(self, zip_file, pathname, zip_info, file_stat):
+        """Compress pathname into zip_file as zip_info in this process."""
+        digest = hashlib.sha1()
+        start = time.perf_counter()
+        with open(pathname, 'rb') as source:
+            with zip_file.open(zip_info, 'w') as member:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    member.write(chunk)
+        self._record(zip_info.filename,
+                     manifest_entry(file_stat, digest.hexdigest(),
+                                    zip_info))
+        self.member_done(zip_info.filename, zip_info.file_size,
+                         zip_info.compress_size, time.perf_counter() - start)
+
+    def _write_future(self, zip_file, zip_info, file_stat, future):
+        """Write the result of a compress_file future as zip_info."""
+        file_size, crc, sha1, seconds, data = future.result()
+        zip_info.file_size = file_size
+        zip_info.CRC = crc
+        zip_info.compress_size = len(data)
+        write_compressed(zip_file, zip_info, [data])
+        self._record(zip_info.filename, manifest_entry(file_stat, sha1,
+                                                       zip_info))
+        self.member_done(zip_info.filename, file_size, len(data), seconds)
+
+    def _record(self, arcname, entry):
+        """Record the manifest entry for arcname if I am incremental."""
+        if self._manifest is not None:
+            self._manifest[arcname] = entry
+
+
+class CompressionPolicy(object):
+    """Chooses the codec and level used to compress each zip member.
+
+    Rules added with add_rule are checked first, in order, against the
+    member pathname. Otherwise, files whose extension marks them as
+    already compressed are stored, as are files whose first block
+    hardly shrinks when deflated quickly. Everything else uses the
+    default codec and level."""
+
+    CODECS = {'store': zipfile.ZIP_STORED,
+              'deflate': zipfile.ZIP_DEFLATED,
+              'bzip2': zipfile.ZIP_BZIP2,
+              'lzma': zipfile.ZIP_LZMA}
+
+    # Extensions of formats that are compressed already.
+    COMPRESSED_EXTS = frozenset(['.7z', '.apk', '.avi', '.bz2', '.docx',
+                                 '.ear', '.flac', '.gif', '.gz', '.jar',
+                                 '.jpeg', '.jpg', '.lz4', '.lzma', '.mkv',
+                                 '.mov', '.mp3', '.mp4', '.nupkg', '.odt',
+                                 '.ogg', '.png', '.pptx', '.rar', '.tbz2',
+                                 '.tgz', '.txz', '.war', '.webm', '.webp',
+                                 '.whl', '.xlsx', '.xz', '.zip', '.zst'])
+
+    # The number of leading bytes deflated to estimate the entropy.
+    SAMPLE_SIZE = 16 << 10
+
+    def __init__(self, codec='deflate', level=None,
+                 compressed_exts=COMPRESSED_EXTS, sample_size=SAMPLE_SIZE,
+                 min_saving=0.05):
+        """CompressionPolicy(codec='deflate', level=None, ...) -> o
+
+        Constructs an instance using codec ('store', 'deflate', 'bzip2'
+        or 'lzma') at level by default. Files with one of the (lower
+        case) compressed_exts are stored. If sample_size is not 0, a
+        file whose first sample_size bytes deflate by less than
+        min_saving (a fraction) is stored too."""
+        self.default = self.codec(codec, level)
+        self.compressed_exts = frozenset(compressed_exts)
+        self.sample_size = sample_size
+        self.min_saving = min_saving
+        self.rules = []
+
+    def add_rule(self, pattern, codec, level=None):
+        """Compress pathnames matching the glob pattern using codec."""
+        self.rules.append((pattern, self.codec(codec, level)))
+
+    def codec(self, codec, level=None):
+        """Returns (compress_type, compresslevel) for codec and level."""
+        try:
+            return CompressionPolicy.CODECS[codec], level
+        except KeyError:
+            raise ValueError('Unknown codec {0}.'.format(codec))
+
+    def compression(self, pathname, sample=None):
+        """Returns (compress_type, compresslevel) for the file pathname.
+
+        If supplied, sample holds the first bytes of the file so that
+        it need not be read (or even exist)."""
+        for pattern, compression in self.rules:
+            if fnmatch.fnmatchcase(pathname, pattern):
+                return compression
+
+        stored = (zipfile.ZIP_STORED, None)
+        if self.default == stored:
+            return stored
+        if os.path.splitext(pathname)[1].lower() in self.compressed_exts:
+            return stored
+        if self.sample_size and self.is_incompressible(pathname, sample):
+            return stored
+        return self.default
+
+    def is_incompressible(self, pathname, sample=None):
+        """Determines if the first block of pathname (or of sample, if
+        supplied) hardly compresses."""
+        if sample is None:
+            with open(pathname, 'rb') as source:
+                sample = source.read(self.sample_size)
+        sample = sample[:self.sample_size]
+        if len(sample) < 512:
+            return False
+        deflated = zlib.compress(sample, 1)
+        return len(deflated) > (1.0 - self.min_saving) * len(sample)
+
+
+class InlineExecutor(object):
+    """An executor running each submitted call immediately."""
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) returning a completed Future."""
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """Nothing to shut down."""
+        pass
+
+
+class MemoryTree(Mapping):
+    """A read-only mapping of the paths of the files of an archive to
+    their content, a bytes or a memoryview.
+
+    Decompressed content is kept in memory up to a budget; beyond it,
+    content is written into a temporary directory and mapped from
+    there. Views are only valid until the tree is closed."""
+
+    def __init__(self, budget=MEMORY_BUDGET):
+        """MemoryTree(budget=MEMORY_BUDGET) -> o
+
+        Constructs an empty instance keeping up to budget bytes of
+        decompressed content in memory."""
+        self.budget = budget
+        self.used = 0
+        self._content = {}
+        self._spill_dir = None
+        self._spilled = []
+
+    def keep(self, name, size, chunks):
+        """Keep the content of name, size bytes in chunks; returns it.
+
+        The content is held in memory if it fits my budget and spilled
+        into my temporary directory otherwise."""
+        if self.used + size <= self.budget or not size:
+            content = b''.join(chunks)
+            self.used += len(content)
+        else:
+            content = self.spill(chunks)
+        self._content[name] = content
+        return content
+
+    def spill(self, chunks):
+        """Write chunks into a file of my temporary directory; returns a
+        memoryview of the mapped file."""
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix='dir_archive-')
+        filename = os.path.join(self._spill_dir,
+                                str(len(self._spilled)))
+        with open(filename, 'w+b') as spill_file:
+            for chunk in chunks:
+                spill_file.write(chunk)
+            spill_file.flush()
+            spill_map = mmap.mmap(spill_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        self._spilled.append(spill_map)
+        return memoryview(spill_map)
+
+    def __getitem__(self, name):
+        return self._content[name]
+
+    def __iter__(self):
+        return iter(self._content)
+
+    def __len__(self):
+        return len(self._content)
+
+    def close(self):
+        """Release my views and remove my temporary directory."""
+        for content in self._content.values():
+            if isinstance(content, memoryview):
+                content.release()
+        self._content = {}
+        for spill_map in self._spilled:
+            spill_map.close()
+        self._spilled = []
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir)
+            self._spill_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ZipMemoryTree(MemoryTree):
+    """A MemoryTree of the files of a .zip archive.
+
+    Stored members are memoryviews over the mapped archive, copying
+    nothing. Other members are decompressed, once and with their CRC
+    checked, the first time they are looked up."""
+
+    def __init__(self, filename, budget=MEMORY_BUDGET):
+        """ZipMemoryTree(filename, budget=MEMORY_BUDGET) -> o
+
+        Constructs an instance over the .zip file filename."""
+        super(ZipMemoryTree, self).__init__(budget)
+        self._directory = ZipCentralDirectory(filename)
+        self._infos = dict((info.filename, info) for info in
+                           self._directory.entries() if
+                           not info.filename.endswith('/'))
+
+    def __getitem__(self, name):
+        try:
+            return self._content[name]
+        except KeyError:
+            pass
+        info = self._infos[name]
+        if info.compress_type == zipfile.ZIP_STORED:
+            content = self._directory.raw_data(info)
+            self._content[name] = content
+            return content
+        return self.keep(name, info.file_size,
+                         self._directory.read_chunks(info))
+
+    def __iter__(self):
+        return iter(self._infos)
+
+    def __len__(self):
+        return len(self._infos)
+
+    def close(self):
+        """Release my views and the archive."""
+        super(ZipMemoryTree, self).close()
+        self._directory.close()
+
+
+class TgzMemoryTree(MemoryTree):
+    """A MemoryTree of the regular files of a .tgz archive.
+
+    A .tgz archive is a single compressed stream so it is decompressed
+    once, when the instance is constructed."""
+
+    def __init__(self, filename, budget=MEMORY_BUDGET):
+        """TgzMemoryTree(filename, budget=MEMORY_BUDGET) -> o
+
+        Constructs an instance over the .tgz file filename."""
+        super(TgzMemoryTree, self).__init__(budget)
+        tgz_archive = tarfile.open(filename, 'r|*')
+        try:
+            for member in tgz_archive:
+                if member.isreg():
+                    source = tgz_archive.extractfile(member)
+                    self.keep(member.name, member.size,
+                              iter(partial(source.read, CHUNK_SIZE), b''))
+        except:
+            self.close()
+            raise
+        finally:
+            tgz_archive.close()
+
+
+class VerifyProblem(namedtuple('VerifyProblem', ['name', 'kind',
+                                                 'message'])):
+    """A problem found verifying an archive.
+
+    Kind is 'corrupt', 'truncated' or 'unreadable'. Name is the member
+    at fault or None if the problem concerns the whole archive."""
+    __slots__ = ()
+
+
+class VerifyReport(object):
+    """The outcome of verifying an archive."""
+
+    def __init__(self, archive_filename):
+        """VerifyReport(archive_filename) -> o
+
+        Constructs an empty report on archive_filename."""
+        self.archive_filename = archive_filename
+        self.members = 0
+        self.bytes = 0
+        self.problems = []
+
+    def add_problem(self, name, kind, message):
+        """Note a problem of kind with the member name."""
+        self.problems.append(VerifyProblem(name, kind, message))
+
+    def is_ok(self):
+        """Determines if verification found no problem."""
+        return not self.problems
+
+    def as_dict(self):
+        """Returns this report as a dictionary suitable for JSON."""
+        return {'archive': self.archive_filename,
+                'members': self.members,
+                'bytes': self.bytes,
+                'ok': self.is_ok(),
+                'problems': [problem._asdict() for
+                             problem in self.problems]}
+
+
+class ArchiveJournal(object):
+    """An append-only journal of the checkpoints of a partial archive.
+
+    The journal holds JSON lines: a header naming the archive format,
+    then a record per checkpoint. A record is appended only once the
+    partial archive is durable up to the offset it gives, so after a
+    crash the partial archive can be cut back to the last record and
+    continued."""
+
+    EXT = '.journal'
+
+    VERSION = 1
+
+    def __init__(self, filename):
+        """ArchiveJournal(filename) -> o
+
+        Constructs an instance kept in the file filename."""
+        self.filename = filename
+
+    def start(self, archive_format):
+        """Start an empty journal of an archive in archive_format."""
+        with open(self.filename, 'w') as journal_file:
+            journal_file.write(json.dumps({'version': self.VERSION,
+                                           'format': archive_format}) +
+                               '\n')
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+    def records(self, archive_format):
+        """Returns the list of my records.
+
+        Returns an empty list if I do not exist or journal another
+        archive_format. A torn last line, left by a crash, is ignored.
+        """
+        try:
+            with open(self.filename, 'r') as journal_file:
+                lines = journal_file.read().split('\n')
+        except (IOError, OSError):
+            return []
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            return []
+        if ((header.get('version') != self.VERSION) or
+            (header.get('format') != archive_format)):
+            return []
+        records = []
+        for line in lines[1:]:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+        return records
+
+    def append(self, record):
+        """Durably append record."""
+        with open(self.filename, 'a') as journal_file:
+            journal_file.write(json.dumps(record, sort_keys=True) + '\n')
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+    def remove(self):
+        """Remove this journal."""
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+
+class GzipMemberWriter(object):
+    """A write-only file object writing a gzip stream as a series of
+    gzip members that may be ended at any time."""
+
+    def __init__(self, fileobj, open_member, offset=0):
+        """GzipMemberWriter(fileobj, open_member, offset=0) -> o
+
+        Constructs an instance writing into fileobj. Open_member(fileobj)
+        returns a gzip file object writing a new member into fileobj;
+        closing it must not close fileobj. Offset is the number of
+        uncompressed bytes already in the stream."""
+        self.fileobj = fileobj
+        self._open_member = open_member
+        self._member = None
+        self._offset = offset
+
+    def write(self, data):
+        """Compress data into the stream; returns len(data)."""
+        if self._member is None:
+            self._member = self._open_member(fileobj=self.fileobj)
+        self._member.write(data)
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        """Returns the number of uncompressed bytes in the stream."""
+        return self._offset
+
+    def end_member(self):
+        """End the current gzip member, if any."""
+        if self._member is not None:
+            member = self._member
+            self._member = None
+            member.close()
+
+    def write_member(self, raw, crc, size):
+        """Write a complete gzip member made of the raw deflate data
+        raw whose uncompressed content has the CRC-32 crc and the
+        length size."""
+        self.end_member()
+        self.fileobj.write(b'\037\213\010\000\000\000\000\000\000\377')
+        self.fileobj.write(raw)
+        self.fileobj.write(struct.pack('<LL', crc, size & 0xffffffff))
+        self._offset += size
+
+    def close(self):
+        """Finish the stream. Does not close my fileobj."""
+        self.end_member()
+
+
+class Checkpointer(object):
+    """Commits the members of an archive being written to a journal."""
+
+    def __init__(self, archive_file, journal, interval, committed=()):
+        """Checkpointer(archive_file, journal, interval, committed) -> o
+
+        Constructs an instance syncing the file object archive_file
+        and appending to the ArchiveJournal journal every interval
+        seconds. Committed holds the names of the members committed
+        by previous runs."""
+        self.archive_file = archive_file
+        self.journal = journal
+        self.interval = interval
+        self.committed = set(committed)
+        self._last_commit = time.monotonic()
+
+    def member_done(self):
+        """Note another member, committing if a checkpoint is due."""
+        if time.monotonic() - self._last_commit >= self.interval:
+            self.commit()
+
+    def commit(self):
+        """Make the members written so far durable."""
+        record = self.record()
+        if record:
+            self.archive_file.flush()
+            os.fsync(self.archive_file.fileno())
+            self.journal.append(record)
+        self._last_commit = time.monotonic()
+
+    def record(self):
+        """Returns the journal record of a checkpoint here, or None if
+        nothing was written since the last one."""
+        raise NotImplementedError
+
+
+class TarCheckpointer(Checkpointer):
+    """Commits the members of a tar stream gzipped by a
+    GzipMemberWriter."""
+
+    def __init__(self, tar_file, gzip_file, archive_file, journal,
+                 interval, committed=()):
+        """TarCheckpointer(tar_file, gzip_file, archive_file, ...) -> o
+
+        Constructs an instance committing the members added to the
+        TarFile tar_file, writing into gzip_file."""
+        super(TarCheckpointer, self).__init__(archive_file, journal,
+                                              interval, committed)
+        self.tar_file = tar_file
+        self.gzip_file = gzip_file
+        self._names = []
+
+    def member_done(self, name):
+        """Note the member name, committing if a checkpoint is due."""
+        self._names.append(name)
+        super(TarCheckpointer, self).member_done()
+
+    def record(self):
+        """End the gzip member; returns the journal record."""
+        if not self._names:
+            return None
+        self.gzip_file.end_member()
+        record = {'compressed_offset': self.archive_file.tell(),
+                  'tar_offset': self.tar_file.offset,
+                  'names': self._names}
+        self.committed.update(self._names)
+        self._names = []
+        return record
+
+
+class ZipCheckpointer(Checkpointer):
+    """Commits the members of a .zip file being written."""
+
+    def __init__(self, zip_file, archive_file, journal, interval,
+                 committed=()):
+        """ZipCheckpointer(zip_file, archive_file, journal, ...) -> o
+
+        Constructs an instance committing the members written into
+        the ZipFile zip_file."""
+        super(ZipCheckpointer, self).__init__(archive_file, journal,
+                                              interval, committed)
+        self.zip_file = zip_file
+        self._count = len(zip_file.filelist)
+
+    def record(self):
+        """Returns the journal record of the members written."""
+        written = self.zip_file.filelist[self._count:]
+        if not written:
+            return None
+        self._count = len(self.zip_file.filelist)
+        self.committed.update(zip_info.filename for zip_info in written)
+        # ZipFile leaves its file at the end of the last member.
+        return {'end': self.archive_file.tell(),
+                'members': [zip_info_record(zip_info) for
+                            zip_info in written]}
+
+
+class ReadAhead(object):
+    """Reads files ahead of their use, in an order kind to the disk.
+
+    The files are cut, in order of use, into windows of about
+    readahead bytes. A small pool of threads reads the files of a
+    window in inode order, which on most file systems follows their
+    layout on disk, while the previous window is in use. So at most
+    about twice readahead bytes are held in memory."""
+
+    def __init__(self, pathnames, readahead=READAHEAD_SIZE, jobs=READ_JOBS):
+        """ReadAhead(pathnames, readahead=READAHEAD_SIZE, ...) -> o
+
+        Constructs an instance reading the files pathnames, listed in
+        order of use, with jobs threads."""
+        self.pathnames = pathnames
+        self.readahead = readahead
+        self.jobs = jobs
+        self._positions = dict((pathname, position) for
+                               position, pathname in enumerate(pathnames))
+        self._reads = self._read_all()
+        self._next = None
+
+    def _windows(self):
+        """Yield my files as lists of (position, pathname, file_stat)."""
+        window = []
+        size = 0
+        for position, pathname in enumerate(self.pathnames):
+            try:
+                file_stat = os.lstat(pathname)
+            except OSError:
+                file_stat = None
+            window.append((position, pathname, file_stat))
+            if file_stat and (file_stat.st_size <= PARALLEL_MEMBER_LIMIT):
+                size += file_stat.st_size
+            if size >= self.readahead:
+                yield window
+                window = []
+                size = 0
+        if window:
+            yield window
+
+    def _read_all(self):
+        """Yield (position, data) for each of my files, in order.
+
+        Data is None for files which could not be read ahead."""
+        executor = ThreadPoolExecutor(max_workers=self.jobs)
+        try:
+            pending = deque()
+            for window in self._windows():
+                futures = {}
+                for position, pathname, file_stat in sorted(
+                        window, key=lambda item: ((item[2].st_dev,
+                                                   item[2].st_ino) if
+                                                  item[2] else (0, 0))):
+                    if (file_stat and stat.S_ISREG(file_stat.st_mode) and
+                        (file_stat.st_size <= PARALLEL_MEMBER_LIMIT)):
+                        futures[position] = executor.submit(read_file,
+                                                            pathname)
+                pending.append([(position, futures.get(position)) for
+                                position, _, _ in window])
+                if len(pending) > 1:
+                    for item in self._results(pending.popleft()):
+                        yield item
+            while pending:
+                for item in self._results(pending.popleft()):
+                    yield item
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def _results(self, window):
+        """Yield (position, data) for the futures of a window."""
+        for position, future in window:
+            data = None
+            if future is not None:
+                try:
+                    data = future.result()
+                except OSError:
+                    pass
+            yield position, data
+
+    def take(self, pathname):
+        """Returns the content of pathname or None if it was not read.
+
+        Files must be taken in order; files skipped over are dropped."""
+        position = self._positions.get(pathname)
+        if position is None:
+            return None
+        while (self._next is None) or (self._next[0] < position):
+            self._next = next(self._reads, None)
+            if self._next is None:
+                return None
+        if self._next[0] != position:
+            return None
+        data = self._next[1]
+        self._next = (position, None)
+        return data
+
+    def close(self):
+        """Stop reading ahead."""
+        self._reads.close()
+
+
+class SyncResult(namedtuple('SyncResult', ['written', 'unchanged',
+                                           'deleted'])):
+    """What a sync extraction did, as lists of relative paths."""
+    __slots__ = ()
+
+
+class MemberStats(namedtuple('MemberStats', ['name', 'bytes_read',
+                                             'bytes_written', 'seconds'])):
+    """The figures of one archived member."""
+    __slots__ = ()
+
+
+class ArchiveStats(object):
+    """The running totals of one archiving run."""
+
+    def __init__(self):
+        """ArchiveStats() -> o
+
+        Constructs an instance for a run starting now."""
+        self.files = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.compress_seconds = 0.0
+        self.archive_size = None
+        self.error = None
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._end = None
+
+    def add(self, member):
+        """Count the MemberStats member."""
+        self.files += 1
+        self.bytes_read += member.bytes_read
+        self.bytes_written += member.bytes_written
+        self.compress_seconds += member.seconds
+
+    def finish(self, error=None):
+        """Stop the clock, noting the error that ended the run if any."""
+        self._end = time.perf_counter()
+        self.error = error
+
+    def elapsed(self):
+        """Returns the seconds since the start (until the finish)."""
+        end = self._end if self._end is not None else time.perf_counter()
+        return end - self._start
+
+    def throughput(self):
+        """Returns the bytes read per second so far."""
+        elapsed = self.elapsed()
+        return self.bytes_read / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        """Returns my figures as a dictionary suitable for JSON."""
+        return {'started': self.started,
+                'seconds': self.elapsed(),
+                'files': self.files,
+                'bytes_read': self.bytes_read,
+                'bytes_written': self.bytes_written,
+                'compress_seconds': self.compress_seconds,
+                'archive_size': self.archive_size,
+                'throughput': self.throughput(),
+                'error': None if self.error is None else repr(self.error)}
+
+
+class ArchiveObserver(object):
+    """Receives the progress of a run archiving, extracting or
+    converting an archive.
+
+    Subclasses override the methods they need; here they do nothing.
+    Observers are called from the thread running the archive."""
+
+    def started(self, archive):
+        """Called when archive starts a run."""
+        pass
+
+    def member_done(self, archive, member, stats):
+        """Called when archive has written the MemberStats member.
+
+        Stats is the ArchiveStats of the run so far."""
+        pass
+
+    def finished(self, archive, stats):
+        """Called when the run of archive ends, successfully or not.
+
+        If the run failed, stats.error is the exception raised."""
+        pass
+
+
+class ArchiveCancelled(Exception):
+    """Raised into a run of an archive when it is cancelled."""
+    pass
+
+
+class Canceller(ArchiveObserver):
+    """Stops a run of an archive, after its current member, on request."""
+
+    def __init__(self):
+        """Constructs an instance not (yet) cancelling."""
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """Stop the run after its current member. May be called from any
+        thread."""
+        self._cancelled.set()
+
+    def member_done(self, archive, member, stats):
+        """Raise ArchiveCancelled if cancelled."""
+        if self._cancelled.is_set():
+            raise ArchiveCancelled('Run of {0} cancelled.'.
+                                   format(archive.archive_filename()))
+
+
+class AsyncProgress(ArchiveObserver):
+    """Presents the progress of a run of an archive, running in another
+    thread, as an asynchronous iterator of MemberStats.
+
+    Iteration ends when the run finishes; stats then holds the
+    ArchiveStats of the run and the instance no longer observes the
+    archive."""
+
+    def __init__(self, archive, loop):
+        """AsyncProgress(archive, loop) -> o
+
+        Constructs an instance, to be added to the observers of
+        archive, iterated in the event loop loop."""
+        self._archive = archive
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self.stats = None
+
+    def member_done(self, archive, member, stats):
+        """Queue member."""
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, member)
+
+    def finished(self, archive, stats):
+        """Queue the end of the iteration."""
+        self.stats = stats
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        """Returns the next MemberStats of the run."""
+        member = await self._queue.get()
+        if member is None:
+            if self in self._archive.observers:
+                self._archive.observers.remove(self)
+            raise StopAsyncIteration
+        return member
+
+
+class JsonSummaryReporter(ArchiveObserver):
+    """Writes a JSON summary of each archiving run into a file."""
+
+    def __init__(self, filename, slowest=10):
+        """JsonSummaryReporter(filename, slowest=10) -> o
+
+        Constructs an instance writing into filename. The summary lists
+        the slowest members, at most slowest of them, by compression
+        time."""
+        self.filename = filename
+        self.slowest = slowest
+        self._members = []
+
+    def started(self, archive):
+        """Forget the members of any previous run."""
+        self._members = []
+
+    def member_done(self, archive, member, stats):
+        """Keep member if it is among the slowest so far."""
+        item = (member.seconds, member.name, member)
+        if len(self._members) < self.slowest:
+            heapq.heappush(self._members, item)
+        elif item > self._members[0]:
+            heapq.heapreplace(self._members, item)
+
+    def finished(self, archive, stats):
+        """Write the summary of the run."""
+        summary = stats.as_dict()
+        summary['archive'] = archive.archive_filename()
+        summary['jobs'] = archive.jobs
+        summary['slowest'] = [member._asdict() for _, _, member in
+                              sorted(self._members, reverse=True)]
+        with open(self.filename, 'w') as summary_file:
+            json.dump(summary, summary_file, indent=2, sort_keys=True)
+
+
+class CountingWriter(object):
+    """A write-only file object counting the bytes written through it."""
+
+    def __init__(self, fileobj):
+        """CountingWriter(fileobj) -> o
+
+        Constructs an instance writing into fileobj."""
+        self.fileobj = fileobj
+        self.count = 0
+
+    def write(self, data):
+        """Write data into my fileobj; returns len(data)."""
+        self.fileobj.write(data)
+        self.count += len(data)
+        return len(data)
+
+    def flush(self):
+        """Flush my fileobj."""
+        if hasattr(self.fileobj, 'flush'):
+            self.fileobj.flush()
+
+
+class ObservedTarFile(IndexingTarFile):
+    """An IndexingTarFile reporting each member it adds."""
+
+    _on_member = None
+    _output = None
+
+    def observe(self, on_member, output):
+        """Report added members to on_member(name, bytes_read,
+        bytes_written, seconds).
+
+        Bytes_written is the growth of the CountingWriter output while
+        the member is added. Since the compressor buffers its output,
+        it is only an estimate for any one member."""
+        self._on_member = on_member
+        self._output = output
+
+    def addfile(self, tarinfo, fileobj=None):
+        """Add tarinfo, reporting it once added."""
+        if self._on_member is None:
+            super(ObservedTarFile, self).addfile(tarinfo, fileobj)
+            return
+        written = self._output.count
+        start = time.perf_counter()
+        super(ObservedTarFile, self).addfile(tarinfo, fileobj)
+        self._on_member(tarinfo.name,
+                        tarinfo.size if tarinfo.isreg() else 0,
+                        self._output.count - written,
+                        time.perf_counter() - start)
+
+
+def manifest_entry(file_stat, sha1, zip_info):
+    """Returns the manifest entry for a file with file_stat and sha1
+    compressed as the member zip_info."""
+    return {'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns,
+            'sha1': sha1, 'compress_type': zip_info.compress_type,
+            'compresslevel': get_compresslevel(zip_info)}
+
+
+def extract_zip_members(archive_filename, names):
+    """Extract the members names of archive_filename into the current
+    working directory.
+
+    This function runs in worker processes so it must remain a
+    module-level function."""
+    zip_file = zipfile.ZipFile(archive_filename, 'r')
+    try:
+        for name in names:
+            zip_file.extract(name)
+    finally:
+        zip_file.close()
+
+
+def compare_zip_members(files, checksum):
+    """compare_zip_members(files, checksum) -> list
+
+    Compares each (name, target, size, crc, stat_time) of files with
+    the file target. Returns, for each one, 'same' if the file matches,
+    'touch' if only its time differs and 'write' otherwise. If
+    checksum is True, the CRC-32 of files with a matching time is
+    checked too. This function runs in worker processes so it must
+    remain a module-level function."""
+    states = []
+    for _, target, size, crc, stat_time in files:
+        try:
+            file_stat = os.lstat(target)
+        except OSError:
+            states.append('write')
+            continue
+        if (not stat.S_ISREG(file_stat.st_mode) or
+            (file_stat.st_size != size)):
+            states.append('write')
+        elif int(file_stat.st_mtime) == stat_time:
+            states.append('same' if not checksum or
+                          file_crc32(target) == crc else 'write')
+        else:
+            states.append('touch' if file_crc32(target) == crc else
+                          'write')
+    return states
+
+
+def file_crc32(pathname):
+    """Returns the CRC-32 of the content of the file pathname."""
+    crc = 0
+    with open(pathname, 'rb') as source:
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                return crc
+            crc = zlib.crc32(chunk, crc)
+
+
+def remove_path(pathname):
+    """Remove pathname, be it a file, a link or a directory tree."""
+    if os.path.isdir(pathname) and not os.path.islink(pathname):
+        shutil.rmtree(pathname)
+    else:
+        os.remove(pathname)
+
+
+def remove_extra_paths(root, files, directories):
+    """Remove everything beneath root but the paths in the sets files
+    and directories. Returns the list of removed paths."""
+    removed = []
+    if os.path.islink(root) or not os.path.isdir(root):
+        return removed
+    for dir_name, dir_names, filenames in os.walk(root, topdown=False):
+        for name in filenames:
+            pathname = os.path.join(dir_name, name)
+            if pathname not in files:
+                os.remove(pathname)
+                removed.append(pathname)
+        for name in dir_names:
+            pathname = os.path.join(dir_name, name)
+            if os.path.islink(pathname):
+                if pathname not in files:
+                    os.remove(pathname)
+                    removed.append(pathname)
+            elif pathname not in directories:
+                os.rmdir(pathname)
+                removed.append(pathname)
+    return removed
+
+
+def add_tar_member(gzip_file, tar_info, chunks=()):
+    """Write the tar member tar_info, whose content is the iterable of
+    bytes chunks, into the GzipMemberWriter gzip_file.
+
+    Members are written without a tarfile.TarFile so that some content
+    may bypass the compressor (see add_deflated_member); gzip_file
+    counts the uncompressed bytes of the tar stream."""
+    write_tar_header(gzip_file, tar_info)
+    for chunk in chunks:
+        gzip_file.write(chunk)
+    pad_tar_member(gzip_file, tar_info.size)
+
+
+def add_deflated_member(gzip_file, tar_info, raw, crc):
+    """Write the regular file tar_info into the GzipMemberWriter
+    gzip_file from raw, its raw deflate data, and crc, the CRC-32 of
+    its content.
+
+    Since gzip streams may hold many members, the content is written
+    as a gzip member of its own without being compressed again; only
+    the tar header and padding go through the compressor."""
+    write_tar_header(gzip_file, tar_info)
+    gzip_file.write_member(raw, crc, tar_info.size)
+    pad_tar_member(gzip_file, tar_info.size)
+
+
+def write_tar_header(gzip_file, tar_info):
+    """Write the header blocks of tar_info, as tarfile.TarFile does by
+    default, into gzip_file."""
+    gzip_file.write(tar_info.tobuf(tarfile.DEFAULT_FORMAT, tarfile.ENCODING,
+                                   'surrogateescape'))
+
+
+def pad_tar_member(gzip_file, size):
+    """Pad the content, size bytes long, of the tar member just written
+    into gzip_file to a whole number of blocks."""
+    remainder = size % tarfile.BLOCKSIZE
+    if remainder:
+        gzip_file.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+
+
+def end_tar_stream(gzip_file):
+    """Write the end of the tar stream written into the GzipMemberWriter
+    gzip_file: two empty blocks, padded to a whole record."""
+    gzip_file.write(tarfile.NUL * (2 * tarfile.BLOCKSIZE))
+    remainder = gzip_file.tell() % tarfile.RECORDSIZE
+    if remainder:
+        gzip_file.write(tarfile.NUL * (tarfile.RECORDSIZE - remainder))
+
+
+def extract_zip_volume(volume_filename):
+    """Extract the .zip volume volume_filename into the current
+    working directory.
+
+    This function runs in worker processes so it must remain a
+    module-level function."""
+    ZipArchive(volume_filename[:-len(ZipArchive.EXT)]).extract()
+
+
+def extract_tgz_volume(volume_filename):
+    """Extract the .tgz volume volume_filename into the current working
+    directory. Returns the list of (target, mtime) of its directories.
+
+    Other volumes may be creating the same directories concurrently,
+    so directories are made tolerating their existence. This function
+    runs in worker processes so it must remain a module-level
+    function."""
+    tgz_archive = tarfile.open(volume_filename, 'r|*')
+    try:
+        directories = []
+        for member in tgz_archive:
+            target = tar_member_path(member)
+            if member.isdir():
+                os.makedirs(target, exist_ok=True)
+                directories.append((target, member.mtime))
+                continue
+            parent = os.path.dirname(target)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            tgz_archive.extract(member)
+    finally:
+        tgz_archive.close()
+    return directories
+
+
+def split_volumes(costs, volume_size=None, volumes=None, reserve=0,
+                  names=None):
+    """split_volumes(costs, volume_size=None, volumes=None, reserve=0,
+    names=None) -> list
+
+    Cuts members, each taking up to the given cost in bytes, into runs
+    of consecutive members. Returns the list of (start, end) index
+    ranges of the runs. If volume_size is supplied, it is a maximum:
+    the costs of the members of a run, plus the reserve every volume
+    needs (its trailer), add up to at most volume_size and a member too
+    costly for any volume raises ValueError, naming it by names if
+    supplied. Otherwise, the members are spread into at most volumes
+    runs of about the same cost, a member costlier than the average
+    taking a run of its own. Supplying both raises ValueError."""
+    if (volume_size is not None) and volumes:
+        raise ValueError('Supply a volume size or a volume count, not' +
+                         ' both.')
+    if volume_size is None:
+        if not volumes or volumes < 1:
+            raise ValueError('Supply a volume size or a volume count.')
+        capacity = max(1, -(-sum(costs) // volumes))
+    else:
+        capacity = volume_size - reserve
+        if capacity < 1:
+            raise ValueError('Volume size must exceed the {0} bytes every'
+                             ' volume may need.'.format(reserve))
+    ranges = []
+    start = 0
+    total = 0
+    for end, cost in enumerate(costs):
+        if (volume_size is not None) and (cost > capacity):
+            raise ValueError('Member {0} may take {1} bytes, more than a'
+                             ' volume of {2} bytes holds.'.format(
+                                 names[end] if names else end,
+                                 cost + reserve, volume_size))
+        if (end > start) and (total + cost > capacity):
+            ranges.append((start, end))
+            start = end
+            total = 0
+        total += cost
+    if start < len(costs) or not ranges:
+        ranges.append((start, len(costs)))
+    if volumes and len(ranges) > volumes:
+        # Members costlier than the average may leave extra short runs.
+        ranges[volumes - 1:] = [(ranges[volumes - 1][0], len(costs))]
+    return ranges
+
+
+def deflate_bound(size):
+    """Returns the most bytes raw deflate streams of size bytes take
+    with the default window and memory level (zlib's deflateBound)."""
+    return size + (size >> 12) + (size >> 14) + (size >> 25) + 7
+
+
+def compressed_bound(size, compress_type):
+    """Returns the most bytes size bytes take once compressed by the
+    zipfile codec compress_type. The bounds of bzip2 and LZMA are
+    generous, their worst cases growing data by about 1%."""
+    if compress_type == zipfile.ZIP_STORED:
+        return size
+    if compress_type == zipfile.ZIP_DEFLATED:
+        return deflate_bound(size)
+    return size + (size >> 5) + 1024
+
+
+def tar_member_cost(tar_file, pathname):
+    """Returns the most bytes, compressed, the member of pathname may
+    take in a .tgz volume, its header and padding included. Tar_file is
+    only used to build the header. A hard link is counted as the
+    regular file it becomes in a volume without its first link."""
+    tarinfo = tar_file.gettarinfo(pathname)
+    tar_file.inodes.clear()
+    if tarinfo is None:
+        return 0
+    tar_bytes = len(tarinfo.tobuf(tarfile.PAX_FORMAT, tarfile.ENCODING,
+                                  'surrogateescape'))
+    if tarinfo.isreg():
+        tar_bytes += -(-tarinfo.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+    return deflate_bound(tar_bytes)
+
+
+def zip_member_cost(arcname, size, compress_type):
+    """Returns the most bytes the member arcname of size bytes takes in
+    a .zip volume once compressed by compress_type, its local and
+    central directory headers included."""
+    return (ZIP_MEMBER_OVERHEAD + 2 * len(arcname.encode('utf-8')) +
+            compressed_bound(size, compress_type))
+
+
+def verify_zip_members(archive_filename, infos):
+    """verify_zip_members(archive_filename, infos) -> tuple
+
+    Decompresses the members infos of the .zip file archive_filename
+    in memory. Returns (size, problems) where size is the number of
+    bytes decompressed and problems a list of (name, kind, message).
+    This function runs in worker processes so it must remain a
+    module-level function."""
+    size = 0
+    problems = []
+    with ZipCentralDirectory(archive_filename) as listing:
+        archive_size = os.path.getsize(archive_filename)
+        for info in infos:
+            member_size = 0
+            try:
+                for chunk in listing.read_chunks(info):
+                    member_size += len(chunk)
+                if member_size != info.file_size:
+                    problems.append((info.filename, 'corrupt',
+                                     'Expected {0} bytes, found {1}.'.
+                                     format(info.file_size, member_size)))
+            except (zipfile.BadZipFile, zlib.error, lzma.LZMAError,
+                    EOFError, OSError, struct.error) as error:
+                truncated = (info.header_offset + info.compress_size >
+                             archive_size)
+                problems.append((info.filename,
+                                 'truncated' if truncated else 'corrupt',
+                                 str(error)))
+            size += member_size
+    return size, problems
+
+
+def verify_tgz_segment(archive_filename, checkpoint, end, headers):
+    """verify_tgz_segment(archive_filename, checkpoint, end, headers)
+    -> tuple
+
+    Decompresses the .tgz file archive_filename in memory from
+    checkpoint to the uncompressed offset end (None means to the end),
+    checking the tar header at each of the sorted offsets headers.
+    Returns (crc, size, problems) where crc is the CRC-32 of the size
+    bytes decompressed and problems a list of (offset, kind, message).
+    """
+    crc = 0
+    position = checkpoint.uncompressed_offset
+    problems = []
+    with open(archive_filename, 'rb') as tgz_file:
+        reader = GzipStreamReader(tgz_file, checkpoint)
+        try:
+            for target in headers + [end]:
+                while (target is None) or (position < target):
+                    chunk = reader.read(CHUNK_SIZE if target is None else
+                                        min(CHUNK_SIZE, target - position))
+                    if not chunk:
+                        break
+                    crc = zlib.crc32(chunk, crc)
+                    position += len(chunk)
+                if target is None:
+                    break
+                if position < target:
+                    raise EOFError('Compressed file ended before the' +
+                                   ' end-of-stream marker was reached.')
+                if (target == end) or ((end is not None) and
+                                       (target + tarfile.BLOCKSIZE > end)):
+                    continue
+                block = reader.read(tarfile.BLOCKSIZE)
+                crc = zlib.crc32(block, crc)
+                position += len(block)
+                try:
+                    tarfile.TarInfo.frombuf(block, tarfile.ENCODING,
+                                            'surrogateescape')
+                except tarfile.HeaderError as error:
+                    problems.append((target, 'corrupt', str(error)))
+            if end is not None:
+                # Make the decompressor finish the gzip member it is in,
+                # checking its trailer.
+                reader.read(1)
+        except EOFError as error:
+            problems.append((position, 'truncated', str(error)))
+        except zlib.error as error:
+            problems.append((position, 'corrupt', str(error)))
+    return crc, position - checkpoint.uncompressed_offset, problems
+
+
+def tar_member_path(member):
+    """Returns the relative path to which the tar member is extracted.
+
+    Raises tarfile.ExtractError for absolute names or names leaving
+    the current working directory."""
+    path = os.path.normpath(member.name)
+    if (os.path.isabs(path) or (path == os.pardir) or
+        path.startswith(os.pardir + os.sep)):
+        raise tarfile.ExtractError('Unsafe member name {0}.'.
+                                   format(member.name))
+    return path
+
+
+def write_file(pathname, data):
+    """Write data into the file pathname, replacing any existing file."""
+    with open(pathname, 'wb') as target:
+        target.write(data)
+
+
+def zip_date_time(mtime):
+    """Returns the zip date_time of the stat time mtime.
+
+    Zip times cannot precede 1980; earlier times are clamped."""
+    return max(time.localtime(mtime)[:6], (1980, 1, 1, 0, 0, 0))
+
+
+def zip_member_path(name):
+    """Returns the relative path to which zipfile extracts member name."""
+    # Mirror ZipFile._extract_member: drop the drive, the root and any
+    # empty, '.' or '..' components.
+    arcname = name.replace('/', os.sep)
+    if os.altsep:
+        arcname = arcname.replace(os.altsep, os.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    components = [component for component in arcname.split(os.sep) if
+                  component not in ('', os.curdir, os.pardir)]
+    return os.sep.join(components)
+
+
+def compress_file(pathname, compress_type, compresslevel=None):
+    """compress_file(pathname, compress_type, compresslevel) -> tuple
+
+    Reads and compresses the file pathname as zipfile would. Returns
+    the tuple (file_size, crc, sha1, seconds, compressed_data) where
+    sha1 is the hex digest of the content and seconds the time taken.
+    This function runs in worker processes so it must remain a
+    module-level function."""
+    start = time.perf_counter()
+    with open(pathname, 'rb') as source:
+        return compress_chunks(iter(partial(source.read, CHUNK_SIZE), b''),
+                               compress_type, compresslevel, start)
+
+
+def compress_data(data, compress_type, compresslevel=None):
+    """compress_data(data, compress_type, compresslevel) -> tuple
+
+    Compresses data, the content of a file already read, as
+    compress_file compresses a file."""
+    start = time.perf_counter()
+    with memoryview(data) as view:
+        return compress_chunks((view[offset:offset + CHUNK_SIZE] for
+                                offset in range(0, len(data), CHUNK_SIZE)),
+                               compress_type, compresslevel, start)
+
+
+def compress_chunks(chunks, compress_type, compresslevel, start):
+    """Returns the compress_file tuple for the content chunks whose
+    compression started at the perf_counter() time start. Requires
+    raw_zip_supported()."""
+    compressor = zipfile._get_compressor(compress_type, compresslevel)
+    file_size = 0
+    crc = 0
+    digest = hashlib.sha1()
+    compressed = []
+    for chunk in chunks:
+        file_size += len(chunk)
+        crc = zlib.crc32(chunk, crc)
+        digest.update(chunk)
+        compressed.append(compressor.compress(chunk) if compressor else
+                          bytes(chunk))
+    if compressor:
+        compressed.append(compressor.flush())
+    data = b''.join(compressed)
+    return (file_size, crc, digest.hexdigest(), time.perf_counter() - start,
+            data)
+
+
+def check_read_order(read_order):
+    """Returns read_order if it is a known read order (None or 'inode');
+    otherwise raises ValueError."""
+    if read_order not in (None, 'inode'):
+        raise ValueError('Unknown read order {0!r}.'.format(read_order))
+    return read_order
+
+
+def read_file(pathname):
+    """Returns the content of the file pathname."""
+    with open(pathname, 'rb') as source:
+        return source.read()
+
+
+def tar_arcname(pathname):
+    """Returns the name TarFile.gettarinfo gives the member pathname."""
+    arcname = os.path.splitdrive(pathname)[1].replace(os.sep, '/')
+    return arcname.lstrip('/')
+
+
+def tar_walk(top):
+    """Yield top and the paths beneath it in the order TarFile.add
+    adds them: depth first, each directory sorted by name."""
+    yield top
+    if os.path.isdir(top) and not os.path.islink(top):
+        for name in sorted(os.listdir(top)):
+            yield from tar_walk(os.path.join(top, name))
+
+
+def zip_arcname(pathname, is_empty_dir=False):
+    """Returns the name of the member zipping pathname."""
+    if is_empty_dir:
+        return zipfile.ZipInfo(pathname + os.sep).filename
+    return zipfile.ZipInfo.from_file(pathname).filename
+
+
+def zip_info_record(zip_info):
+    """Returns a dictionary, suitable for JSON, describing the
+    compressed member zip_info down to its offset."""
+    record = dict((name, getattr(zip_info, name)) for
+                  name in ZIP_INFO_FIELDS)
+    record['date_time'] = list(zip_info.date_time)
+    record['extra'] = zip_info.extra.hex()
+    record['comment'] = zip_info.comment.hex()
+    return record
+
+
+def zip_info_from_record(record):
+    """Returns the ZipInfo described by a zip_info_record."""
+    zip_info = zipfile.ZipInfo(record['filename'],
+                               tuple(record['date_time']))
+    for name in ZIP_INFO_FIELDS:
+        setattr(zip_info, name, record[name])
+    zip_info.extra = bytes.fromhex(record['extra'])
+    zip_info.comment = bytes.fromhex(record['comment'])
+    return zip_info
+
+
+def copy_zip_info(zip_info):
+    """Returns a new ZipInfo describing the same compressed member."""
+    result = zipfile.ZipInfo(zip_info.filename, zip_info.date_time)
+    for name in ('compress_type', 'CRC', 'compress_size', 'file_size',
+                 'external_attr', 'create_system', 'comment'):
+        setattr(result, name, getattr(zip_info, name))
+    return result
+
+
+def raw_zip_supported(zip_file=None):
+    """Determines if the private internals of zipfile listed by
+    RAW_ZIP_INTERNALS are available: the running Python is a CPython
+    version known to have them and zip_file, a ZipFile, if supplied,
+    has them. Otherwise members must be written by ZipFile itself."""
+    if ((sys.implementation.name != 'cpython') or
+            not (RAW_ZIP_VERSIONS[0] <= sys.version_info[:2] <=
+                 RAW_ZIP_VERSIONS[1]) or
+            not hasattr(zipfile, '_get_compressor')):
+        return False
+    return (zip_file is None) or all(hasattr(zip_file, name) for
+                                     name in RAW_ZIP_INTERNALS)
+
+
+def get_compresslevel(zip_info):
+    """Returns the compression level of zip_info, None by default."""
+    if hasattr(zip_info, 'compress_level'):
+        return zip_info.compress_level
+    return getattr(zip_info, '_compresslevel', None)
+
+
+def set_compresslevel(zip_info, compresslevel):
+    """Set the compression level ZipFile uses for zip_info, as
+    ZipFile.writestr does (publicly so from Python 3.13)."""
+    if hasattr(zip_info, 'compress_level'):
+        zip_info.compress_level = compresslevel
+    else:
+        zip_info._compresslevel = compresslevel
+
+
+def read_compressed(zip_file, zip_info):
+    """Yield the still compressed data of zip_info from zip_file.
+
+    Zip_file must be open for reading and backed by a real file, and
+    raw_zip_supported(zip_file) True."""
+    with zip_file._lock:
+        archive_file = zip_file.fp
+        archive_file.seek(zip_info.header_offset)
+        header = archive_file.read(zipfile.sizeFileHeader)
+        if ((len(header) != zipfile.sizeFileHeader) or
+            (header[:4] != zipfile.stringFileHeader)):
+            raise zipfile.BadZipFile('Bad local header for {0}.'.
+                                     format(zip_info.filename))
+        name_length, extra_length = struct.unpack('<HH', header[26:30])
+        archive_file.seek(name_length + extra_length, os.SEEK_CUR)
+        remaining = zip_info.compress_size
+        while remaining > 0:
+            chunk = archive_file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                raise zipfile.BadZipFile('Truncated member {0}.'.
+                                         format(zip_info.filename))
+            remaining -= len(chunk)
+            yield chunk
+
+
+def write_compressed(zip_file, zip_info, chunks):
+    """Write the already compressed chunks of zip_info into zip_file.
+
+    The CRC, file_size, compress_size and compress_type of zip_info
+    must describe the chunks. The member is written exactly as
+    ZipFile.write would have written it, without compressing again.
+    Raw_zip_supported(zip_file) must be True."""
+    zip_info.flag_bits = 0
+    if zip_info.compress_type == zipfile.ZIP_LZMA:
+        # Compressed data includes an end-of-stream (EOS) marker
+        zip_info.flag_bits |= 0x02
+    zip64 = ((zip_info.file_size > zipfile.ZIP64_LIMIT) or
+             (zip_info.compress_size > zipfile.ZIP64_LIMIT))
+    if zip64 and not zip_file._allowZip64:
+        raise zipfile.LargeZipFile('Filesize would require ZIP64 extensions')
+    if not zip_info.external_attr:
+        zip_info.external_attr = 0o600 << 16
 
+    with zip_file._lock:
+        if zip_file._seekable:
+            zip_file.fp.seek(zip_file.start_dir)
+        zip_info.header_offset = zip_file.fp.tell()
+        zip_file._writecheck(zip_info)
+        zip_file._didModify = True
+        zip_file.fp.write(zip_info.FileHeader(zip64))
+        for chunk in chunks:
+            zip_file.fp.write(chunk)
+        zip_file.start_dir = zip_file.fp.tell()
+        zip_file.filelist.append(zip_info)
+        zip_file.NameToInfo[zip_info.filename] = zip_info
@@ -0,0 +1,95 @@
+#! env python
+
+
+"""Compares the throughput of the dir_archive archiving engines."""
+
+
+from optparse import OptionParser
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from dir_archive import TgzDirArchive
+
+
+def make_tree(top, megabytes, file_count=64):
+    """Fill top with file_count text files totalling about megabytes MB."""
+    words_filename = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  'latin_words.txt')
+    words = [line.strip() for line in open(words_filename)]
+    generator = random.Random(1995)
+    file_size = (megabytes << 20) // file_count
+    for i in range(file_count):
+        pathname = os.path.join(top, 'sub{0:02d}'.format(i % 8),
+                                'file{0:04d}.txt'.format(i))
+        if not os.path.isdir(os.path.dirname(pathname)):
+            os.makedirs(os.path.dirname(pathname))
+        with open(pathname, 'w') as f:
+            written = 0
+            while written < file_size:
+                line = ' '.join(generator.choice(words) for _ in range(12))
+                f.write(line + '\n')
+                written += len(line) + 1
+
+
+def tree_size(top):
+    """Returns the total size of the files beneath top."""
+    return sum(os.path.getsize(os.path.join(root, filename)) for
+               root, dirs, files in os.walk(top) for filename in files)
+
+
+def time_archive(archive):
+    """Returns the seconds taken by archive.archive()."""
+    start = time.time()
+    archive.archive()
+    return time.time() - start
+
+
+def bench_tgz(dir_name, work_dir, jobs_list, repeat):
+    """Print the .tgz throughput of dir_name for each jobs in jobs_list."""
+    megabytes = tree_size(dir_name) / float(1 << 20)
+    print('{0:>6} {1:>10} {2:>10} {3:>10}'.format('jobs', 'seconds', 'MB/s',
+                                                  'ratio'))
+    for jobs in jobs_list:
+        archive_base = os.path.join(work_dir, 'bench{0}'.format(jobs))
+        archive = TgzDirArchive(dir_name, archive_base, jobs=jobs)
+        seconds = min(time_archive(archive) for _ in range(repeat))
+        ratio = (os.path.getsize(archive.archive_filename()) /
+                 float(megabytes * (1 << 20)))
+        print('{0:>6} {1:>10.2f} {2:>10.1f} {3:>10.3f}'.format(
+            jobs, seconds, megabytes / seconds, ratio))
+        os.remove(archive.archive_filename())
+
+
+if __name__ == '__main__':
+    usage = """%prog [options] [dir_name]
+
+    Measure the throughput of TgzDirArchive.archive single-threaded
+    (jobs=1, the tarfile 'w:gz' path) and with parallel gzip blocks.
+    Without dir_name, archive a generated tree of text files.
+    """
+    parser = OptionParser(usage=usage)
+    parser.add_option('-m', '--megabytes', type='int', default=64,
+                      help='Size of the generated tree (default 64).')
+    parser.add_option('-j', '--jobs', default='1,2,4,{0}'.
+                      format(os.cpu_count() or 1),
+                      help='Comma-separated worker counts to compare.')
+    parser.add_option('-r', '--repeat', type='int', default=1,
+                      help='Report the best of this many runs (default 1).')
+    opts, args = parser.parse_args()
+    if len(args) > 1:
+        parser.error('At most one dir_name allowed.')
+
+    jobs_list = sorted(set(int(jobs) for jobs in opts.jobs.split(',')))
+    work_dir = tempfile.mkdtemp(prefix='dir_archive_bench')
+    try:
+        if args:
+            dir_name = args[0]
+        else:
+            dir_name = os.path.join(work_dir, 'tree')
+            make_tree(dir_name, opts.megabytes)
+        bench_tgz(dir_name, work_dir, jobs_list, opts.repeat)
+    finally:
+        shutil.rmtree(work_dir)
@@ -4,13 +4,24 @@
 """Defines and runs the unit tests for the dir_archive module."""
 
 
+import asyncio
 from datetime import datetime
+from functools import partial
+import gc
+import gzip
+import json
 import os
+import random
 import shutil
+import tarfile
 import time
 import unittest
+import zipfile
 
 import dir_archive
+import parallel_gzip
+import tgz_index
+import zip_central_dir
 
 
 class DirArchiveNameTest(unittest.TestCase):
@@ -216,6 +227,15 @@ class ArchiveTest(object):
         extractor.extract()
         self.assertTree(self._emptyTree, self._emptyTreeRoot)
 
+    def testExtractOverExistingTree(self):
+        """Extracting over an already extracted tree succeeds."""
+        archive = self.toTestArchive(self._emptyTreeRoot)
+        archive.archive()
+        extractor = self.toTestExtract(archive._archive_base)
+        extractor.extract()
+        extractor.extract()
+        self.assertTree(self._emptyTree, self._emptyTreeRoot)
+
     def testArchiveSubdirZipsFileContent(self):
         """Verify that archiving a subdirectory includes file content."""
         archive = self.toTestArchive(self._contentTreeRoot)
@@ -227,6 +247,74 @@ class ArchiveTest(object):
         self.assertTree(self._contentTree, self._contentTreeRoot,
                         content=self._content)
 
+    def testArchiveToUnseekableStream(self):
+        """Archive into a pipe-like stream in one pass and extract it."""
+        archive = self.toTestArchive(self._contentTreeRoot)
+        stream = UnseekableStream()
+        archive.archive(fileobj=stream)
+        self.assertFalse(os.path.exists(archive.archive_filename()))
+        with open(archive.archive_filename(), 'wb') as archiveFile:
+            archiveFile.write(stream.getvalue())
+        shutil.rmtree(self._contentTreeRoot)
+        extractor = self.toTestExtract(archive._archive_base)
+        extractor.extract()
+        self.assertTree(self._contentTree, self._contentTreeRoot,
+                        content=self._content, times=self._contentTimes)
+
+    def testVerifyFindsNoProblem(self):
+        """Verifying a sound archive reports every member and no problem."""
+        archive = self.toTestArchive(self._contentTreeRoot)
+        archive.archive()
+        report = self.toTestExtract(archive._archive_base).verify()
+        self.assertTrue(report.is_ok(), report.problems)
+        self.assertTrue(report.members >= len(self._content))
+        self.assertTrue(report.bytes >=
+                        sum(len(text) for text in self._content.values()))
+
+    def testObserversFollowRun(self):
+        """Observers see the start, every file and the end of a run."""
+        archive = self.toTestArchive(self._contentTreeRoot)
+        observer = RecordingObserver()
+        archive.add_observer(observer)
+        archive.archive()
+        self.assertEqual('started', observer.events[0])
+        self.assertEqual('finished', observer.events[-1])
+        stats = observer.stats
+        self.assertEqual(None, stats.error)
+        self.assertEqual(sum(len(text) for text in self._content.values()),
+                         stats.bytes_read)
+        self.assertEqual(os.path.getsize(archive.archive_filename()),
+                         stats.archive_size)
+        names = [member.name for member in observer.members]
+        self.assertEqual(len(names), stats.files)
+        scirit = os.path.join(self._contentTreeRoot, 'scirit')
+        self.assertTrue(scirit in names)
+
+    def testSummaryReportsSlowestMembersAndErrors(self):
+        """The JSON summary lists the slowest members and any error."""
+        summaryName = self._contentTreeRoot + '.json'
+        archive = self.toTestArchive(self._contentTreeRoot)
+        archive.add_observer(dir_archive.JsonSummaryReporter(summaryName,
+                                                             slowest=2))
+        try:
+            archive.archive()
+            with open(summaryName) as summaryFile:
+                summary = json.load(summaryFile)
+            self.assertEqual(archive.archive_filename(), summary['archive'])
+            self.assertEqual(None, summary['error'])
+            self.assertEqual(2, len(summary['slowest']))
+            self.assertTrue(summary['slowest'][0]['seconds'] >=
+                            summary['slowest'][1]['seconds'])
+
+            archive.add_observer(FailingObserver())
+            self.assertRaises(RuntimeError, archive.archive)
+            with open(summaryName) as summaryFile:
+                summary = json.load(summaryFile)
+            self.assertTrue('RuntimeError' in summary['error'])
+        finally:
+            if os.path.exists(summaryName):
+                os.remove(summaryName)
+
     def testExtractHasCorrectTimeStamps(self):
         """Archive and extract a subdirectory restores time stamps."""
         archive = self.toTestArchive(self._contentTreeRoot)
@@ -256,6 +344,72 @@ class ArchiveTest(object):
         return basename + dir_archive.ZipArchive.EXT
     
     
+class RecordingObserver(dir_archive.ArchiveObserver):
+    """An observer recording what it is told."""
+
+    def __init__(self):
+        """Initialize an empty record."""
+        self.events = []
+        self.members = []
+        self.stats = None
+
+    def started(self, archive):
+        """Record the start."""
+        self.events.append('started')
+
+    def member_done(self, archive, member, stats):
+        """Record member."""
+        self.events.append('member')
+        self.members.append(member)
+
+    def finished(self, archive, stats):
+        """Record the end."""
+        self.events.append('finished')
+        self.stats = stats
+
+
+class FailingObserver(dir_archive.ArchiveObserver):
+    """An observer failing on the first member."""
+
+    def member_done(self, archive, member, stats):
+        """Fail."""
+        raise RuntimeError('Stop.')
+
+
+class StoppingObserver(dir_archive.ArchiveObserver):
+    """An observer failing, like a crash, on a given member."""
+
+    def __init__(self, count):
+        """Fail on the count-th member."""
+        self.count = count
+
+    def member_done(self, archive, member, stats):
+        """Fail on my count-th member."""
+        if stats.files == self.count:
+            raise RuntimeError('Crash.')
+
+
+class UnseekableStream(object):
+    """A write-only stream, like a pipe, collecting what is written."""
+
+    def __init__(self):
+        """Initialize an empty stream."""
+        self._chunks = []
+
+    def flush(self):
+        """Nothing to flush."""
+        pass
+
+    def getvalue(self):
+        """Return all the bytes written."""
+        return b''.join(self._chunks)
+
+    def write(self, data):
+        """Collect data."""
+        self._chunks.append(bytes(data))
+        return len(data)
+
+
 class TgzArchiveTest(ArchiveTest, unittest.TestCase):
     """Defines the unit tests for the .tgz file packages."""
 
@@ -268,6 +422,148 @@ class TgzArchiveTest(ArchiveTest, unittest.TestCase):
         return dir_archive.TgzArchive(archiveBase)
     
 
+class ParallelTgzArchiveTest(ArchiveTest, unittest.TestCase):
+    """Defines unit tests for .tgz files gzipped in parallel blocks."""
+
+    def toTestArchive(self, dirname=None, archiveBase=None):
+        """Return the instance to archive."""
+        # Use the smallest blocks so even the fixtures span many blocks.
+        return dir_archive.TgzDirArchive(dirname, archiveBase, jobs=3,
+                                         block_size=1 << 15)
+
+    def toTestExtract(self, archiveBase=None):
+        """Return the instance from which to extract."""
+        return dir_archive.TgzArchive(archiveBase)
+
+    def testParallelArchiveIsStandardGzip(self):
+        """The parallel stream decompresses with the gzip module."""
+        archive = self.toTestArchive(self._contentTreeRoot)
+        archive.archive()
+        data = gzip.open(archive.archive_filename()).read()
+        self.assertEqual(0, len(data) % tarfile.RECORDSIZE)
+        tarFile = tarfile.open(archive.archive_filename(), 'r:gz')
+        try:
+            self.assertTrue(os.path.join(self._contentTreeRoot, 'scirit') in
+                            tarFile.getnames())
+        finally:
+            tarFile.close()
+
+
+class ParallelExtractTgzArchiveTest(ArchiveTest, unittest.TestCase):
+    """Defines unit tests for .tgz files extracted by many threads."""
+
+    def toTestArchive(self, dirname=None, archiveBase=None):
+        """Return the instance to archive."""
+        return dir_archive.TgzDirArchive(dirname, archiveBase)
+
+    def toTestExtract(self, archiveBase=None):
+        """Return the instance from which to extract."""
+        return dir_archive.TgzArchive(archiveBase, jobs=3)
+
+    def testExtractOverHardLinks(self):
+        """Hard links extract again over an existing tree."""
+        target = os.path.join(self._contentTreeRoot, 'scirit')
+        link = os.path.join(self._contentTreeRoot, 'copula')
+        os.link(target, link)
+        archive = self.toTestArchive(self._contentTreeRoot)
+        archive.archive()
+        for _ in range(2):
+            self.toTestExtract(archive._archive_base).extract()
+            self.assertTrue(os.path.samefile(target, link))
+
+
+class IndexedTgzArchiveTest(ArchiveTest, unittest.TestCase):
+    """Defines unit tests for .tgz files with a random-access index."""
+
+    def tearDown(self):
+        """Tear down the test fixture."""
+        super(IndexedTgzArchiveTest, self).tearDown()
+        for archiveBase in [self._empty_dirname, self._contentTreeRoot,
+                            self._emptyTreeRoot]:
+            indexName = (archiveBase + dir_archive.TgzArchive.EXT +
+                         tgz_index.TgzIndex.EXT)
+            if os.path.isfile(indexName):
+                os.remove(indexName)
+
+    def toTestArchive(self, dirname=None, archiveBase=None):
+        """Return the instance to archive."""
+        return dir_archive.TgzDirArchive(dirname, archiveBase, index=True)
+
+    def toTestExtract(self, archiveBase=None):
+        """Return the instance from which to extract."""
+        return dir_archive.TgzArchive(archiveBase)
+
+    def testOpenMemberReadsContent(self):
+        """Open a single member through the index."""
+        archive = self.toTestArchive(self._contentTreeRoot)
+        archive.archive()
+        self.assertTrue(os.path.isfile(archive.index_filename()))
+        extractor = self.toTestExtract(archive._archive_base)
+        porcus = os.path.join(self._contentTreeRoot, 'possible', 'publici',
+                              'porcus')
+        with extractor.open_member(porcus) as member:
+            self.assertEqual(self._content['porcus'],
+                             member.read().decode('utf-8'))
+        self.assertRaises(KeyError, extractor.open_member, 'nusquam')
+
+    def testExtractMemberRestoresOneFile(self):
+        """Extract a single member through the index."""
+        archive = self.toTestArchive(self._contentTreeRoot)
+        archive.archive()
+        shutil.rmtree(self._contentTreeRoot)
+        extractor = self.toTestExtract(archive._archive_base)
+        scirit = os.path.join(self._contentTreeRoot, 'scirit')
+        extractor.extract_member(scirit)
+        self.assertEqual(['scirit'], os.listdir(self._contentTreeRoot))
+        self.assertContent(scirit, self._content)
+        self.assertTime(scirit, self._contentTimes)
+
+    def testBuildIndexOfUnindexedArchive(self):
+        """Build the index of an archive written without one."""
+        archive = dir_archive.TgzDirArchive(self._contentTreeRoot)
+        archive.archive()
+        self.assertFalse(os.path.exists(archive.index_filename()))
+        extractor = self.toTestExtract(archive._archive_base)
+        extractor.build_index()
+        self.assertTrue(os.path.isfile(archive.index_filename()))
+        existit = os.path.join(self._contentTreeRoot, 'possible', 'existit')
+        with self.toTestExtract(archive._archive_base).open_member(
+                existit) as member:
+            self.assertEqual(b'sit', member.read())
+
+    def testArchiveToUnseekableStream(self):
+        """Indexing an archive written into a stream raises an error."""
+        archive = self.toTestArchive(self._contentTreeRoot)
+        self.assertRaises(ValueError, archive.archive, UnseekableStream())
+
+
+class LocalityTgzArchiveTest(ArchiveTest, unittest.TestCase):
+    """Defines unit tests for .tgz files read in locality order."""
+
+    def toTestArchive(self, dirname=None, archiveBase=None):
+        """Return the instance to archive."""
+        return dir_archive.TgzDirArchive(dirname, archiveBase,
+                                         read_order='inode', readahead=16)
+
+    def toTestExtract(self, archiveBase=None):
+        """Return the instance from which to extract."""
+        return dir_archive.TgzArchive(archiveBase)
+
+    def testMembersMatchTarFileAdd(self):
+        """Members are added exactly as TarFile.add adds them."""
+        archive = self.toTestArchive(self._contentTreeRoot)
+        archive.archive()
+        with tarfile.open(archive.archive_filename()) as tarFile:
+            names = tarFile.getnames()
+        self.assertEqual(list(dir_archive.tar_walk(self._contentTreeRoot)),
+                         names)
+
+    def testUnknownReadOrderRaisesError(self):
+        """Only known read orders are accepted."""
+        self.assertRaises(ValueError, dir_archive.TgzDirArchive,
+                          self._contentTreeRoot, read_order='random')
+
+
 class ZipArchiveTest(ArchiveTest, unittest.TestCase):
     """Defines unit tests for the .zip file packages."""
 
@@ -278,14 +574,1128 @@ class ZipArchiveTest(ArchiveTest, unittest.TestCase):
     def toTestExtract(self, archiveBase=None):
         """Return the instance from which to extract."""
         return dir_archive.ZipArchive(archiveBase)
+
+    def testListingFindsMembers(self):
+        """List, find and read members without extracting."""
+        archive = self.toTestArchive(self._emptyTreeRoot)
+        archive.archive()
+        extractor = self.toTestExtract(archive._archive_base)
+        try:
+            aqua = os.path.join(self._emptyTreeRoot, 'aqua')
+            reginae = os.path.join(self._emptyTreeRoot, 'reginae') + '/'
+            self.assertEqual(sorted([aqua, reginae,
+                                     os.path.join(self._emptyTreeRoot,
+                                                  'voluisti'),
+                                     os.path.join(self._emptyTreeRoot,
+                                                  'invetavi')]),
+                             sorted(extractor.ls()))
+            self.assertTrue(extractor.exists(reginae))
+            self.assertFalse(extractor.exists('nusquam'))
+            self.assertEqual(b'', extractor.read_member(aqua))
+        finally:
+            extractor.close()
     
+
+
+class ParallelZipArchiveTest(ArchiveTest, unittest.TestCase):
+    """Defines unit tests for .zip files compressed by worker processes."""
+
+    def toTestArchive(self, dirname=None, archiveBase=None):
+        """Return the instance to archive."""
+        return dir_archive.ZipDirArchive(dirname, archiveBase, jobs=2)
+
+    def toTestExtract(self, archiveBase=None):
+        """Return the instance from which to extract."""
+        return dir_archive.ZipArchive(archiveBase)
+
+    def testParallelArchiveMatchesSerialArchive(self):
+        """Parallel and serial archives hold the same members."""
+        serial = dir_archive.ZipDirArchive(self._contentTreeRoot)
+        serial.archive()
+        serialZip = zipfile.ZipFile(serial.archive_filename())
+        expected = [(info.filename, info.CRC, info.file_size)
+                    for info in serialZip.infolist()]
+        serialZip.close()
+
+        parallel = self.toTestArchive(self._contentTreeRoot)
+        parallel.archive()
+        parallelZip = zipfile.ZipFile(parallel.archive_filename())
+        try:
+            self.assertEqual(None, parallelZip.testzip())
+            actual = [(info.filename, info.CRC, info.file_size)
+                      for info in parallelZip.infolist()]
+        finally:
+            parallelZip.close()
+        self.assertEqual(expected, actual)
+
+    def testFallsBackWithoutZipfileInternals(self):
+        """Without the internals of zipfile, ZipFile writes members."""
+        self.assertTrue(dir_archive.raw_zip_supported())
+        versions = dir_archive.RAW_ZIP_VERSIONS
+        dir_archive.RAW_ZIP_VERSIONS = ((0, 0), (0, 0))
+        try:
+            self.assertFalse(dir_archive.raw_zip_supported())
+            archive = self.toTestArchive(self._contentTreeRoot)
+            archive.archive()
+        finally:
+            dir_archive.RAW_ZIP_VERSIONS = versions
+        zipFile = zipfile.ZipFile(archive.archive_filename())
+        try:
+            self.assertEqual(None, zipFile.testzip())
+            scirit = os.path.join(self._contentTreeRoot, 'scirit')
+            self.assertEqual(self._content['scirit'],
+                             zipFile.read(scirit).decode('utf-8'))
+        finally:
+            zipFile.close()
+
+
+class LocalityZipArchiveTest(ArchiveTest, unittest.TestCase):
+    """Defines unit tests for .zip files read in locality order."""
+
+    def toTestArchive(self, dirname=None, archiveBase=None):
+        """Return the instance to archive."""
+        return dir_archive.ZipDirArchive(dirname, archiveBase,
+                                         read_order='inode', readahead=16)
+
+    def toTestExtract(self, archiveBase=None):
+        """Return the instance from which to extract."""
+        return dir_archive.ZipArchive(archiveBase)
+
+    def testMembersAreSortedByPath(self):
+        """Serial and parallel archives write members sorted by path."""
+        for jobs in [1, 2]:
+            archive = dir_archive.ZipDirArchive(self._contentTreeRoot,
+                                                jobs=jobs,
+                                                read_order='inode')
+            archive.archive()
+            with zipfile.ZipFile(archive.archive_filename()) as zipFile:
+                self.assertEqual(None, zipFile.testzip())
+                names = zipFile.namelist()
+            self.assertEqual(sorted(names), names)
+            self.assertEqual(len(self._content) + 1, len(names))
+
+
+class ReadAheadTest(unittest.TestCase):
+    """Defines the unit tests for reading files in locality order."""
+
+    def setUp(self):
+        """Set up the test fixture."""
+        self._dirname = 'ordine'
+        if os.path.isdir(self._dirname):
+            shutil.rmtree(self._dirname)
+        os.mkdir(self._dirname)
+        self._pathnames = []
+        for number in range(12):
+            pathname = os.path.join(self._dirname, 'f{0:02}'.format(number))
+            with open(pathname, 'wb') as f:
+                f.write(pathname.encode('ascii') * 10)
+            self._pathnames.append(pathname)
+        random.Random(5).shuffle(self._pathnames)
+
+    def tearDown(self):
+        """Tear down the test fixture."""
+        shutil.rmtree(self._dirname)
+
+    def testWindowsAreReadInInodeOrder(self):
+        """Each window is read in inode order and taken in path order."""
+        reads = []
+        readFile = dir_archive.read_file
+        def recordingReadFile(pathname):
+            reads.append(pathname)
+            return readFile(pathname)
+        dir_archive.read_file = recordingReadFile
+        try:
+            reader = dir_archive.ReadAhead(self._pathnames, readahead=200,
+                                           jobs=1)
+            for pathname in self._pathnames:
+                self.assertEqual(pathname.encode('ascii') * 10,
+                                 reader.take(pathname))
+            reader.close()
+        finally:
+            dir_archive.read_file = readFile
+
+        self.assertEqual(sorted(reads), sorted(self._pathnames))
+        inode = lambda pathname: os.stat(pathname).st_ino
+        # Each window holds two files of 100 bytes.
+        for start in range(0, len(reads), 2):
+            self.assertEqual(sorted(self._pathnames[start:start + 2],
+                                    key=inode),
+                             reads[start:start + 2])
+
+    def testTakeSkipsFilesNotTaken(self):
+        """Files may be skipped but not taken out of order."""
+        reader = dir_archive.ReadAhead(self._pathnames, readahead=400)
+        try:
+            self.assertEqual(None, reader.take('nusquam'))
+            self.assertNotEqual(None, reader.take(self._pathnames[3]))
+            self.assertEqual(None, reader.take(self._pathnames[1]))
+            self.assertNotEqual(None, reader.take(self._pathnames[4]))
+        finally:
+            reader.close()
+
+
+class ParallelExtractZipArchiveTest(ArchiveTest, unittest.TestCase):
+    """Defines unit tests for .zip files extracted by worker processes."""
+
+    def toTestArchive(self, dirname=None, archiveBase=None):
+        """Return the instance to archive."""
+        return dir_archive.ZipDirArchive(dirname, archiveBase)
+
+    def toTestExtract(self, archiveBase=None):
+        """Return the instance from which to extract."""
+        return dir_archive.ZipArchive(archiveBase, jobs=2)
+
+    def testZipMemberPathIsRelative(self):
+        """Member paths never leave the current working directory."""
+        self.assertEqual(os.path.join('a', 'b'),
+                         dir_archive.zip_member_path('/../a/./b'))
+
+
+class ResumableArchiveTest(ArchiveTest, unittest.TestCase):
+    """Defines unit tests for resuming interrupted archives."""
+
+    def tearDown(self):
+        """Tear down the test fixture."""
+        super(ResumableArchiveTest, self).tearDown()
+        base = self._contentTreeRoot
+        for filename in [base + '.tar.gz', base + '.zip.partial',
+                         base + '.tgz.journal', base + '.zip.journal']:
+            if os.path.isfile(filename):
+                os.remove(filename)
+
+    def toTestArchive(self, dirname=None, archiveBase=None):
+        """Return the instance to archive."""
+        return dir_archive.ZipDirArchive(dirname, archiveBase,
+                                         resumable=True, commit_interval=0)
+
+    def toTestExtract(self, archiveBase=None):
+        """Return the instance from which to extract."""
+        return dir_archive.ZipArchive(archiveBase)
+
+    def assertResumes(self, archive, extractor, members):
+        """Crash archive after three members and resume it."""
+        if os.path.exists(archive.archive_filename()):
+            os.remove(archive.archive_filename())
+        archive.add_observer(StoppingObserver(4))
+        self.assertRaises(RuntimeError, archive.archive)
+        self.assertFalse(os.path.exists(archive.archive_filename()))
+        self.assertTrue(os.path.isfile(archive.journal_filename()))
+
+        # A crash may also tear the last line of the journal.
+        with open(archive.journal_filename(), 'a') as journal:
+            journal.write('{"torn')
+        archive.observers = []
+        observer = RecordingObserver()
+        archive.add_observer(observer)
+        archive.archive()
+        self.assertEqual(members - 3, observer.stats.files)
+        self.assertFalse(os.path.exists(archive.journal_filename()))
+
+        shutil.rmtree(self._contentTreeRoot)
+        self.assertTrue(extractor.verify().is_ok())
+        extractor.extract()
+        self.assertTree(self._contentTree, self._contentTreeRoot,
+                        content=self._content, times=self._contentTimes)
+
+    def testZipResumes(self):
+        """An interrupted .zip archive resumes where it was committed."""
+        for jobs in [1, 2]:
+            archive = dir_archive.ZipDirArchive(self._contentTreeRoot,
+                                                jobs=jobs, resumable=True,
+                                                commit_interval=0)
+            self.assertResumes(archive, self.toTestExtract(
+                self._contentTreeRoot), len(self._content) + 1)
+            shutil.rmtree(self._contentTreeRoot)
+            self.makeTree(self._contentTree, self._contentTreeRoot,
+                          content=self._content, times=self._contentTimes)
+
+    def testTgzResumes(self):
+        """An interrupted .tgz archive resumes where it was committed."""
+        for jobs in [1, 2]:
+            archive = dir_archive.TgzDirArchive(self._contentTreeRoot,
+                                                jobs=jobs, resumable=True,
+                                                commit_interval=0)
+            self.assertResumes(archive,
+                               dir_archive.TgzArchive(self._contentTreeRoot),
+                               len(self._content) + 4)
+            shutil.rmtree(self._contentTreeRoot)
+            self.makeTree(self._contentTree, self._contentTreeRoot,
+                          content=self._content, times=self._contentTimes)
+
+    def testArchiveToUnseekableStream(self):
+        """Resumable archives cannot be written into a stream."""
+        archive = self.toTestArchive(self._contentTreeRoot)
+        self.assertRaises(ValueError, archive.archive,
+                          fileobj=UnseekableStream())
+
+    def testResumableRejectsIncompatibleOptions(self):
+        """Resumable archives cannot be indexed nor incremental."""
+        self.assertRaises(ValueError, dir_archive.TgzDirArchive,
+                          self._contentTreeRoot, index=True, resumable=True)
+        self.assertRaises(ValueError, dir_archive.ZipDirArchive,
+                          self._contentTreeRoot, incremental=True,
+                          resumable=True)
+
+
+class SyncZipArchiveTest(ArchiveTest, unittest.TestCase):
+    """Defines unit tests for .zip files extracted over existing trees."""
+
+    def toTestArchive(self, dirname=None, archiveBase=None):
+        """Return the instance to archive."""
+        return dir_archive.ZipDirArchive(dirname, archiveBase)
+
+    def toTestExtract(self, archiveBase=None, jobs=2):
+        """Return the instance from which to extract."""
+        extractor = dir_archive.ZipArchive(archiveBase, jobs=jobs)
+        extractor.extract = partial(extractor.extract, sync=True,
+                                    delete=True)
+        return extractor
+
+    def testSyncOnlyWritesChangedFiles(self):
+        """Syncing an up-to-date tree writes nothing."""
+        archive = self.toTestArchive(self._contentTreeRoot)
+        archive.archive()
+        for jobs in [1, 2]:
+            extractor = self.toTestExtract(archive._archive_base, jobs)
+            result = extractor.extract()
+            self.assertEqual([], result.written)
+            self.assertEqual([], result.deleted)
+            self.assertEqual(len(self._content) + 1, len(result.unchanged))
+
+            porcus = os.path.join(self._contentTreeRoot, 'possible',
+                                  'publici', 'porcus')
+            self.makeFile(porcus, 'changed')
+            result = extractor.extract()
+            self.assertEqual([porcus], result.written)
+            self.assertTree(self._contentTree, self._contentTreeRoot,
+                            content=self._content, times=self._contentTimes)
+
+    def testSyncRestoresMissingAndDeletesExtraFiles(self):
+        """Syncing writes missing files and removes unknown ones."""
+        archive = self.toTestArchive(self._contentTreeRoot)
+        archive.archive()
+        scirit = os.path.join(self._contentTreeRoot, 'scirit')
+        os.remove(scirit)
+        extra = os.path.join(self._contentTreeRoot, 'possible', 'extra')
+        os.makedirs(os.path.join(extra, 'deeper'))
+        self.makeFile(os.path.join(extra, 'deeper', 'file'), 'x')
+        stray = os.path.join(self._contentTreeRoot, 'stray')
+        self.makeFile(stray, 'x')
+
+        result = self.toTestExtract(archive._archive_base).extract()
+        self.assertEqual([scirit], result.written)
+        self.assertEqual(sorted([extra, os.path.join(extra, 'deeper'),
+                                 os.path.join(extra, 'deeper', 'file'),
+                                 stray]),
+                         sorted(result.deleted))
+        self.assertFalse(os.path.exists(extra))
+        self.assertFalse(os.path.exists(stray))
+        self.assertTree(self._contentTree, self._contentTreeRoot,
+                        content=self._content, times=self._contentTimes)
+
+    def testSyncChecksumFindsSameSizeChanges(self):
+        """With checksum, a change keeping size and time is written."""
+        archive = self.toTestArchive(self._contentTreeRoot)
+        archive.archive()
+        extractor = dir_archive.ZipArchive(archive._archive_base)
+        extractor.extract(sync=True)
+        scirit = os.path.join(self._contentTreeRoot, 'scirit')
+        times = os.stat(scirit)
+        self.makeFile(scirit, self._content['scirit'].upper())
+        os.utime(scirit, ns=(times.st_atime_ns, times.st_mtime_ns))
+
+        self.assertEqual([], extractor.extract(sync=True).written)
+        self.assertEqual([scirit],
+                         extractor.extract(sync=True, checksum=True).written)
+        self.assertTree(self._contentTree, self._contentTreeRoot,
+                        content=self._content, times=self._contentTimes)
+
+
+class IncrementalZipArchiveTest(ArchiveTest, unittest.TestCase):
+    """Defines unit tests for incrementally archived .zip files."""
+
+    def tearDown(self):
+        """Tear down the test fixture."""
+        super(IncrementalZipArchiveTest, self).tearDown()
+        for archiveBase in [self._empty_dirname, self._contentTreeRoot,
+                            self._emptyTreeRoot]:
+            manifestName = (archiveBase + dir_archive.ZipArchive.EXT +
+                            dir_archive.ZipDirArchive.MANIFEST_EXT)
+            if os.path.isfile(manifestName):
+                os.remove(manifestName)
+
+    def toTestArchive(self, dirname=None, archiveBase=None):
+        """Return the instance to archive."""
+        return dir_archive.ZipDirArchive(dirname, archiveBase,
+                                         incremental=True)
+
+    def toTestExtract(self, archiveBase=None):
+        """Return the instance from which to extract."""
+        return dir_archive.ZipArchive(archiveBase)
+
+    def testArchiveToUnseekableStream(self):
+        """Archiving incrementally into a stream raises an error."""
+        archive = self.toTestArchive(self._contentTreeRoot)
+        self.assertRaises(ValueError, archive.archive, UnseekableStream())
+
+    def readMembers(self, archive):
+        """Return a dictionary mapping member names to their content."""
+        zipFile = zipfile.ZipFile(archive.archive_filename())
+        try:
+            return dict((name, zipFile.read(name).decode('utf-8'))
+                        for name in zipFile.namelist())
+        finally:
+            zipFile.close()
+
+    def testArchiveWritesManifest(self):
+        """Archiving records every file in the manifest."""
+        archive = self.toTestArchive(self._contentTreeRoot)
+        archive.archive()
+        manifest = archive.read_manifest()
+        self.assertEqual(sorted(self.readMembers(archive)), sorted(manifest))
+        scirit = os.path.join(self._contentTreeRoot, 'scirit')
+        self.assertEqual(os.stat(scirit).st_size, manifest[scirit]['size'])
+
+    def testChangesReplaceAddAndDropMembers(self):
+        """Rearchiving picks up changed, new and deleted files."""
+        archive = self.toTestArchive(self._contentTreeRoot)
+        archive.archive()
+        scirit = os.path.join(self._contentTreeRoot, 'scirit')
+        existit = os.path.join(self._contentTreeRoot, 'possible', 'existit')
+        novum = os.path.join(self._contentTreeRoot, 'novum')
+        self.makeFile(scirit, 'mutatum est')
+        os.remove(existit)
+        self.makeFile(novum, 'novum')
+        archive.archive()
+        members = self.readMembers(archive)
+        self.assertEqual('mutatum est', members[scirit])
+        self.assertEqual('novum', members[novum])
+        self.assertFalse(existit in members)
+        self.assertFalse(existit in archive.read_manifest())
+
+    def testUnchangedFilesReuseCompressedData(self):
+        """Files with the same size and mtime are not read again."""
+        archive = self.toTestArchive(self._contentTreeRoot)
+        archive.archive()
+        scirit = os.path.join(self._contentTreeRoot, 'scirit')
+        original = os.stat(scirit)
+        # Same size and time stamp, different content.
+        self.makeFile(scirit, 'x' * original.st_size)
+        os.utime(scirit, ns=(original.st_atime_ns, original.st_mtime_ns))
+        archive.archive()
+        self.assertEqual(self._content['scirit'],
+                         self.readMembers(archive)[scirit])
+
+    def testPolicyChangeRecompressesMembers(self):
+        """Unchanged files are compressed again if the policy changed."""
+        self.toTestArchive(self._contentTreeRoot).archive()
+        archive = dir_archive.ZipDirArchive(
+            self._contentTreeRoot, incremental=True,
+            policy=dir_archive.CompressionPolicy('store'))
+        archive.archive()
+        self.assertTrue(archive.stats.bytes_read > 0)
+        zipFile = zipfile.ZipFile(archive.archive_filename())
+        try:
+            self.assertEqual(set([zipfile.ZIP_STORED]),
+                             set(info.compress_type for info in
+                                 zipFile.infolist()))
+        finally:
+            zipFile.close()
+        for entry in archive.read_manifest().values():
+            self.assertEqual(zipfile.ZIP_STORED, entry['compress_type'])
+        # The same policy again reuses every member.
+        archive.archive()
+        self.assertEqual(0, archive.stats.bytes_read)
+
+
+class CompressionPolicyTest(unittest.TestCase):
+    """Defines the unit tests for choosing how members are compressed."""
+
+    def setUp(self):
+        """Set up the test fixture."""
+        self._dirname = 'pretium'
+        if os.path.isdir(self._dirname):
+            shutil.rmtree(self._dirname)
+        os.mkdir(self._dirname)
+        self._text = self.makeFile('odio.txt', b'Nam pretium justo ' * 1000)
+        self._photo = self.makeFile('justo.JPG', b'Nam pretium justo ' * 1000)
+        self._noise = self.makeFile('nec.dat', os.urandom(1 << 16))
+
+    def tearDown(self):
+        """Tear down the test fixture."""
+        shutil.rmtree(self._dirname)
+        zipName = self._dirname + dir_archive.ZipArchive.EXT
+        if os.path.isfile(zipName):
+            os.remove(zipName)
+
+    def makeFile(self, filename, content):
+        """Create the file filename in my directory holding content."""
+        pathname = os.path.join(self._dirname, filename)
+        with open(pathname, 'wb') as f:
+            f.write(content)
+        return pathname
+
+    def testDefaultCodecCompressesText(self):
+        """Text is compressed using the default codec and level."""
+        policy = dir_archive.CompressionPolicy('bzip2', 9)
+        self.assertEqual((zipfile.ZIP_BZIP2, 9),
+                         policy.compression(self._text))
+
+    def testCompressedExtensionIsStored(self):
+        """Files named as compressed formats are stored."""
+        policy = dir_archive.CompressionPolicy()
+        self.assertEqual(zipfile.ZIP_STORED,
+                         policy.compression(self._photo)[0])
+
+    def testIncompressibleContentIsStored(self):
+        """Files whose first block does not shrink are stored."""
+        policy = dir_archive.CompressionPolicy()
+        self.assertEqual(zipfile.ZIP_STORED,
+                         policy.compression(self._noise)[0])
+        policy = dir_archive.CompressionPolicy(sample_size=0)
+        self.assertEqual(zipfile.ZIP_DEFLATED,
+                         policy.compression(self._noise)[0])
+
+    def testRulesComeFirst(self):
+        """The first matching glob rule chooses the codec."""
+        policy = dir_archive.CompressionPolicy()
+        policy.add_rule('*.JPG', 'lzma')
+        policy.add_rule('*', 'store')
+        self.assertEqual(zipfile.ZIP_LZMA, policy.compression(self._photo)[0])
+        self.assertEqual(zipfile.ZIP_STORED, policy.compression(self._text)[0])
+
+    def testUnknownCodecRaisesError(self):
+        """Naming an unknown codec raises an error."""
+        self.assertRaises(ValueError, dir_archive.CompressionPolicy, 'zstd')
+
+    def testArchiveAppliesPolicy(self):
+        """Serial and parallel archives compress members by policy."""
+        policy = dir_archive.CompressionPolicy('lzma')
+        for jobs in [1, 2]:
+            archive = dir_archive.ZipDirArchive(self._dirname, jobs=jobs,
+                                                policy=policy)
+            archive.archive()
+            zipFile = zipfile.ZipFile(archive.archive_filename())
+            try:
+                self.assertEqual(None, zipFile.testzip())
+                types = dict((info.filename, info.compress_type) for
+                             info in zipFile.infolist())
+            finally:
+                zipFile.close()
+            self.assertEqual({self._text: zipfile.ZIP_LZMA,
+                              self._photo: zipfile.ZIP_STORED,
+                              self._noise: zipfile.ZIP_STORED}, types)
+
+
+
+class SplitArchiveTest(unittest.TestCase):
+    """Defines the unit tests for archives split into volumes."""
+
+    def setUp(self):
+        """Set up the test fixture."""
+        self._dirname = 'partes'
+        self._cleanFixtures()
+        self._content = {}
+        for number in range(12):
+            subdir = os.path.join(self._dirname, 'tres{0}'.format(number % 3))
+            if not os.path.isdir(subdir):
+                os.makedirs(subdir)
+            pathname = os.path.join(subdir, 'pars{0}'.format(number))
+            text = 'Gallia est omnis divisa. ' * (number + 1)
+            with open(pathname, 'w') as f:
+                f.write(text)
+            self._content[pathname] = text
+        self._empty = os.path.join(self._dirname, 'vacua')
+        os.mkdir(self._empty)
+        self._subdir = os.path.join(self._dirname, 'tres1')
+        self._time = time.mktime(datetime(1995, 12, 5, 8, 56, 3).timetuple())
+        os.utime(self._subdir, (self._time, self._time))
+
+    def tearDown(self):
+        """Tear down the test fixture."""
+        self._cleanFixtures()
+
+    def _cleanFixtures(self):
+        """Remove all test fixtures from the OS filesystem."""
+        if os.path.isdir(self._dirname):
+            shutil.rmtree(self._dirname)
+        for archive in [dir_archive.TgzArchive(self._dirname),
+                        dir_archive.ZipArchive(self._dirname)]:
+            archive.remove_volumes()
+
+    def assertExtracted(self, archive, extractor):
+        """Archive into volumes then extract them all."""
+        archive.archive()
+        volumes = archive.volume_filenames()
+        self.assertFalse(os.path.exists(archive.archive_filename()))
+        self.assertEqual(sum(os.path.getsize(volume) for volume in volumes),
+                         archive.stats.archive_size)
+        self.assertEqual(sum(len(text) for text in self._content.values()),
+                         archive.stats.bytes_read)
+        shutil.rmtree(self._dirname)
+        extractor.extract()
+        for pathname, text in self._content.items():
+            self.assertEqual(text, open(pathname).read())
+        self.assertTrue(os.path.isdir(self._empty))
+        return volumes
+
+    def testSplitVolumesBySize(self):
+        """Volumes hold at most the volume size, their reserve included."""
+        self.assertEqual([(0, 2), (2, 3), (3, 5)],
+                         dir_archive.split_volumes([4, 6, 10, 1, 9],
+                                                   volume_size=10))
+        self.assertEqual([(0, 2), (2, 5)],
+                         dir_archive.split_volumes([4, 5, 6, 1, 3], 12))
+        self.assertEqual([(0, 2), (2, 4), (4, 5)],
+                         dir_archive.split_volumes([4, 5, 6, 1, 3], 12,
+                                                   reserve=3))
+        self.assertEqual([(0, 0)], dir_archive.split_volumes([], 10))
+        self.assertRaises(ValueError, dir_archive.split_volumes, [1])
+        self.assertRaises(ValueError, dir_archive.split_volumes, [1], 2,
+                          reserve=2)
+
+    def testSplitVolumesRejectsOversizeMembers(self):
+        """A member costlier than a volume holds raises ValueError."""
+        self.assertRaises(ValueError, dir_archive.split_volumes,
+                          [4, 20, 1], volume_size=10)
+        self.assertRaises(ValueError, dir_archive.split_volumes,
+                          [4, 9, 1], volume_size=10, reserve=2)
+        archive = dir_archive.ZipDirArchive(self._dirname, volume_size=400)
+        self.assertRaises(ValueError, archive.archive)
+        self.assertEqual([], archive.volume_filenames())
+
+    def testZipVolumesStayWithinSize(self):
+        """No .zip volume split by size is larger than the volume size."""
+        archive = dir_archive.ZipDirArchive(self._dirname, volume_size=1200)
+        volumes = self.assertExtracted(archive,
+                                       dir_archive.ZipArchive(self._dirname))
+        self.assertTrue(len(volumes) > 2)
+        for volume in volumes:
+            self.assertTrue(os.path.getsize(volume) <= 1200)
+
+    def testSplitVolumesByCount(self):
+        """Members are balanced across at most the volume count."""
+        self.assertEqual([(0, 2), (2, 4)],
+                         dir_archive.split_volumes([5, 5, 5, 5], volumes=2))
+        self.assertEqual([(0, 1), (1, 5)],
+                         dir_archive.split_volumes([30, 1, 1, 1, 1],
+                                                   volumes=3))
+        self.assertEqual([(0, 1), (1, 2), (2, 6)],
+                         dir_archive.split_volumes([1, 30, 1, 1, 30, 1],
+                                                   volumes=3))
+        self.assertEqual([(0, 1), (1, 2)],
+                         dir_archive.split_volumes([1, 1], volumes=5))
+
+    def testZipVolumesExtractInParallel(self):
+        """A .zip archive split by count extracts from all its volumes."""
+        archive = dir_archive.ZipDirArchive(self._dirname, jobs=2, volumes=3)
+        volumes = self.assertExtracted(
+            archive, dir_archive.ZipArchive(self._dirname, jobs=2))
+        self.assertEqual([archive.volume_filename(number) for
+                          number in [1, 2, 3]], volumes)
+        for volume in volumes:
+            self.assertTrue(zipfile.is_zipfile(volume))
+
+    def testTgzVolumesExtractInParallel(self):
+        """A .tgz archive split by size extracts from all its volumes."""
+        archive = dir_archive.TgzDirArchive(self._dirname, jobs=2,
+                                            volume_size=20000)
+        volumes = self.assertExtracted(
+            archive, dir_archive.TgzArchive(self._dirname, jobs=2))
+        self.assertTrue(len(volumes) > 2)
+        for volume in volumes:
+            self.assertTrue(os.path.getsize(volume) <= 20000)
+        self.assertTrue(abs(os.stat(self._subdir).st_mtime - self._time) <= 1)
+
+    def testSplitRejectsIncompatibleOptions(self):
+        """Split archives cannot be resumed, indexed nor streamed."""
+        self.assertRaises(ValueError, dir_archive.TgzDirArchive,
+                          self._dirname, volumes=2, index=True)
+        self.assertRaises(ValueError, dir_archive.ZipDirArchive,
+                          self._dirname, volumes=2, resumable=True)
+        archive = dir_archive.ZipDirArchive(self._dirname, volume_size=100)
+        self.assertRaises(ValueError, archive.archive,
+                          fileobj=UnseekableStream())
+
+    def testSplitRejectsSizeWithCount(self):
+        """A volume size and a volume count cannot be combined."""
+        for archive_class in [dir_archive.ZipDirArchive,
+                              dir_archive.TgzDirArchive]:
+            self.assertRaises(ValueError, archive_class, self._dirname,
+                              volume_size=50000, volumes=2)
+        self.assertRaises(ValueError, dir_archive.split_volumes,
+                          [4, 6, 10], 10, 2)
+
+
+class TgzToZipArchiveTest(ArchiveTest, unittest.TestCase):
+    """Defines unit tests for .zip files converted from .tgz files."""
+
+    def toTestArchive(self, dirname=None, archiveBase=None):
+        """Return the instance to archive."""
+        return dir_archive.TgzDirArchive(dirname, archiveBase)
+
+    def toTestExtract(self, archiveBase=None):
+        """Return the instance from which to extract."""
+        return dir_archive.TgzArchive(archiveBase).to_zip()
+
+    def testStoresCompressedFilesByPolicy(self):
+        """The policy chooses how each converted file is compressed."""
+        archive = self.toTestArchive(self._contentTreeRoot)
+        archive.archive()
+        policy = dir_archive.CompressionPolicy()
+        policy.add_rule('*/scirit', 'store')
+        converted = dir_archive.TgzArchive(archive._archive_base).to_zip(
+            policy=policy)
+        zipFile = zipfile.ZipFile(converted.archive_filename())
+        try:
+            for info in zipFile.infolist():
+                self.assertEqual(zipfile.ZIP_STORED if
+                                 info.filename.endswith('scirit') else
+                                 zipfile.ZIP_DEFLATED, info.compress_type)
+        finally:
+            zipFile.close()
+
+    def testSymbolicLinksSurviveRoundTrip(self):
+        """Symbolic links convert to .zip and back."""
+        link = os.path.join(self._contentTreeRoot, 'ligamen')
+        os.symlink('scirit', link)
+        archive = self.toTestArchive(self._contentTreeRoot)
+        archive.archive()
+        self.toTestExtract(archive._archive_base).to_tgz()
+        shutil.rmtree(self._contentTreeRoot)
+        dir_archive.TgzArchive(archive._archive_base).extract()
+        self.assertEqual('scirit', os.readlink(link))
+
+    def testHardLinksConvertToCopies(self):
+        """A hard-linked file converts to a copy of its target."""
+        target = os.path.join(self._contentTreeRoot, 'scirit')
+        link = os.path.join(self._contentTreeRoot, 'copula')
+        os.link(target, link)
+        archive = self.toTestArchive(self._contentTreeRoot)
+        archive.archive()
+        converted = self.toTestExtract(archive._archive_base)
+        shutil.rmtree(self._contentTreeRoot)
+        converted.extract()
+        with open(target, 'rb') as targetFile:
+            with open(link, 'rb') as linkFile:
+                self.assertEqual(targetFile.read(), linkFile.read())
+
+    def testSpecialMembersRaiseError(self):
+        """Members that cannot be converted are not skipped silently."""
+        archive = self.toTestArchive(self._contentTreeRoot)
+        archive.archive()
+        fifo = tarfile.TarInfo('tubus')
+        fifo.type = tarfile.FIFOTYPE
+        tarFile = tarfile.open(archive.archive_filename(), 'w:gz')
+        tarFile.addfile(fifo)
+        tarFile.close()
+        self.assertRaises(ValueError, self.toTestExtract,
+                          archive._archive_base)
+
+
+class ZipToTgzArchiveTest(ArchiveTest, unittest.TestCase):
+    """Defines unit tests for .tgz files converted from .zip files."""
+
+    def toTestArchive(self, dirname=None, archiveBase=None):
+        """Return the instance to archive."""
+        return dir_archive.ZipDirArchive(dirname, archiveBase)
+
+    def toTestExtract(self, archiveBase=None, jobs=1):
+        """Return the instance from which to extract."""
+        return dir_archive.ZipArchive(archiveBase, jobs=jobs).to_tgz()
+
+    def testDeflatedMembersAreNotCompressedAgain(self):
+        """Deflated members are copied verbatim into the .tgz file."""
+        archive = self.toTestArchive(self._contentTreeRoot)
+        archive.archive()
+        for jobs in [1, 2]:
+            converted = self.toTestExtract(archive._archive_base, jobs)
+            data = open(converted.archive_filename(), 'rb').read()
+            with zip_central_dir.ZipCentralDirectory(
+                    archive.archive_filename()) as directory:
+                for info in directory.entries():
+                    with directory.raw_data(info) as raw:
+                        self.assertTrue(bytes(raw) in data, info.filename)
+            report = converted.verify()
+            self.assertTrue(report.is_ok(), report.problems)
+            with gzip.open(converted.archive_filename()) as tarStream:
+                self.assertEqual(0, len(tarStream.read()) %
+                                 tarfile.RECORDSIZE)
+
+
+class AsyncRunner(object):
+    """Runs the blocking runs of an archive through its coroutines."""
+
+    def __init__(self, archive):
+        """Run the runs of archive."""
+        self._archive = archive
+
+    def __getattr__(self, name):
+        return getattr(self._archive, name)
+
+    def archive(self, fileobj=None):
+        """Archive through archive_async."""
+        return asyncio.run(self._archive.archive_async(fileobj))
+
+    def extract(self, **kwargs):
+        """Extract through extract_async."""
+        return asyncio.run(self._archive.extract_async(**kwargs))
+
+
+class SlowObserver(dir_archive.ArchiveObserver):
+    """An observer slowing every member down."""
+
+    def member_done(self, archive, member, stats):
+        """Sleep a little."""
+        time.sleep(0.05)
+
+
+class AsyncArchiveTest(ArchiveTest, unittest.TestCase):
+    """Defines unit tests for archives run from an event loop."""
+
+    def toTestArchive(self, dirname=None, archiveBase=None):
+        """Return the instance to archive."""
+        return AsyncRunner(dir_archive.ZipDirArchive(dirname, archiveBase))
+
+    def toTestExtract(self, archiveBase=None):
+        """Return the instance from which to extract."""
+        return AsyncRunner(dir_archive.ZipArchive(archiveBase))
+
+    def testProgressIteratesMembers(self):
+        """Progress yields every member, then ends with the run."""
+        async def run(archive):
+            progress = archive.progress()
+            task = asyncio.ensure_future(archive.archive_async())
+            names = [member.name async for member in progress]
+            await task
+            return names, progress.stats
+
+        archive = dir_archive.TgzDirArchive(self._contentTreeRoot)
+        names, stats = asyncio.run(run(archive))
+        self.assertTrue(os.path.join(self._contentTreeRoot, 'scirit') in
+                        names)
+        self.assertEqual(len(names), stats.files)
+        self.assertEqual([], archive.observers)
+
+    def testRunsConcurrently(self):
+        """Many runs share one event loop."""
+        async def run(archives):
+            await asyncio.gather(*[archive.archive_async() for
+                                   archive in archives])
+            shutil.rmtree(self._contentTreeRoot)
+            await asyncio.gather(*[dir_archive.TgzArchive(
+                archive._archive_base).extract_async() for
+                                   archive in archives[1:]])
+
+        archives = [dir_archive.ZipDirArchive(self._contentTreeRoot),
+                    dir_archive.TgzDirArchive(self._contentTreeRoot)]
+        asyncio.run(run(archives))
+        for archive in archives:
+            self.assertTrue(os.path.isfile(archive.archive_filename()))
+        self.assertTree(self._contentTree, self._contentTreeRoot,
+                        content=self._content, times=self._contentTimes)
+
+    def cancelRun(self, archive):
+        """Cancel the task archiving archive after its first member and
+        return True if awaiting it raised CancelledError."""
+        async def run(archive):
+            progress = archive.progress()
+            task = asyncio.ensure_future(archive.archive_async())
+            await progress.__anext__()
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                return True
+            return False
+
+        archive.add_observer(SlowObserver())
+        with self.assertNoLogs('asyncio', level='ERROR'):
+            cancelled = asyncio.run(run(archive))
+            gc.collect()
+        self.assertTrue(isinstance(archive.stats.error,
+                                   dir_archive.ArchiveCancelled))
+        return cancelled
+
+    def testCancelStopsRun(self):
+        """Cancelling the task stops the run and cleans it up."""
+        archive = dir_archive.TgzDirArchive(self._contentTreeRoot)
+        self.assertTrue(self.cancelRun(archive))
+        self.assertFalse(os.path.exists(archive.archive_filename()))
+        self.assertFalse(os.path.exists(archive.tar_gz_filename()))
+
+    def testCancelLeavesNoPartialZip(self):
+        """A cancelled .zip run leaves neither archive nor new file."""
+        archive = dir_archive.ZipDirArchive(self._contentTreeRoot)
+        self.assertTrue(self.cancelRun(archive))
+        self.assertFalse(os.path.exists(archive.archive_filename()))
+        self.assertFalse(os.path.exists(archive.archive_filename() +
+                                        '.new'))
+
+    def testCancelLeavesNoVolumes(self):
+        """A cancelled run into volumes leaves none of them."""
+        for archive in [dir_archive.ZipDirArchive(self._contentTreeRoot,
+                                                  volumes=2),
+                        dir_archive.TgzDirArchive(self._contentTreeRoot,
+                                                  volumes=2)]:
+            self.assertTrue(self.cancelRun(archive))
+            self.assertEqual([], archive.volume_filenames())
+
+
+class MemoryTreeTest(ArchiveTest, unittest.TestCase):
+    """Defines unit tests for archives extracted into memory."""
+
+    def toTestArchive(self, dirname=None, archiveBase=None):
+        """Return the instance to archive."""
+        return dir_archive.ZipDirArchive(dirname, archiveBase)
+
+    def toTestExtract(self, archiveBase=None):
+        """Return the instance from which to extract."""
+        return dir_archive.ZipArchive(archiveBase)
+
+    def expectedContent(self):
+        """Return the mapping of member names to expected content."""
+        expected = {}
+        for root, dirs, files in os.walk(self._contentTreeRoot):
+            for filename in files:
+                expected['/'.join([root, filename])] = \
+                    self._content.get(filename, '').encode('utf-8')
+        return expected
+
+    def assertMemoryTree(self, tree):
+        """Verify the tree maps each file to its content."""
+        expected = self.expectedContent()
+        self.assertEqual(sorted(expected), sorted(tree))
+        for name, content in expected.items():
+            self.assertEqual(content, bytes(tree[name]))
+        self.assertRaises(KeyError, tree.__getitem__, self._contentTreeRoot)
+
+    def testZipStoredMembersAreViews(self):
+        """Stored members are views; deflated ones are decompressed."""
+        archive = dir_archive.ZipDirArchive(
+            self._contentTreeRoot,
+            policy=dir_archive.CompressionPolicy('store'))
+        archive.archive()
+        with self.toTestExtract(archive._archive_base).extract_to_memory(
+                ) as tree:
+            self.assertMemoryTree(tree)
+            self.assertTrue(all(isinstance(tree[name], memoryview) for
+                                name in tree))
+            self.assertEqual(0, tree.used)
+
+        archive = self.toTestArchive(self._contentTreeRoot)
+        archive.archive()
+        with self.toTestExtract(archive._archive_base).extract_to_memory(
+                ) as tree:
+            self.assertEqual(0, tree.used)
+            self.assertMemoryTree(tree)
+            self.assertTrue(all(isinstance(tree[name], bytes) for
+                                name in tree))
+            self.assertEqual(sum(len(text) for text in
+                                 self._content.values()), tree.used)
+
+    def testBudgetSpillsToTemporaryDirectory(self):
+        """Content beyond the budget is spilled and removed at close."""
+        self.toTestArchive(self._contentTreeRoot).archive()
+        dir_archive.TgzDirArchive(self._contentTreeRoot).archive()
+        for extractor in [dir_archive.ZipArchive(self._contentTreeRoot),
+                          dir_archive.TgzArchive(self._contentTreeRoot)]:
+            tree = extractor.extract_to_memory(budget=10)
+            try:
+                self.assertMemoryTree(tree)
+                self.assertTrue(tree.used <= 10)
+                spillDir = tree._spill_dir
+                self.assertTrue(os.path.isdir(spillDir))
+            finally:
+                tree.close()
+            self.assertFalse(os.path.exists(spillDir))
+
+    def testTgzTreeHoldsRegularFiles(self):
+        """A .tgz archive extracts into memory as well."""
+        archive = dir_archive.TgzDirArchive(self._contentTreeRoot)
+        archive.archive()
+        with dir_archive.TgzArchive(archive._archive_base).\
+             extract_to_memory() as tree:
+            self.assertMemoryTree(tree)
+
+
+class VerifyArchiveTest(unittest.TestCase):
+    """Defines the unit tests for verifying damaged archives."""
+
+    def setUp(self):
+        """Set up the test fixture."""
+        self._dirname = 'integer'
+        self._cleanFixtures()
+        os.mkdir(self._dirname)
+        words = open('latin_words.txt').read().split()
+        rng = random.Random(17)
+        self._names = []
+        for number in range(8):
+            pathname = os.path.join(self._dirname, 'vitae{0}'.format(number))
+            with open(pathname, 'w') as f:
+                f.write(' '.join(rng.choice(words) for _ in range(8000)))
+            self._names.append(pathname)
+
+    def tearDown(self):
+        """Tear down the test fixture."""
+        self._cleanFixtures()
+
+    def _cleanFixtures(self):
+        """Remove all test fixtures from the OS filesystem."""
+        if os.path.isdir(self._dirname):
+            shutil.rmtree(self._dirname)
+        for ext in [dir_archive.TgzArchive.EXT, dir_archive.ZipArchive.EXT,
+                    dir_archive.TgzArchive.EXT + tgz_index.TgzIndex.EXT]:
+            if os.path.isfile(self._dirname + ext):
+                os.remove(self._dirname + ext)
+
+    def damage(self, filename, offset):
+        """Flip the bits of the byte at offset in the file filename."""
+        with open(filename, 'r+b') as f:
+            f.seek(offset)
+            value = f.read(1)[0]
+            f.seek(offset)
+            f.write(bytes([value ^ 0xff]))
+
+    def truncate(self, filename):
+        """Cut off the second half of the file filename."""
+        with open(filename, 'r+b') as f:
+            f.truncate(os.path.getsize(filename) // 2)
+
+    def writeSegmentedTgz(self):
+        """Write my directory into an indexed .tgz with many checkpoints."""
+        filename = self._dirname + dir_archive.TgzArchive.EXT
+        with open(filename, 'wb') as f:
+            gzip_file = parallel_gzip.ParallelGzipFile(
+                f, jobs=2, block_size=1 << 15, checkpoint_spacing=1 << 15)
+            tar_file = tgz_index.IndexingTarFile(fileobj=gzip_file, mode='w')
+            tar_file.add(self._dirname)
+            tar_file.close()
+            gzip_file.close()
+        index = tgz_index.TgzIndex([tgz_index.Checkpoint(*checkpoint) for
+                                    checkpoint in gzip_file.checkpoints],
+                                   tar_file.member_offsets)
+        self.assertTrue(len(index.checkpoints) > 2)
+        index.save(filename + tgz_index.TgzIndex.EXT)
+        return filename
+
+    def testZipVerifyFindsCorruptMember(self):
+        """A damaged .zip member is reported as corrupt by name."""
+        dir_archive.ZipDirArchive(self._dirname).archive()
+        filename = self._dirname + dir_archive.ZipArchive.EXT
+        with zip_central_dir.ZipCentralDirectory(filename) as listing:
+            info = listing.getinfo(self._names[3])
+            offset = listing.data_offset(info) + info.compress_size // 2
+        self.damage(filename, offset)
+        for jobs in [1, 2]:
+            report = dir_archive.ZipArchive(self._dirname, jobs=jobs).verify()
+            self.assertEqual(len(self._names), report.members)
+            self.assertEqual([(self._names[3], 'corrupt')],
+                             [(problem.name, problem.kind) for
+                              problem in report.problems])
+
+    def testZipVerifyReportsUnreadableArchive(self):
+        """A .zip cut in half cannot be read at all."""
+        dir_archive.ZipDirArchive(self._dirname).archive()
+        self.truncate(self._dirname + dir_archive.ZipArchive.EXT)
+        report = dir_archive.ZipArchive(self._dirname).verify()
+        self.assertEqual([(None, 'unreadable')],
+                         [(problem.name, problem.kind) for
+                          problem in report.problems])
+
+    def testZipVerifyReportsCutEndRecord(self):
+        """A .zip cut inside its end record cannot be read at all."""
+        dir_archive.ZipDirArchive(self._dirname).archive()
+        filename = self._dirname + dir_archive.ZipArchive.EXT
+        with open(filename, 'r+b') as f:
+            f.truncate(os.path.getsize(filename) - 10)
+        for jobs in [1, 2]:
+            report = dir_archive.ZipArchive(self._dirname, jobs=jobs).verify()
+            self.assertEqual([(None, 'unreadable')],
+                             [(problem.name, problem.kind) for
+                              problem in report.problems])
+
+    def testTgzVerifyFindsDamage(self):
+        """A damaged or cut .tgz is reported in one pass."""
+        archive = dir_archive.TgzDirArchive(self._dirname)
+        archive.archive()
+        filename = archive.archive_filename()
+        self.damage(filename, os.path.getsize(filename) // 2)
+        report = dir_archive.TgzArchive(self._dirname).verify()
+        self.assertEqual(['corrupt'], [problem.kind for
+                                       problem in report.problems])
+
+        archive.archive()
+        self.truncate(filename)
+        report = dir_archive.TgzArchive(self._dirname).verify()
+        self.assertEqual(['truncated'], [problem.kind for
+                                         problem in report.problems])
+        self.assertTrue(report.problems[0].name in self._names)
+
+    def testTgzVerifyReadsOnlyRegularFiles(self):
+        """Links verify as members without content."""
+        os.symlink('vitae0', os.path.join(self._dirname, 'ligamen'))
+        os.link(self._names[0], os.path.join(self._dirname, 'copula'))
+        archive = dir_archive.TgzDirArchive(self._dirname)
+        archive.archive()
+        report = dir_archive.TgzArchive(self._dirname).verify()
+        self.assertTrue(report.is_ok(), report.problems)
+        self.assertEqual(len(self._names) + 3, report.members)
+
+        self.truncate(archive.archive_filename())
+        report = dir_archive.TgzArchive(self._dirname).verify()
+        self.assertEqual(['truncated'], [problem.kind for
+                                         problem in report.problems])
+
+    def testTgzVerifySegments(self):
+        """Indexed .tgz segments are verified in parallel."""
+        filename = self.writeSegmentedTgz()
+        report = dir_archive.TgzArchive(self._dirname, jobs=2).verify()
+        self.assertTrue(report.is_ok(), report.problems)
+        self.assertEqual(len(self._names) + 1, report.members)
+        with open(filename, 'rb') as f:
+            self.assertEqual(len(gzip.decompress(f.read())), report.bytes)
+
+        self.damage(filename, os.path.getsize(filename) // 2)
+        report = dir_archive.TgzArchive(self._dirname, jobs=2).verify()
+        self.assertFalse(report.is_ok())
+        self.assertEqual('corrupt', report.problems[0].kind)
+
+    def testTgzVerifySegmentsFindsTruncation(self):
+        """A cut indexed .tgz is reported as truncated."""
+        filename = self.writeSegmentedTgz()
+        self.truncate(filename)
+        report = dir_archive.TgzArchive(self._dirname, jobs=2).verify()
+        self.assertTrue('truncated' in [problem.kind for
+                                        problem in report.problems])
+
             
 def suite():
     """Returns the suite of unit tests in this module."""
     suites = [
         unittest.TestLoader().loadTestsFromTestCase(DirArchiveNameTest),
         unittest.TestLoader().loadTestsFromTestCase(TgzArchiveTest),
+        unittest.TestLoader().loadTestsFromTestCase(ParallelTgzArchiveTest),
+        unittest.TestLoader().loadTestsFromTestCase(
+            ParallelExtractTgzArchiveTest),
+        unittest.TestLoader().loadTestsFromTestCase(IndexedTgzArchiveTest),
+        unittest.TestLoader().loadTestsFromTestCase(LocalityTgzArchiveTest),
         unittest.TestLoader().loadTestsFromTestCase(ZipArchiveTest),
+        unittest.TestLoader().loadTestsFromTestCase(ParallelZipArchiveTest),
+        unittest.TestLoader().loadTestsFromTestCase(LocalityZipArchiveTest),
+        unittest.TestLoader().loadTestsFromTestCase(ReadAheadTest),
+        unittest.TestLoader().loadTestsFromTestCase(
+            ParallelExtractZipArchiveTest),
+        unittest.TestLoader().loadTestsFromTestCase(ResumableArchiveTest),
+        unittest.TestLoader().loadTestsFromTestCase(SyncZipArchiveTest),
+        unittest.TestLoader().loadTestsFromTestCase(SplitArchiveTest),
+        unittest.TestLoader().loadTestsFromTestCase(TgzToZipArchiveTest),
+        unittest.TestLoader().loadTestsFromTestCase(ZipToTgzArchiveTest),
+        unittest.TestLoader().loadTestsFromTestCase(AsyncArchiveTest),
+        unittest.TestLoader().loadTestsFromTestCase(MemoryTreeTest),
+        unittest.TestLoader().loadTestsFromTestCase(IncrementalZipArchiveTest),
+        unittest.TestLoader().loadTestsFromTestCase(CompressionPolicyTest),
+        unittest.TestLoader().loadTestsFromTestCase(VerifyArchiveTest),
         ]
     return unittest.TestSuite(suites)
 
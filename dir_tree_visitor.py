@@ -1,7 +1,31 @@
-"""Defines a function to visit every node in a specified directory tree."""
+"""Defines a function to visit every node in a specified directory tree.
 
+visit_files visits every file of a tree in a pool of threads or
+processes: a thread walks the tree into a bounded queue of work while
+the pool applies the visitor to the files queued, so a slow visitor
+neither holds up the walk nor lets it run arbitrarily far ahead.
+"""
 
+
+from collections import deque
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
 import os
+import queue
+import threading
+
+from dir_walker import walk
+
+
+# The default number of files visited at once by visit_files.
+VISIT_JOBS = os.cpu_count() or 1
+
+# The default number of files handed to a worker at once by visit_files.
+VISIT_BATCH = 16
+
+# The seconds visit_files and its walking thread wait before checking
+# for other work.
+POLL_SECONDS = 0.05
 
 
 def dir_visitor(root, visitor):
@@ -24,15 +48,15 @@ def dir_visitor(root, visitor):
 class SimpleVisitor(object):
     """A simple visitor wrapping a callable expecting the pathname of
     files to visit."""
-    
-    def __init(callable):
+
+    def __init__(self, callable):
         """SimpleVisitor(callable) -> o
 
         Initialize an instance with the specified callable."""
-        
+
         self._simple_visitor = callable
 
-    def __call__(root_pathname, dirs, files):
+    def __call__(self, root_pathname, dirs, files):
         """Invokes this visitor passing the root pathname, the list of
         directories in that root, and the list of files in that
         root."""
@@ -41,3 +65,99 @@ class SimpleVisitor(object):
             file_pathname = os.path.join(root_pathname, file)
             self._simple_visitor(file_pathname)
 
+
+def visit_files(root, visitor, exclude_dirs=(), jobs=VISIT_JOBS,
+                processes=False, ordered=True, max_pending=None,
+                batch_size=VISIT_BATCH):
+    """Applies the function visitor to the pathname of each file in
+    the directory tree root, excluding the directories exclude_dirs
+    (see dir_walker.walk_entries), in jobs workers.
+
+    Note that this function is a generator yielding a (pathname,
+    result) pair per file, result being visitor(pathname). Files are
+    handed to the pool batch_size at a time, in threads or, if
+    processes is True, in processes; visitor and its results must then
+    be picklable. If ordered is True, the pairs come in walk order;
+    otherwise, as soon as their batch is visited. At most max_pending
+    batches (by default, four per job) are queued and as many are in
+    flight, so a slow visitor or caller slows the walk down instead of filling
+    memory. Errors of the walk or the visitor are raised to the
+    caller. Closing the generator stops the walk and the pool."""
+    max_pending = max(1, max_pending or 4 * jobs)
+    work = queue.Queue(max_pending)
+    stop = threading.Event()
+    walker = threading.Thread(target=_walk_into, args=(
+        root, exclude_dirs, batch_size, work, stop))
+    walker.daemon = True
+    walker.start()
+    if processes:
+        executor = ProcessPoolExecutor(max_workers=jobs)
+    else:
+        executor = ThreadPoolExecutor(max_workers=jobs)
+    try:
+        running = deque()
+        walking = True
+        while walking or running:
+            while walking and (len(running) < max_pending):
+                try:
+                    batch = work.get(block=not running)
+                except queue.Empty:
+                    break
+                if batch is None:
+                    walking = False
+                elif isinstance(batch, BaseException):
+                    raise batch
+                else:
+                    running.append(executor.submit(_visit_batch, visitor,
+                                                   batch))
+            if not running:
+                continue
+            # While walking, wake up now and then to hand out new work.
+            timeout = POLL_SECONDS if walking else None
+            if ordered:
+                done, _ = wait([running[0]], timeout=timeout)
+            else:
+                done, _ = wait(running, timeout=timeout,
+                               return_when=FIRST_COMPLETED)
+            for future in done:
+                running.remove(future)
+                for visited in future.result():
+                    yield visited
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        walker.join()
+
+
+def _walk_into(root, exclude_dirs, batch_size, work, stop):
+    """Put the pathnames of the files beneath root into work,
+    batch_size at a time, then None; puts the error instead if the walk
+    fails. Returns early once stop is set."""
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                work.put(item, timeout=POLL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        batch = []
+        for pathname in walk(root, exclude_dirs):
+            batch.append(pathname)
+            if len(batch) == batch_size:
+                if not put(batch):
+                    return
+                batch = []
+        if batch and not put(batch):
+            return
+        put(None)
+    except Exception as error:
+        put(error)
+
+
+def _visit_batch(visitor, pathnames):
+    """Returns the (pathname, visitor(pathname)) pairs of pathnames."""
+    return [(pathname, visitor(pathname)) for pathname in pathnames]
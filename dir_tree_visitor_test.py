@@ -0,0 +1,124 @@
+#! env python
+
+
+"""Defines and runs the unit tests for the dir_tree_visitor module."""
+
+
+import os
+import shutil
+import threading
+import time
+import unittest
+
+import dir_tree_visitor
+import dir_walker
+
+
+def file_size(pathname):
+    """A picklable visitor returning the size of the file pathname."""
+    return os.path.getsize(pathname)
+
+
+class DirTreeVisitorTest(unittest.TestCase):
+    """Defines the unit tests for visiting directory trees."""
+
+    def setUp(self):
+        """Set up the test fixture."""
+        self._root = 'visitare'
+        self._cleanFixtures()
+        self._files = []
+        for i in range(40):
+            pathname = os.path.join(self._root, 'via{0}'.format(i % 4),
+                                    'tabula{0:02d}'.format(i))
+            if not os.path.isdir(os.path.dirname(pathname)):
+                os.makedirs(os.path.dirname(pathname))
+            with open(pathname, 'w') as f:
+                f.write('x' * i)
+            self._files.append(pathname)
+        os.makedirs(os.path.join(self._root, '.svn'))
+        with open(os.path.join(self._root, '.svn', 'entries'), 'w') as f:
+            f.write('entries')
+
+    def tearDown(self):
+        """Tear down the test fixture."""
+        self._cleanFixtures()
+
+    def _cleanFixtures(self):
+        """Remove all test fixtures from the OS filesystem."""
+        if os.path.isdir(self._root):
+            shutil.rmtree(self._root)
+
+    def expectedSizes(self):
+        """Return the (pathname, size) pairs of the fixture files."""
+        return [(pathname, os.path.getsize(pathname)) for pathname in
+                dir_walker.walk(self._root, ['.svn'])]
+
+    def testSimpleVisitorVisitsEveryFile(self):
+        """SimpleVisitor calls its callable with each file pathname."""
+        visited = []
+        dir_tree_visitor.dir_visitor(
+            self._root, dir_tree_visitor.SimpleVisitor(visited.append))
+        self.assertEqual(sorted(self._files +
+                                [os.path.join(self._root, '.svn',
+                                              'entries')]),
+                         sorted(visited))
+
+    def testOrderedVisitFollowsWalk(self):
+        """Ordered results come in walk order."""
+        self.assertEqual(self.expectedSizes(),
+                         list(dir_tree_visitor.visit_files(
+                             self._root, file_size, ['.svn'], jobs=4,
+                             batch_size=3, max_pending=2)))
+
+    def testUnorderedVisitYieldsEveryFile(self):
+        """Unordered results hold every file once."""
+        def slow_size(pathname):
+            # Delay early files so that later ones overtake them.
+            if pathname.endswith('0'):
+                time.sleep(0.02)
+            return file_size(pathname)
+        self.assertEqual(sorted(self.expectedSizes()),
+                         sorted(dir_tree_visitor.visit_files(
+                             self._root, slow_size, ['.svn'], jobs=4,
+                             ordered=False, batch_size=2)))
+
+    def testVisitInProcesses(self):
+        """A picklable visitor runs in a pool of processes."""
+        self.assertEqual(self.expectedSizes(),
+                         list(dir_tree_visitor.visit_files(
+                             self._root, file_size, ['.svn'], jobs=2,
+                             processes=True)))
+
+    def testVisitorErrorsReachCaller(self):
+        """An error of the visitor is raised to the caller."""
+        def failing(pathname):
+            raise ValueError(pathname)
+        self.assertRaises(ValueError, list, dir_tree_visitor.visit_files(
+            self._root, failing))
+
+    def testWalkErrorsReachCaller(self):
+        """An error of the walk is raised to the caller."""
+        self.assertRaises(OSError, list, dir_tree_visitor.visit_files(
+            'nusquam', file_size))
+
+    def testClosingStopsWalk(self):
+        """Closing the generator early stops its walking thread."""
+        before = threading.active_count()
+        visits = dir_tree_visitor.visit_files(self._root, file_size,
+                                              jobs=1, batch_size=1,
+                                              max_pending=1)
+        next(visits)
+        visits.close()
+        self.assertEqual(before, threading.active_count())
+
+
+def suite():
+    """Returns the suite of unit tests in this module."""
+    suites = [
+        unittest.TestLoader().loadTestsFromTestCase(DirTreeVisitorTest),
+        ]
+    return unittest.TestSuite(suites)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+#! env python
+
+
+"""Compares the dir_walker walkers on a tree with slow listings."""
+
+
+from optparse import OptionParser
+import os
+import shutil
+import tempfile
+import time
+
+from dir_walker import parallel_walk, walk_entries
+
+
+def make_tree(top, directory_count, files_per_directory, fanout=8):
+    """Fill top with directory_count directories, fanout per level,
+    each holding files_per_directory empty files."""
+    directories = [top]
+    os.makedirs(top)
+    for i in range(1, directory_count):
+        pathname = os.path.join(directories[(i - 1) // fanout],
+                                'dir{0:04d}'.format(i))
+        os.mkdir(pathname)
+        directories.append(pathname)
+    for pathname in directories:
+        for j in range(files_per_directory):
+            open(os.path.join(pathname, 'file{0:03d}'.format(j)), 'w').close()
+
+
+class SlowScandir(object):
+    """An os.scandir waiting latency seconds before each listing, like
+    a network filesystem."""
+
+    def __init__(self, latency):
+        """SlowScandir(latency) -> o"""
+        self.latency = latency
+
+    def __call__(self, path):
+        """Returns os.scandir(path), late."""
+        time.sleep(self.latency)
+        return os.scandir(path)
+
+
+def time_walk(walker):
+    """Returns (seconds, files) of exhausting the walker."""
+    start = time.time()
+    files = sum(1 for _ in walker)
+    return time.time() - start, files
+
+
+def bench(dir_name, latency, jobs_list):
+    """Print the time taken by each walker to walk dir_name."""
+    scandir = SlowScandir(latency)
+    print('{0:>26} {1:>6} {2:>10} {3:>10}'.format('walker', 'jobs',
+                                                  'seconds', 'files'))
+    seconds, files = time_walk(walk_entries(dir_name, scandir=scandir))
+    print('{0:>26} {1:>6} {2:>10.2f} {3:>10}'.format('walk_entries', 1,
+                                                     seconds, files))
+    for jobs in jobs_list:
+        for ordered in [True, False]:
+            seconds, files = time_walk(parallel_walk(dir_name, jobs=jobs,
+                                                     ordered=ordered,
+                                                     scandir=scandir))
+            name = 'parallel_walk' + ('' if ordered else ' (unordered)')
+            print('{0:>26} {1:>6} {2:>10.2f} {3:>10}'.format(name, jobs,
+                                                             seconds, files))
+
+
+if __name__ == '__main__':
+    usage = """%prog [options] [dir_name]
+
+    Measure the time dir_walker.walk_entries and dir_walker.parallel_walk
+    take to walk dir_name when each directory listing is delayed, as on
+    NFS or SMB mounts. Without dir_name, walk a generated tree.
+    """
+    parser = OptionParser(usage=usage)
+    parser.add_option('-d', '--directories', type='int', default=500,
+                      help='Directories in the generated tree (default 500).')
+    parser.add_option('-f', '--files', type='int', default=20,
+                      help='Files per generated directory (default 20).')
+    parser.add_option('-l', '--latency', type='float', default=2.0,
+                      help='Milliseconds added to each listing (default 2).')
+    parser.add_option('-j', '--jobs', default='4,16,64',
+                      help='Comma-separated listing concurrencies to compare.')
+    opts, args = parser.parse_args()
+    if len(args) > 1:
+        parser.error('At most one dir_name allowed.')
+
+    jobs_list = sorted(set(int(jobs) for jobs in opts.jobs.split(',')))
+    work_dir = tempfile.mkdtemp(prefix='dir_walker_bench')
+    try:
+        if args:
+            dir_name = args[0]
+        else:
+            dir_name = os.path.join(work_dir, 'tree')
+            make_tree(dir_name, opts.directories, opts.files)
+        bench(dir_name, opts.latency / 1000.0, jobs_list)
+    finally:
+        shutil.rmtree(work_dir)
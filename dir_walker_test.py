@@ -0,0 +1,236 @@
+#! env python
+
+
+"""Defines and runs the unit tests for the dir_walker module."""
+
+
+import os
+import shutil
+import threading
+import time
+import unittest
+
+import dir_walker
+from path_matcher import PathMatcher
+
+
+class WalkTest(object):
+    """Defines the common fixture and unit tests of the walkers."""
+
+    def setUp(self):
+        """Set up the test fixture."""
+        self._root = 'ambulare'
+        self._cleanFixtures()
+        self._files = [os.path.join(self._root, 'primus'),
+                       os.path.join(self._root, 'via', 'secundus'),
+                       os.path.join(self._root, 'via', 'alta', 'tertius'),
+                       os.path.join(self._root, '.svn', 'entries'),
+                       os.path.join(self._root, 'via', '.svn', 'entries')]
+        for pathname in self._files:
+            if not os.path.isdir(os.path.dirname(pathname)):
+                os.makedirs(os.path.dirname(pathname))
+            with open(pathname, 'w') as f:
+                f.write(os.path.basename(pathname))
+        os.mkdir(os.path.join(self._root, 'vacua'))
+
+    def tearDown(self):
+        """Tear down the test fixture."""
+        self._cleanFixtures()
+
+    def _cleanFixtures(self):
+        """Remove all test fixtures from the OS filesystem."""
+        if os.path.isdir(self._root):
+            shutil.rmtree(self._root)
+
+    def testWalkYieldsAllFiles(self):
+        """Walking without exclusions yields every file."""
+        self.assertEqual(sorted(self._files),
+                         sorted(self.walk(self._root, [])))
+
+    def testWalkExcludesDirectories(self):
+        """Excluded directories are skipped at every depth."""
+        self.assertEqual(sorted(self._files[:3]),
+                         sorted(self.walk(self._root, ['.svn'])))
+
+    def testWalkIsDepthFirst(self):
+        """The files of a directory follow it before its siblings."""
+        paths = list(self.walk(self._root, ['.svn']))
+        via = os.path.join(self._root, 'via')
+        positions = [position for position, path in enumerate(paths) if
+                     path.startswith(via + os.sep)]
+        self.assertEqual(list(range(positions[0], positions[0] + 2)),
+                         positions)
+
+    def testWalkExcludesMatchedPaths(self):
+        """A PathMatcher excludes files and prunes directories by path."""
+        matcher = PathMatcher()
+        matcher.add_gitignore(['.svn/', 'via/alta', 'prim*'])
+        self.assertEqual([self._files[1]],
+                         list(self.walk(self._root, matcher)))
+
+    def testWalkFollowsLinkedDirectories(self):
+        """Symbolic links to directories are walked like directories."""
+        os.symlink('via', os.path.join(self._root, 'nexus'))
+        paths = list(self.walk(self._root, ['.svn', 'alta']))
+        self.assertTrue(os.path.join(self._root, 'nexus', 'secundus') in
+                        paths)
+
+
+class DirWalkerTest(WalkTest, unittest.TestCase):
+    """Defines the unit tests for walking directory trees."""
+
+    def walk(self, root, exclude_dirs):
+        """Return the paths of the files beneath root."""
+        return dir_walker.walk(root, exclude_dirs)
+
+    def testWalkEntriesCarryStat(self):
+        """Entries are DirEntry objects of files with their stat data."""
+        for entry in dir_walker.walk_entries(self._root):
+            self.assertTrue(isinstance(entry, os.DirEntry))
+            self.assertTrue(entry.is_file())
+            self.assertEqual(len(entry.name), entry.stat().st_size)
+
+    def testWalkDeepTree(self):
+        """Trees deeper than the recursion limit are walked."""
+        pathnames = [self._root]
+        for _ in range(1100):
+            pathnames.append(os.path.join(pathnames[-1], 'd'))
+            os.mkdir(pathnames[-1])
+        leaf = os.path.join(pathnames[-1], 'folium')
+        try:
+            with open(leaf, 'w') as f:
+                f.write('folium')
+            self.assertTrue(leaf in list(dir_walker.walk(self._root, [])))
+        finally:
+            # shutil.rmtree recurses too.
+            if os.path.exists(leaf):
+                os.remove(leaf)
+            for pathname in reversed(pathnames[1:]):
+                os.rmdir(pathname)
+
+    def testListDirHandsErrorsToOnerror(self):
+        """list_dir raises listing errors unless onerror takes them."""
+        missing = os.path.join(self._root, 'absens')
+        self.assertRaises(FileNotFoundError, dir_walker.list_dir,
+                          os.scandir, missing)
+        errors = []
+        self.assertEqual([], dir_walker.list_dir(os.scandir, missing,
+                                                 onerror=errors.append))
+        self.assertEqual(1, len(errors))
+        self.assertTrue(isinstance(errors[0], FileNotFoundError))
+
+    def testListDirAllEntries(self):
+        """Other entries are only listed, as files, if asked for."""
+        link = os.path.join(self._root, 'fractus')
+        os.symlink('absens', link)
+        listing = dir_walker.list_dir(os.scandir, self._root)
+        self.assertFalse(link in [entry.path for entry, _ in listing])
+        listing = dir_walker.list_dir(os.scandir, self._root,
+                                      follow_symlinks=False,
+                                      all_entries=True)
+        self.assertTrue((link, True) in [(entry.path, is_file) for
+                                         entry, is_file in listing])
+
+
+class SlowScandir(object):
+    """An os.scandir waiting before each listing, like a network
+    filesystem, and counting the listings running at once."""
+
+    def __init__(self, latency):
+        """Wait latency seconds per listing."""
+        self.latency = latency
+        self.running = 0
+        self.most_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, path):
+        """List path, slowly."""
+        with self._lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        time.sleep(self.latency)
+        with self._lock:
+            self.running -= 1
+        return os.scandir(path)
+
+
+class ParallelWalkTest(WalkTest, unittest.TestCase):
+    """Defines the unit tests for walking directory trees in parallel."""
+
+    def walk(self, root, exclude_dirs):
+        """Return the paths of the files beneath root."""
+        return [entry.path for entry in
+                dir_walker.parallel_walk(root, exclude_dirs, jobs=3)]
+
+    def makeWideTree(self):
+        """Add many directories to the fixture."""
+        for number in range(30):
+            pathname = os.path.join(self._root, 'lata{0}'.format(number),
+                                    'sub{0}'.format(number % 4))
+            os.makedirs(pathname)
+            with open(os.path.join(pathname, 'folium'), 'w') as f:
+                f.write('folium')
+
+    def testOrderedMatchesWalk(self):
+        """Ordered output is exactly the output of walk."""
+        self.makeWideTree()
+        expected = list(dir_walker.walk(self._root, ['.svn']))
+        for maxPending in [1, 2, None]:
+            self.assertEqual(expected, [
+                entry.path for entry in dir_walker.parallel_walk(
+                    self._root, ['.svn'], jobs=4, max_pending=maxPending,
+                    scandir=SlowScandir(0.001))])
+
+    def testUnorderedYieldsAllFiles(self):
+        """Unordered output holds every file once."""
+        self.makeWideTree()
+        expected = sorted(dir_walker.walk(self._root, ['.svn']))
+        self.assertEqual(expected, sorted(
+            entry.path for entry in dir_walker.parallel_walk(
+                self._root, ['.svn'], jobs=4, ordered=False,
+                scandir=SlowScandir(0.001))))
+
+    def testListingsAreBounded(self):
+        """Listings run concurrently but no more than allowed."""
+        self.makeWideTree()
+        for ordered in [True, False]:
+            scandir = SlowScandir(0.01)
+            list(dir_walker.parallel_walk(self._root, jobs=8,
+                                          ordered=ordered, max_pending=3,
+                                          scandir=scandir))
+            self.assertTrue(1 < scandir.most_running <= 3,
+                            scandir.most_running)
+
+    def testListingErrorsAreRaised(self):
+        """An error listing a directory reaches the caller."""
+        def scandir(path):
+            if os.path.basename(path) == 'alta':
+                raise PermissionError(path)
+            return os.scandir(path)
+
+        for ordered in [True, False]:
+            walker = dir_walker.parallel_walk(self._root, ordered=ordered,
+                                              scandir=scandir)
+            self.assertRaises(PermissionError, list, walker)
+
+    def testClosingStopsWalk(self):
+        """Closing the walk early leaves nothing running."""
+        self.makeWideTree()
+        for ordered in [True, False]:
+            walker = dir_walker.parallel_walk(self._root, ordered=ordered,
+                                              scandir=SlowScandir(0.01))
+            next(walker)
+            walker.close()
+
+
+def suite():
+    """Returns the suite of unit tests in this module."""
+    suites = [
+        unittest.TestLoader().loadTestsFromTestCase(DirWalkerTest),
+        unittest.TestLoader().loadTestsFromTestCase(ParallelWalkTest),
+        ]
+    return unittest.TestSuite(suites)
+
+
+if __name__ == '__main__':
+    unittest.main()
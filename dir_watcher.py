@@ -0,0 +1,409 @@
+#! env python
+
+
+"""Watches a directory tree for changed files.
+
+A watcher walks the tree once, as dir_walker.walk does, then reports
+each file created, modified or deleted beneath it as a WatchEvent. On
+Linux, InotifyWatcher learns of changes from the kernel (inotify,
+through ctypes) so an idle tree costs nothing; elsewhere, or if
+inotify is unavailable, PollingWatcher walks the tree again every
+poll_interval seconds and compares the times, sizes and inodes of its
+files. The watcher function picks the best available.
+"""
+
+
+from collections import namedtuple
+import ctypes
+import ctypes.util
+import errno
+from optparse import OptionParser
+import os
+import select
+import struct
+import sys
+import time
+
+from dir_walker import list_dir, walk_entries
+from path_matcher import excluder
+
+
+CREATED = 'created'
+MODIFIED = 'modified'
+DELETED = 'deleted'
+
+# The default seconds between two walks of a PollingWatcher.
+POLL_INTERVAL = 2.0
+
+# The inotify constants of <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE | IN_ONLYDIR)
+
+# The fixed part of struct inotify_event: wd, mask, cookie and len.
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class WatchEvent(namedtuple('WatchEvent', ['kind', 'path'])):
+    """The creation, modification or deletion (kind) of the file
+    path."""
+    __slots__ = ()
+
+
+def _load_inotify():
+    """Returns the C library if it provides inotify, else None."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                           ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+_libc = _load_inotify()
+
+
+def inotify_available():
+    """Determines if InotifyWatcher can watch on this platform."""
+    return _libc is not None
+
+
+class DirWatcher(object):
+    """The interface of the watchers of a directory tree."""
+
+    def __init__(self, root, exclude_dirs=()):
+        """DirWatcher(root, exclude_dirs=()) -> o
+
+        Constructs an instance watching the files beneath root,
+        excluding the directories exclude_dirs (see
+        dir_walker.walk_entries). Subclasses walk the tree here."""
+        self.root = root
+        self._excluded = excluder(root, exclude_dirs)
+        self._walked = []
+
+    def walk(self):
+        """Returns the paths of the files found by the initial walk, in
+        walk order."""
+        return list(self._walked)
+
+    def read(self, timeout=None):
+        """Returns the list of WatchEvent objects of the changes since
+        the last read, waiting up to timeout seconds (forever if None)
+        for one. The list is empty if none came in time."""
+        raise NotImplementedError
+
+    def __iter__(self):
+        """Yield each WatchEvent as it comes, forever."""
+        while True:
+            for event in self.read():
+                yield event
+
+    def close(self):
+        """Stop watching."""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PollingWatcher(DirWatcher):
+    """Watches a directory tree by walking it again periodically."""
+
+    def __init__(self, root, exclude_dirs=(), poll_interval=POLL_INTERVAL):
+        """PollingWatcher(root, exclude_dirs=(), poll_interval=POLL_INTERVAL)
+        -> o
+
+        Constructs an instance walking root every poll_interval
+        seconds."""
+        super(PollingWatcher, self).__init__(root, exclude_dirs)
+        self.exclude_dirs = exclude_dirs
+        self.poll_interval = poll_interval
+        self._snapshot = self._take_snapshot()
+        self._walked = list(self._snapshot)
+        self._polled = time.time()
+
+    def _take_snapshot(self):
+        """Returns a dict of the (time, size, inode) of each file path,
+        in walk order."""
+        snapshot = {}
+        for entry in walk_entries(self.root, self.exclude_dirs):
+            try:
+                file_stat = entry.stat()
+            except FileNotFoundError:
+                # Removed since its directory was listed.
+                continue
+            snapshot[entry.path] = (file_stat.st_mtime_ns,
+                                    file_stat.st_size, file_stat.st_ino)
+        return snapshot
+
+    def poll(self):
+        """Walk the tree now; returns the list of changes found."""
+        snapshot = self._take_snapshot()
+        self._polled = time.time()
+        previous = self._snapshot
+        self._snapshot = snapshot
+        events = [WatchEvent(DELETED, path) for path in previous if
+                  path not in snapshot]
+        for path, signature in snapshot.items():
+            if path not in previous:
+                events.append(WatchEvent(CREATED, path))
+            elif previous[path] != signature:
+                events.append(WatchEvent(MODIFIED, path))
+        return events
+
+    def read(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            wake = self._polled + self.poll_interval
+            if (deadline is not None) and (deadline < wake):
+                time.sleep(max(0, deadline - time.time()))
+                return []
+            time.sleep(max(0, wake - time.time()))
+            events = self.poll()
+            if events:
+                return events
+
+
+def _raise_unless_gone(error):
+    """Raise the OSError error of a listing unless its directory was
+    removed (or replaced by a file) since it was seen."""
+    if not isinstance(error, (FileNotFoundError, NotADirectoryError)):
+        raise error
+
+
+class InotifyWatcher(DirWatcher):
+    """Watches a directory tree with Linux inotify.
+
+    Each directory of the tree holds a watch, so the tree must hold no
+    more directories than /proc/sys/fs/inotify/max_user_watches
+    allows. If the kernel queue overflows, the tree is walked again
+    and the files created or deleted meanwhile reported."""
+
+    def __init__(self, root, exclude_dirs=()):
+        """InotifyWatcher(root, exclude_dirs=()) -> o
+
+        Raises OSError if inotify is unavailable or out of watches."""
+        super(InotifyWatcher, self).__init__(root, exclude_dirs)
+        if _libc is None:
+            raise OSError('inotify is not available on this platform.')
+        self._fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            error_number = ctypes.get_errno()
+            raise OSError(error_number, os.strerror(error_number))
+        self._paths = {}
+        self._wds = {}
+        self.files = set()
+        try:
+            self._walked = [event.path for event in self._add_tree(root)]
+        except:
+            self.close()
+            raise
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _add_watch(self, path):
+        """Watch the directory path; returns False if it is gone."""
+        wd = _libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            error_number = ctypes.get_errno()
+            if error_number in (errno.ENOENT, errno.ENOTDIR):
+                # Removed or replaced meanwhile.
+                return False
+            raise OSError(error_number, os.strerror(error_number), path)
+        self._paths[wd] = path
+        self._wds[path] = wd
+        return True
+
+    def _add_tree(self, top):
+        """Watch the directories of the tree top; returns a CREATED
+        event per file found, in walk order.
+
+        Each directory is watched before it is listed so that no file
+        created meanwhile goes unnoticed."""
+        events = []
+        stack = [top]
+        while stack:
+            path = stack.pop()
+            if not self._add_watch(path):
+                continue
+            subdirs = []
+            for entry, is_file in list_dir(os.scandir, path, self._excluded,
+                                           onerror=_raise_unless_gone):
+                if not is_file:
+                    subdirs.append(entry.path)
+                elif entry.path not in self.files:
+                    self.files.add(entry.path)
+                    events.append(WatchEvent(CREATED, entry.path))
+            stack.extend(reversed(subdirs))
+        return events
+
+    def _remove_tree(self, top):
+        """Stop watching the tree top; returns a DELETED event per file
+        known beneath it."""
+        prefix = os.path.join(top, '')
+        for path in [path for path in self._wds if
+                     (path == top) or path.startswith(prefix)]:
+            wd = self._wds.pop(path)
+            del self._paths[wd]
+            _libc.inotify_rm_watch(self._fd, wd)
+        gone = [path for path in self.files if path.startswith(prefix)]
+        self.files.difference_update(gone)
+        return [WatchEvent(DELETED, path) for path in sorted(gone)]
+
+    def _rescan(self):
+        """Walk the whole tree again; returns the events of the files
+        created or deleted since the last walk."""
+        known = self.files
+        self.files = set()
+        for wd in list(self._paths):
+            _libc.inotify_rm_watch(self._fd, wd)
+        self._paths.clear()
+        self._wds.clear()
+        events = [event for event in self._add_tree(self.root) if
+                  event.path not in known]
+        events.extend(WatchEvent(DELETED, path) for path in
+                      sorted(known - self.files))
+        return events
+
+    def _handle(self, wd, mask, name):
+        """Returns the events of an inotify event."""
+        if mask & IN_Q_OVERFLOW:
+            return self._rescan()
+        if mask & IN_IGNORED:
+            path = self._paths.pop(wd, None)
+            if (path is not None) and (self._wds.get(path) == wd):
+                del self._wds[path]
+            return []
+        directory = self._paths.get(wd)
+        if (directory is None) or not name:
+            return []
+        path = os.path.join(directory, name)
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                if not self._excluded(path, True):
+                    return self._add_tree(path)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                return self._remove_tree(path)
+            return []
+        if self._excluded(path, False):
+            return []
+        if mask & (IN_DELETE | IN_MOVED_FROM):
+            if path in self.files:
+                self.files.discard(path)
+                return [WatchEvent(DELETED, path)]
+        elif path in self.files:
+            return [WatchEvent(MODIFIED, path)]
+        elif os.path.isfile(path):
+            self.files.add(path)
+            return [WatchEvent(CREATED, path)]
+        return []
+
+    def _read_available(self):
+        """Returns the events of the inotify events queued."""
+        events = []
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(data,
+                                                                    offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].
+                                   rstrip(b'\0'))
+                offset += length
+                events.extend(self._handle(wd, mask, name))
+        # Writes come as many IN_MODIFY events: report one per change.
+        last_kinds = {}
+        coalesced = []
+        for event in events:
+            if ((event.kind == MODIFIED) and
+                    (last_kinds.get(event.path) in (CREATED, MODIFIED))):
+                continue
+            last_kinds[event.path] = event.kind
+            coalesced.append(event)
+        return coalesced
+
+    def read(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            wait = None if deadline is None else max(0,
+                                                     deadline - time.time())
+            ready, _, _ = select.select([self._fd], [], [], wait)
+            if ready:
+                events = self._read_available()
+                if events:
+                    return events
+            elif deadline is not None:
+                return []
+
+
+def watcher(root, exclude_dirs=(), poll_interval=POLL_INTERVAL):
+    """watcher(root, exclude_dirs=(), poll_interval=POLL_INTERVAL) -> o
+
+    Returns an InotifyWatcher of root if inotify is available, else a
+    PollingWatcher walking root every poll_interval seconds."""
+    if inotify_available():
+        try:
+            return InotifyWatcher(root, exclude_dirs)
+        except OSError:
+            # Out of inotify instances or watches.
+            pass
+    return PollingWatcher(root, exclude_dirs, poll_interval)
+
+
+if __name__ == '__main__':
+    usage = """%prog [options] dir_name
+
+    Print the files beneath dir_name, then each file created, modified
+    or deleted beneath it until interrupted.
+    """
+    parser = OptionParser(usage=usage)
+    parser.add_option('-x', '--exclude', action='append', default=[],
+                      help='Exclude directories with this name.')
+    parser.add_option('-p', '--poll', action='store_true', default=False,
+                      help='Poll even if inotify is available.')
+    parser.add_option('-i', '--interval', type='float',
+                      default=POLL_INTERVAL,
+                      help='Seconds between polls (default {0}).'.
+                      format(POLL_INTERVAL))
+    opts, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('Exactly one dir_name required.')
+
+    if opts.poll:
+        dir_watcher = PollingWatcher(args[0], opts.exclude, opts.interval)
+    else:
+        dir_watcher = watcher(args[0], opts.exclude, opts.interval)
+    with dir_watcher:
+        for path in dir_watcher.walk():
+            print(path)
+        try:
+            for event in dir_watcher:
+                print('{0} {1}'.format(event.kind, event.path))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,154 @@
+#! env python
+
+
+"""Defines and runs the unit tests for the dir_watcher module."""
+
+
+import os
+import shutil
+import time
+import unittest
+
+import dir_watcher
+from dir_watcher import CREATED, DELETED, MODIFIED, WatchEvent
+from path_matcher import PathMatcher
+
+
+class WatchTest(object):
+    """Defines the common fixture and unit tests of the watchers."""
+
+    def setUp(self):
+        """Set up the test fixture."""
+        self._root = 'vigilare'
+        self._cleanFixtures()
+        self._files = [os.path.join(self._root, 'primus'),
+                       os.path.join(self._root, 'via', 'secundus'),
+                       os.path.join(self._root, '.svn', 'entries')]
+        for pathname in self._files:
+            self.write(pathname, os.path.basename(pathname))
+        self._watcher = self.watcher(self._root, ['.svn'])
+
+    def tearDown(self):
+        """Tear down the test fixture."""
+        self._watcher.close()
+        self._cleanFixtures()
+
+    def _cleanFixtures(self):
+        """Remove all test fixtures from the OS filesystem."""
+        if os.path.isdir(self._root):
+            shutil.rmtree(self._root)
+
+    def write(self, pathname, contents):
+        """Write contents to the file pathname."""
+        if not os.path.isdir(os.path.dirname(pathname)):
+            os.makedirs(os.path.dirname(pathname))
+        with open(pathname, 'w') as f:
+            f.write(contents)
+
+    def collect(self, count, timeout=5.0):
+        """Return the events read until count came or timeout seconds
+        passed."""
+        deadline = time.time() + timeout
+        events = []
+        while (len(events) < count) and (time.time() < deadline):
+            events.extend(self._watcher.read(deadline - time.time()))
+        return events
+
+    def testWalkFindsIncludedFiles(self):
+        """The initial walk finds the files not excluded."""
+        self.assertEqual(sorted(self._files[:2]),
+                         sorted(self._watcher.walk()))
+
+    def testCreatedModifiedDeleted(self):
+        """Each kind of change is reported."""
+        pathname = os.path.join(self._root, 'via', 'tertius')
+        self.write(pathname, 'tertius')
+        self.assertEqual([WatchEvent(CREATED, pathname)], self.collect(1))
+        self.write(self._files[0], 'primus mutatus')
+        self.assertEqual([WatchEvent(MODIFIED, self._files[0])],
+                         self.collect(1))
+        os.remove(self._files[1])
+        self.assertEqual([WatchEvent(DELETED, self._files[1])],
+                         self.collect(1))
+
+    def testNewDirectoriesAreWatched(self):
+        """Files of new directories are reported, as are later changes
+        in them."""
+        pathname = os.path.join(self._root, 'nova', 'alta', 'quartus')
+        self.write(pathname, 'quartus')
+        self.assertEqual([WatchEvent(CREATED, pathname)], self.collect(1))
+        other = os.path.join(self._root, 'nova', 'alta', 'quintus')
+        self.write(other, 'quintus')
+        self.assertEqual([WatchEvent(CREATED, other)], self.collect(1))
+
+    def testRemovedDirectoriesDeleteTheirFiles(self):
+        """Removing or moving a directory away deletes its files."""
+        shutil.move(os.path.join(self._root, 'via'), 'via_vigilare')
+        try:
+            self.assertEqual([WatchEvent(DELETED, self._files[1])],
+                             self.collect(1))
+        finally:
+            shutil.rmtree('via_vigilare')
+
+    def testExcludedDirectoriesAreIgnored(self):
+        """Changes in excluded directories are not reported."""
+        self.write(self._files[2], 'entries mutatus')
+        self.write(os.path.join(self._root, 'via', '.svn', 'nova'), 'nova')
+        self.assertEqual([], self.collect(1, timeout=0.5))
+
+    def testPathMatcherExcludes(self):
+        """A PathMatcher excludes files by path."""
+        self._watcher.close()
+        matcher = PathMatcher()
+        matcher.add_gitignore(['*.tmp', '.svn/'])
+        self._watcher = self.watcher(self._root, matcher)
+        self.write(os.path.join(self._root, 'via', 'scratch.tmp'), 'tmp')
+        pathname = os.path.join(self._root, 'via', 'kept')
+        self.write(pathname, 'kept')
+        self.assertEqual([WatchEvent(CREATED, pathname)], self.collect(1))
+
+
+class PollingWatcherTest(WatchTest, unittest.TestCase):
+    """Defines the unit tests for watching by polling."""
+
+    def watcher(self, root, exclude_dirs):
+        """Return a watcher of root."""
+        return dir_watcher.PollingWatcher(root, exclude_dirs,
+                                          poll_interval=0.05)
+
+
+@unittest.skipUnless(dir_watcher.inotify_available(), 'Requires inotify.')
+class InotifyWatcherTest(WatchTest, unittest.TestCase):
+    """Defines the unit tests for watching with inotify."""
+
+    def watcher(self, root, exclude_dirs):
+        """Return a watcher of root."""
+        return dir_watcher.InotifyWatcher(root, exclude_dirs)
+
+    def testOverflowRescans(self):
+        """A queue overflow reports the changes found by a new walk."""
+        pathname = os.path.join(self._root, 'via', 'tertius')
+        self.write(pathname, 'tertius')
+        self._watcher.files.discard(self._files[0])
+        self.assertEqual(sorted([WatchEvent(CREATED, self._files[0]),
+                                 WatchEvent(CREATED, pathname)]),
+                         sorted(self._watcher._handle(
+                             -1, dir_watcher.IN_Q_OVERFLOW, '')))
+
+    def testFactoryPrefersInotify(self):
+        """The watcher function returns an InotifyWatcher."""
+        with dir_watcher.watcher(self._root) as watcher:
+            self.assertTrue(isinstance(watcher, dir_watcher.InotifyWatcher))
+
+
+def suite():
+    """Returns the suite of unit tests in this module."""
+    suites = [
+        unittest.TestLoader().loadTestsFromTestCase(PollingWatcherTest),
+        unittest.TestLoader().loadTestsFromTestCase(InotifyWatcherTest),
+        ]
+    return unittest.TestSuite(suites)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,270 @@
+#! env python
+
+
+"""Totals the disk usage of a directory tree, as du does.
+
+Directories are listed and their entries stat'ed in a pool of threads,
+so that many listings are in flight on slow filesystems. The totals
+roll up the tree as it is walked: a directory is forgotten as soon as
+all its sub-directories are done, its total added to its parent and
+kept only if it is among the largest or shallow enough to report. The
+directories listed next are the deepest waiting, so the directories
+held at once stay few even on trees of millions of entries. A file
+with several hard links is counted once, by device and inode.
+"""
+
+
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import heapq
+import json
+from optparse import OptionParser
+import os
+import sys
+import time
+
+from dir_walker import list_dir
+from path_matcher import excluder
+
+
+# The default number of directories listed at once by disk_usage.
+USAGE_JOBS = 8
+
+# The default number of largest directories reported.
+USAGE_TOP = 10
+
+
+class DirUsage(namedtuple('DirUsage', ['path', 'size', 'files',
+                                       'directories'])):
+    """The bytes used by the directory path and everything beneath it,
+    and the number of files and directories beneath it."""
+    __slots__ = ()
+
+
+class DiskUsage(object):
+    """The usage of a directory tree found by disk_usage."""
+
+    def __init__(self, root, total, largest, shallow, errors, elapsed):
+        """DiskUsage(root, total, largest, shallow, errors, elapsed) -> o
+
+        Total is the DirUsage of root, largest those of the largest
+        directories, largest first, and shallow those of the directories
+        down to the depth asked for, in path order. Errors lists the
+        messages of the entries that could not be listed or stat'ed."""
+        self.root = root
+        self.total = total
+        self.largest = largest
+        self.shallow = shallow
+        self.errors = errors
+        self.elapsed = elapsed
+
+    def as_dict(self):
+        """Returns my report as a dict of JSON types."""
+        return {'root': self.root,
+                'total': self.total._asdict(),
+                'largest': [usage._asdict() for usage in self.largest],
+                'directories': [usage._asdict() for usage in self.shallow],
+                'errors': self.errors,
+                'seconds': self.elapsed}
+
+    def to_json(self, indent=None):
+        """Returns my report as a JSON string."""
+        return json.dumps(self.as_dict(), indent=indent)
+
+
+class _Node(object):
+    """A directory whose sub-directories are not all done yet."""
+
+    __slots__ = ['path', 'parent', 'depth', 'size', 'files', 'directories',
+                 'pending']
+
+    def __init__(self, path, parent, depth, size):
+        self.path = path
+        self.parent = parent
+        self.depth = depth
+        self.size = size
+        self.files = 0
+        self.directories = 0
+        self.pending = 0
+
+
+def entry_size(file_stat, apparent):
+    """Returns the bytes used by the entry of file_stat: its apparent
+    size if apparent is True or the filesystem has no block counts,
+    else the bytes of its blocks."""
+    if apparent or not hasattr(file_stat, 'st_blocks'):
+        return file_stat.st_size
+    return file_stat.st_blocks * 512
+
+
+def scan_dir(scandir, path, excluded, apparent):
+    """scan_dir(scandir, path, excluded, apparent) -> tuple
+
+    Lists and stats the entries of the directory path, in a worker
+    thread. Returns (size, files, linked, subdirs, errors): the bytes
+    and number of its other entries linked once, the (device, inode,
+    bytes) of those linked more than once, the (path, bytes) of its
+    sub-directories not excluded and the error messages met (see
+    dir_walker.list_dir). Symbolic links are not followed."""
+    size = 0
+    files = 0
+    linked = []
+    subdirs = []
+    errors = []
+
+    def onerror(error):
+        errors.append(str(error))
+
+    for entry, is_file in list_dir(scandir, path, excluded,
+                                   follow_symlinks=False, all_entries=True,
+                                   onerror=onerror):
+        try:
+            file_stat = entry.stat(follow_symlinks=False)
+        except OSError as error:
+            onerror(error)
+            continue
+        entry_bytes = entry_size(file_stat, apparent)
+        if not is_file:
+            subdirs.append((entry.path, entry_bytes))
+        elif file_stat.st_nlink > 1:
+            linked.append((file_stat.st_dev, file_stat.st_ino, entry_bytes))
+        else:
+            size += entry_bytes
+            files += 1
+    return size, files, linked, subdirs, errors
+
+
+def disk_usage(root, exclude_dirs=(), jobs=USAGE_JOBS, top=USAGE_TOP,
+               max_depth=1, apparent=False, max_pending=None,
+               scandir=os.scandir):
+    """disk_usage(root, exclude_dirs=(), jobs=USAGE_JOBS, top=USAGE_TOP,
+    max_depth=1, apparent=False, max_pending=None, scandir=os.scandir)
+    -> DiskUsage
+
+    Totals the bytes used beneath root, excluding the directories
+    exclude_dirs (see dir_walker.walk_entries), listing up to jobs
+    directories at once and at most max_pending (by default, four per
+    job) queued. Reports the top largest directories and those at most
+    max_depth below root. Bytes are those of the blocks used unless
+    apparent is True."""
+    start = time.time()
+    excluded = excluder(root, exclude_dirs)
+    max_pending = max(1, max_pending or 4 * jobs)
+    seen = set()
+    largest = []
+    shallow = []
+    errors = []
+    waiting = [_Node(root, None, 0, entry_size(os.lstat(root), apparent))]
+    total = []
+
+    def finish(node):
+        # Roll the totals of node, and of the ancestors it completes, up.
+        while node is not None:
+            usage = DirUsage(node.path, node.size, node.files,
+                             node.directories)
+            if node.depth <= max_depth:
+                shallow.append(usage)
+            if top > 0:
+                if len(largest) < top:
+                    heapq.heappush(largest, (usage.size, usage.path, usage))
+                elif usage.size > largest[0][0]:
+                    heapq.heappushpop(largest,
+                                      (usage.size, usage.path, usage))
+            parent = node.parent
+            if parent is None:
+                total.append(usage)
+                return
+            parent.size += node.size
+            parent.files += node.files
+            parent.directories += node.directories + 1
+            parent.pending -= 1
+            node = parent if parent.pending == 0 else None
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        running = {}
+        while waiting or running:
+            # The deepest directories waiting are listed first.
+            while waiting and (len(running) < max_pending):
+                node = waiting.pop()
+                running[executor.submit(scan_dir, scandir, node.path,
+                                        excluded, apparent)] = node
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                size, files, linked, subdirs, scan_errors = future.result()
+                errors.extend(scan_errors)
+                node.size += size
+                node.files += files
+                for device, inode, entry_bytes in linked:
+                    if (device, inode) not in seen:
+                        seen.add((device, inode))
+                        node.size += entry_bytes
+                        node.files += 1
+                node.pending = len(subdirs)
+                if subdirs:
+                    waiting.extend(_Node(path, node, node.depth + 1,
+                                         entry_bytes) for path, entry_bytes
+                                   in reversed(subdirs))
+                else:
+                    finish(node)
+
+    return DiskUsage(root, total[0],
+                     [usage for _, _, usage in sorted(largest, reverse=True)],
+                     sorted(shallow), errors, time.time() - start)
+
+
+def human_size(size):
+    """Returns size in bytes as a short string such as 1.5G."""
+    for unit in ['', 'K', 'M', 'G', 'T']:
+        if size < 1024:
+            break
+        size /= 1024.0
+    else:
+        unit = 'P'
+    if unit:
+        return '{0:.1f}{1}'.format(size, unit)
+    return '{0}'.format(size)
+
+
+if __name__ == '__main__':
+    usage = """%prog [options] dir_name
+
+    Print the disk usage of the directories of dir_name down to a depth
+    and of its largest directories, or a JSON report of both.
+    """
+    parser = OptionParser(usage=usage)
+    parser.add_option('-x', '--exclude', action='append', default=[],
+                      help='Exclude directories with this name.')
+    parser.add_option('-d', '--depth', type='int', default=1,
+                      help='Print directories this deep (default 1).')
+    parser.add_option('-n', '--top', type='int', default=USAGE_TOP,
+                      help='Print this many largest directories (default'
+                      ' {0}).'.format(USAGE_TOP))
+    parser.add_option('-j', '--jobs', type='int', default=USAGE_JOBS,
+                      help='List this many directories at once (default'
+                      ' {0}).'.format(USAGE_JOBS))
+    parser.add_option('-a', '--apparent-size', action='store_true',
+                      default=False, dest='apparent',
+                      help='Count apparent sizes instead of blocks.')
+    parser.add_option('--json', action='store_true', default=False,
+                      help='Print a JSON report.')
+    opts, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('Exactly one dir_name required.')
+
+    usage = disk_usage(args[0], opts.exclude, opts.jobs, opts.top,
+                       opts.depth, opts.apparent)
+    if opts.json:
+        print(usage.to_json(indent=2))
+    else:
+        for dir_usage in usage.shallow:
+            print('{0:>8} {1}'.format(human_size(dir_usage.size),
+                                      dir_usage.path))
+        print('\nLargest directories:')
+        for dir_usage in usage.largest:
+            print('{0:>8} {1}'.format(human_size(dir_usage.size),
+                                      dir_usage.path))
+        print('\n{0} files, {1} directories in {2:.3f} seconds.'.format(
+            usage.total.files, usage.total.directories, usage.elapsed))
+        for message in usage.errors:
+            sys.stderr.write(message + '\n')
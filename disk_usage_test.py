@@ -0,0 +1,122 @@
+#! env python
+
+
+"""Defines and runs the unit tests for the disk_usage module."""
+
+
+import json
+import os
+import shutil
+import unittest
+
+import disk_usage
+
+
+class DiskUsageTest(unittest.TestCase):
+    """Defines the unit tests for totalling disk usage."""
+
+    def setUp(self):
+        """Set up the test fixture."""
+        self._root = 'mensurare'
+        self._cleanFixtures()
+        sizes = {os.path.join('primus'): 100,
+                 os.path.join('via', 'secundus'): 2000,
+                 os.path.join('via', 'alta', 'tertius'): 30000,
+                 os.path.join('iter', 'quartus'): 400,
+                 os.path.join('.svn', 'entries'): 5}
+        for name, size in sizes.items():
+            pathname = os.path.join(self._root, name)
+            if not os.path.isdir(os.path.dirname(pathname)):
+                os.makedirs(os.path.dirname(pathname))
+            with open(pathname, 'wb') as f:
+                f.write(b'x' * size)
+        self._dirSize = os.lstat(self._root).st_size
+
+    def tearDown(self):
+        """Tear down the test fixture."""
+        self._cleanFixtures()
+
+    def _cleanFixtures(self):
+        """Remove all test fixtures from the OS filesystem."""
+        if os.path.isdir(self._root):
+            shutil.rmtree(self._root)
+
+    def usage(self, **kwargs):
+        """Return the apparent usage of the fixture without .svn."""
+        return disk_usage.disk_usage(self._root, ['.svn'], apparent=True,
+                                     **kwargs)
+
+    def testTotalsRollUp(self):
+        """Each directory totals everything beneath it."""
+        usage = self.usage(jobs=2, max_pending=1)
+        self.assertEqual(disk_usage.DirUsage(self._root,
+                                             32500 + 4 * self._dirSize, 4, 3),
+                         usage.total)
+        shallow = dict((dir_usage.path, dir_usage) for dir_usage in
+                       usage.shallow)
+        self.assertEqual(sorted([self._root,
+                                 os.path.join(self._root, 'via'),
+                                 os.path.join(self._root, 'iter')]),
+                         sorted(shallow))
+        self.assertEqual(32000 + 2 * self._dirSize,
+                         shallow[os.path.join(self._root, 'via')].size)
+        self.assertEqual([], usage.errors)
+
+    def testLargestDirectories(self):
+        """The largest directories come largest first."""
+        usage = self.usage(top=2, max_depth=0)
+        self.assertEqual([self._root, os.path.join(self._root, 'via')],
+                         [dir_usage.path for dir_usage in usage.largest])
+        self.assertEqual([self._root],
+                         [dir_usage.path for dir_usage in usage.shallow])
+
+    def testHardLinksCountOnce(self):
+        """A file linked twice is counted once."""
+        before = self.usage().total
+        os.link(os.path.join(self._root, 'via', 'alta', 'tertius'),
+                os.path.join(self._root, 'iter', 'tertius'))
+        after = self.usage().total
+        self.assertEqual(before.size, after.size)
+        self.assertEqual(before.files, after.files)
+
+    def testSymbolicLinksAreNotFollowed(self):
+        """A linked directory counts as the link only."""
+        os.symlink('via', os.path.join(self._root, 'nexus'))
+        usage = self.usage()
+        self.assertEqual(5, usage.total.files)
+        self.assertEqual(3, usage.total.directories)
+
+    def testJsonReport(self):
+        """The report survives a trip through JSON."""
+        report = json.loads(self.usage().to_json())
+        self.assertEqual(self._root, report['root'])
+        self.assertEqual(4, report['total']['files'])
+        self.assertEqual(3, len(report['directories']))
+
+    def testUnreadableDirectoriesAreReported(self):
+        """Errors listing a directory are collected, not raised."""
+        def failing_scandir(path):
+            if path.endswith('iter'):
+                raise PermissionError(13, 'Permission denied', path)
+            return os.scandir(path)
+        usage = self.usage(scandir=failing_scandir)
+        self.assertEqual(3, usage.total.files)
+        self.assertEqual(1, len(usage.errors))
+
+    def testHumanSize(self):
+        """Sizes print in the largest unit below 1024."""
+        self.assertEqual('512', disk_usage.human_size(512))
+        self.assertEqual('1.5K', disk_usage.human_size(1536))
+        self.assertEqual('2.0G', disk_usage.human_size(2 << 30))
+
+
+def suite():
+    """Returns the suite of unit tests in this module."""
+    suites = [
+        unittest.TestLoader().loadTestsFromTestCase(DiskUsageTest),
+        ]
+    return unittest.TestSuite(suites)
+
+
+if __name__ == '__main__':
+    unittest.main()
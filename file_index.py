@@ -0,0 +1,240 @@
+#! env python
+
+
+"""A persistent index of the files of a directory tree.
+
+A FileIndex keeps the size, time, inode and mode of every file beneath
+a root directory in an SQLite database. Refreshing the index lists
+again only the directories whose time changed since the last refresh:
+adding, removing or renaming an entry changes the time of its
+directory. Rewriting a file in place does not, so the size and time
+of such files are only refreshed by a full refresh.
+"""
+
+
+from collections import namedtuple
+from optparse import OptionParser
+import os
+import sqlite3
+import time
+
+from dir_walker import list_dir
+from path_matcher import excluder
+
+
+# The name of the default index database, in the current directory.
+INDEX_FILENAME = '.file_index.sqlite'
+
+# Directories changed this recently (in nanoseconds) before a refresh
+# may change again within the resolution of their time stamp; they are
+# listed again by the next refresh.
+RACY_NS = 2 * 10 ** 9
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER);
+CREATE INDEX IF NOT EXISTS directories_parent ON directories (parent);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, directory TEXT, name TEXT, size INTEGER,
+    mtime_ns INTEGER, inode INTEGER, mode INTEGER);
+CREATE INDEX IF NOT EXISTS files_directory ON files (directory);
+"""
+
+
+class IndexedEntry(namedtuple('IndexedEntry', ['path', 'name', 'size',
+                                               'mtime_ns', 'ino', 'mode'])):
+    """The indexed metadata of a file, with the os.DirEntry methods the
+    walkers use."""
+    __slots__ = ()
+
+    def is_file(self, follow_symlinks=True):
+        return True
+
+    def is_dir(self, follow_symlinks=True):
+        return False
+
+    def is_symlink(self):
+        return False
+
+    def inode(self):
+        return self.ino
+
+    def stat(self, follow_symlinks=True):
+        """Returns an os.stat_result of the indexed metadata."""
+        seconds = self.mtime_ns / 1e9
+        return os.stat_result((self.mode, self.ino, 0, 1, 0, 0, self.size,
+                               int(seconds), int(seconds), int(seconds),
+                               seconds, seconds, seconds, self.mtime_ns,
+                               self.mtime_ns, self.mtime_ns))
+
+
+class FileIndex(object):
+    """A persistent index of the files beneath a root directory."""
+
+    VERSION = 1
+
+    def __init__(self, root, filename=INDEX_FILENAME):
+        """FileIndex(root, filename=INDEX_FILENAME) -> o
+
+        Constructs an instance indexing root in the SQLite database
+        filename, created if needed. Raises ValueError if filename
+        indexes another root."""
+        self.root = root
+        self.filename = filename
+        self._connection = sqlite3.connect(filename)
+        try:
+            self._connection.executescript(SCHEMA)
+            meta = dict(self._connection.execute(
+                'SELECT key, value FROM meta'))
+            if not meta:
+                with self._connection:
+                    self._connection.executemany(
+                        'INSERT INTO meta VALUES (?, ?)',
+                        [('version', str(FileIndex.VERSION)),
+                         ('root', root)])
+            elif meta.get('version') != str(FileIndex.VERSION):
+                raise ValueError('Unknown index version in {0}.'.
+                                 format(filename))
+            elif meta.get('root') != root:
+                raise ValueError('{0} indexes {1}, not {2}.'.
+                                 format(filename, meta.get('root'), root))
+        except:
+            self._connection.close()
+            raise
+
+    def close(self):
+        """Release the database."""
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def refresh(self, full=False):
+        """Bring the index up to date with the tree; returns the number
+        of directories listed.
+
+        Only the directories whose time changed are listed again,
+        unless full is True. Every directory is still stat'ed once.
+        Symbolic links to directories are followed, as walk does."""
+        started_ns = time.time_ns()
+        listed = 0
+        connection = self._connection
+        with connection:
+            stack = [(self.root, None)]
+            while stack:
+                path, parent = stack.pop()
+                try:
+                    mtime_ns = os.stat(path).st_mtime_ns
+                except FileNotFoundError:
+                    # Removed since its parent was listed.
+                    self._forget(path)
+                    continue
+                row = connection.execute(
+                    'SELECT mtime_ns FROM directories WHERE path = ?',
+                    (path,)).fetchone()
+                if (not full) and row and (row[0] == mtime_ns):
+                    subdirs = [subdir for subdir, in connection.execute(
+                        'SELECT path FROM directories WHERE parent = ?',
+                        (path,))]
+                else:
+                    subdirs = self._list(path)
+                    listed += 1
+                    if mtime_ns >= started_ns - RACY_NS:
+                        mtime_ns = -1
+                    connection.execute(
+                        'INSERT OR REPLACE INTO directories VALUES' +
+                        ' (?, ?, ?)', (path, parent, mtime_ns))
+                stack.extend((subdir, path) for subdir in reversed(subdirs))
+        return listed
+
+    def _list(self, path):
+        """List the directory path into the index; returns the paths
+        of its sub-directories."""
+        files = []
+        subdirs = []
+        for entry, is_file in list_dir(os.scandir, path):
+            if is_file:
+                file_stat = entry.stat()
+                files.append((entry.path, path, entry.name,
+                              file_stat.st_size, file_stat.st_mtime_ns,
+                              file_stat.st_ino, file_stat.st_mode))
+            else:
+                subdirs.append(entry.path)
+        connection = self._connection
+        connection.execute('DELETE FROM files WHERE directory = ?', (path,))
+        connection.executemany('INSERT OR REPLACE INTO files VALUES' +
+                               ' (?, ?, ?, ?, ?, ?, ?)', files)
+        kept = set(subdirs)
+        for subdir, in connection.execute(
+                'SELECT path FROM directories WHERE parent = ?',
+                (path,)).fetchall():
+            if subdir not in kept:
+                self._forget(subdir)
+        return subdirs
+
+    def _forget(self, path):
+        """Remove the directory path and everything beneath it."""
+        # Paths beneath path sort between these two.
+        first = path + os.sep
+        last = path + chr(ord(os.sep) + 1)
+        for table, column in [('files', 'directory'),
+                              ('directories', 'path')]:
+            self._connection.execute(
+                'DELETE FROM {0} WHERE {1} = ? OR ({1} >= ? AND {1} < ?)'.
+                format(table, column), (path, first, last))
+
+    def entries(self, exclude_dirs=()):
+        """Yield an IndexedEntry for each indexed file, excluding the
+        directories exclude_dirs (see dir_walker.walk_entries).
+
+        Files are yielded depth first, those of a directory before its
+        sub-directories. The index is not refreshed."""
+        excluded = excluder(self.root, exclude_dirs)
+        connection = self._connection
+        stack = [self.root]
+        while stack:
+            path = stack.pop()
+            for row in connection.execute(
+                    'SELECT path, name, size, mtime_ns, inode, mode' +
+                    ' FROM files WHERE directory = ? ORDER BY name',
+                    (path,)):
+                if not excluded(row[0], False):
+                    yield IndexedEntry(*row)
+            subdirs = [subdir for subdir, in connection.execute(
+                'SELECT path FROM directories WHERE parent = ?' +
+                ' ORDER BY path DESC', (path,)) if
+                       not excluded(subdir, True)]
+            stack.extend(subdirs)
+
+    def __len__(self):
+        """Returns the number of indexed files."""
+        return self._connection.execute(
+            'SELECT COUNT(*) FROM files').fetchone()[0]
+
+
+if __name__ == '__main__':
+    usage = """%prog [options] dir_name
+
+    Refresh the index of dir_name and print the number of files it
+    holds and the number of directories listed.
+    """
+    parser = OptionParser(usage=usage)
+    parser.add_option('-i', '--index', default=INDEX_FILENAME,
+                      help="""Use this index database (default
+                      {0}).""".format(INDEX_FILENAME))
+    parser.add_option('-f', '--full', action='store_true', default=False,
+                      help="""List every directory again, refreshing
+                      files rewritten in place too.""")
+    opts, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('Exactly one dir_name required.')
+
+    start = time.time()
+    with FileIndex(args[0], opts.index) as file_index:
+        listed = file_index.refresh(opts.full)
+        print('{0} files, {1} directories listed in {2:.3f} seconds.'.
+              format(len(file_index), listed, time.time() - start))
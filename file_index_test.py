@@ -0,0 +1,125 @@
+#! env python
+
+
+"""Defines and runs the unit tests for the file_index module."""
+
+
+import os
+import shutil
+import time
+import unittest
+
+import dir_walker
+import file_index
+
+
+class FileIndexTest(unittest.TestCase):
+    """Defines the unit tests for the persistent file index."""
+
+    def setUp(self):
+        """Set up the test fixture."""
+        self._root = 'indicis'
+        self._indexName = 'indicis.sqlite'
+        self._cleanFixtures()
+        self._files = [os.path.join(self._root, 'primus'),
+                       os.path.join(self._root, 'via', 'secundus'),
+                       os.path.join(self._root, 'via', 'alta', 'tertius'),
+                       os.path.join(self._root, '.svn', 'entries')]
+        for pathname in self._files:
+            self.makeFile(pathname)
+        self.ageTree()
+
+    def tearDown(self):
+        """Tear down the test fixture."""
+        self._cleanFixtures()
+
+    def _cleanFixtures(self):
+        """Remove all test fixtures from the OS filesystem."""
+        if os.path.isdir(self._root):
+            shutil.rmtree(self._root)
+        if os.path.isfile(self._indexName):
+            os.remove(self._indexName)
+
+    def makeFile(self, pathname):
+        """Create the file pathname holding its own name."""
+        if not os.path.isdir(os.path.dirname(pathname)):
+            os.makedirs(os.path.dirname(pathname))
+        with open(pathname, 'w') as f:
+            f.write(os.path.basename(pathname))
+
+    def ageTree(self):
+        """Date every directory of the tree an hour back so that the
+        index trusts their times."""
+        past = time.time() - 3600
+        for root, dirs, files in os.walk(self._root):
+            os.utime(root, (past, past))
+
+    def index(self):
+        """Return the index of the fixture."""
+        return file_index.FileIndex(self._root, self._indexName)
+
+    def testRefreshIndexesEveryFile(self):
+        """The first refresh lists every directory and file."""
+        with self.index() as index:
+            self.assertEqual(4, index.refresh())
+            self.assertEqual(sorted(self._files),
+                             sorted(entry.path for entry in index.entries()))
+            entry = [entry for entry in index.entries() if
+                     entry.name == 'secundus'][0]
+            fileStat = os.stat(self._files[1])
+            self.assertEqual(fileStat.st_size, entry.stat().st_size)
+            self.assertEqual(fileStat.st_mtime_ns, entry.stat().st_mtime_ns)
+            self.assertEqual(fileStat.st_ino, entry.inode())
+
+    def testRefreshListsOnlyChangedDirectories(self):
+        """Unchanged directories are not listed again, even later."""
+        with self.index() as index:
+            index.refresh()
+        with self.index() as index:
+            self.assertEqual(0, index.refresh())
+            self.makeFile(os.path.join(self._root, 'via', 'quartus'))
+            self.assertEqual(1, index.refresh())
+            self.assertTrue(os.path.join(self._root, 'via', 'quartus') in
+                            [entry.path for entry in index.entries()])
+            self.assertEqual(4, index.refresh(full=True))
+
+    def testRefreshForgetsRemovedDirectories(self):
+        """Files beneath a removed directory leave the index."""
+        with self.index() as index:
+            index.refresh()
+            shutil.rmtree(os.path.join(self._root, 'via'))
+            index.refresh()
+            self.assertEqual(sorted([self._files[0], self._files[3]]),
+                             sorted(entry.path for entry in index.entries()))
+
+    def testIndexOfAnotherRootRaisesError(self):
+        """An index only serves the root it was built for."""
+        self.index().close()
+        self.assertRaises(ValueError, file_index.FileIndex, 'alius',
+                          self._indexName)
+
+    def testWalkServesFromIndex(self):
+        """The walker serves the same files from the index."""
+        expected = sorted(dir_walker.walk(self._root, ['.svn']))
+        with self.index() as index:
+            self.assertEqual(expected, sorted(dir_walker.walk(
+                self._root, ['.svn'], index=index)))
+            self.assertEqual(0, index.refresh())
+
+    def testWalkRejectsIndexOfAnotherRoot(self):
+        """The walker refuses an index of another root."""
+        with self.index() as index:
+            self.assertRaises(ValueError, dir_walker.walk_entries,
+                              'alius', index=index)
+
+
+def suite():
+    """Returns the suite of unit tests in this module."""
+    suites = [
+        unittest.TestLoader().loadTestsFromTestCase(FileIndexTest),
+        ]
+    return unittest.TestSuite(suites)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,299 @@
+#! env python
+
+
+"""A compact columnar table of the files of a directory tree.
+
+A FileTable holds the metadata of millions of files without a Python
+object per file. Each file is a row of array columns: the index of its
+directory, the index of its name in a shared string pool, its size,
+time and mode. The pool packs the names, UTF-8 encoded, into a single
+buffer indexed by an array of offsets. Each directory is the index of
+its parent and of its name, so a path is only built when asked for.
+Filters return the indices of the rows selected and aggregations work
+on whole columns; both use NumPy if it is installed.
+"""
+
+
+from array import array
+import operator
+from optparse import OptionParser
+import os
+import sys
+import time
+
+from dir_walker import list_dir
+from path_matcher import excluder
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# The comparisons of FileTable.where.
+OPERATORS = {'<': operator.lt, '<=': operator.le, '>': operator.gt,
+             '>=': operator.ge, '==': operator.eq, '!=': operator.ne}
+
+
+class FileTable(object):
+    """The columnar metadata of the files beneath a root directory.
+
+    The file columns are directory, name, size, mtime_ns and mode; the
+    directory columns dir_parent and dir_name. Directory 0 is the root,
+    its parent -1 and its name the root path. String i of the pool is
+    pool[pool_offsets[i]:pool_offsets[i + 1]]. Adding rows invalidates
+    the NumPy views of the columns; adding rows while a view is alive
+    raises BufferError."""
+
+    FILE_COLUMNS = ('directory', 'name', 'size', 'mtime_ns', 'mode')
+
+    def __init__(self, root, use_numpy=None):
+        """FileTable(root, use_numpy=None) -> o
+
+        Constructs an empty table of the files beneath root. Filters and
+        aggregations use NumPy if use_numpy is True or, by default, if
+        it is installed."""
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        elif use_numpy and (numpy is None):
+            raise ValueError('NumPy is not installed.')
+        self.root = root
+        self.use_numpy = use_numpy
+        self.errors = []
+        self.pool = bytearray()
+        self.pool_offsets = array('q', [0])
+        self._string_ids = {}
+        self.dir_parent = array('i')
+        self.dir_name = array('i')
+        self.directory = array('i')
+        self.name = array('i')
+        self.size = array('q')
+        self.mtime_ns = array('q')
+        self.mode = array('I')
+        self.add_directory(-1, root)
+
+    def intern(self, string):
+        """Returns the index of string in the string pool, adding it if
+        needed."""
+        index = self._string_ids.get(string)
+        if index is None:
+            index = len(self.pool_offsets) - 1
+            self.pool.extend(string.encode('utf-8', 'surrogateescape'))
+            self.pool_offsets.append(len(self.pool))
+            self._string_ids[string] = index
+        return index
+
+    def string(self, index):
+        """Returns the string index of the string pool."""
+        return self.pool[self.pool_offsets[index]:
+                         self.pool_offsets[index + 1]].decode(
+                             'utf-8', 'surrogateescape')
+
+    def strings(self):
+        """Returns the list of the strings of the pool."""
+        return [self.string(index) for index in
+                range(len(self.pool_offsets) - 1)]
+
+    def compact(self):
+        """Drop the index of the strings interned so far, a dict with a
+        Python string per distinct name, which only serves to share
+        repeated names while rows are added. Strings interned later
+        are only shared among themselves."""
+        self._string_ids = {}
+
+    def add_directory(self, parent, name):
+        """Returns the index of the new directory name of the directory
+        parent. Parents must be added before their sub-directories."""
+        self.dir_parent.append(parent)
+        self.dir_name.append(self.intern(name))
+        return len(self.dir_parent) - 1
+
+    def add_file(self, directory, name, size, mtime_ns, mode):
+        """Add a row for the file name of the directory directory."""
+        self.directory.append(directory)
+        self.name.append(self.intern(name))
+        self.size.append(size)
+        self.mtime_ns.append(mtime_ns)
+        self.mode.append(mode)
+
+    def __len__(self):
+        """Returns the number of files."""
+        return len(self.directory)
+
+    def nbytes(self):
+        """Returns the bytes held by the columns and the string pool
+        (see compact for the index of interned strings, not counted)."""
+        return len(self.pool) + sum(
+            column.itemsize * len(column) for column in
+            [self.pool_offsets, self.dir_parent, self.dir_name,
+             self.directory, self.name, self.size, self.mtime_ns,
+             self.mode])
+
+    def column(self, name):
+        """Returns the file column name, as a NumPy view of its array if
+        I use NumPy."""
+        if name not in FileTable.FILE_COLUMNS:
+            raise ValueError('Unknown column {0}.'.format(name))
+        column = getattr(self, name)
+        if self.use_numpy:
+            return numpy.frombuffer(column, dtype=column.typecode)
+        return column
+
+    def directory_path(self, directory):
+        """Returns the path of the directory directory."""
+        names = []
+        while directory >= 0:
+            names.append(self.string(self.dir_name[directory]))
+            directory = self.dir_parent[directory]
+        return os.path.join(*reversed(names))
+
+    def path(self, row):
+        """Returns the path of the file of row."""
+        return os.path.join(self.directory_path(self.directory[row]),
+                            self.string(self.name[row]))
+
+    def paths(self, rows=None):
+        """Yield the path of the file of each of rows (by default, all
+        the rows)."""
+        if rows is None:
+            rows = range(len(self))
+        directory_paths = {}
+        for row in rows:
+            directory = self.directory[row]
+            directory_path = directory_paths.get(directory)
+            if directory_path is None:
+                directory_path = self.directory_path(directory)
+                directory_paths[directory] = directory_path
+            yield os.path.join(directory_path, self.string(self.name[row]))
+
+    def where(self, name, op, value):
+        """Returns the indices, in order, of the rows whose column name
+        compares to value as op, one of OPERATORS, says."""
+        compare = OPERATORS[op]
+        column = self.column(name)
+        if self.use_numpy:
+            return numpy.flatnonzero(compare(column, value))
+        return array('l', [row for row, cell in enumerate(column) if
+                           compare(cell, value)])
+
+    def newer_than(self, mtime_ns):
+        """Returns the indices of the rows of files modified after
+        mtime_ns nanoseconds since the epoch."""
+        return self.where('mtime_ns', '>', mtime_ns)
+
+    def total(self, name='size', rows=None):
+        """Returns the sum of the column name over rows (by default,
+        all the rows)."""
+        column = self.column(name)
+        if self.use_numpy:
+            if rows is not None:
+                column = column[rows]
+            return int(column.sum(dtype='int64'))
+        if rows is None:
+            return sum(column)
+        return sum(column[row] for row in rows)
+
+    def top_directories(self):
+        """Returns, for each directory, the index of the top-level
+        directory holding it (0 for the root itself)."""
+        tops = array('i', self.dir_parent)
+        tops[0] = 0
+        for directory in range(1, len(tops)):
+            parent = self.dir_parent[directory]
+            tops[directory] = directory if parent == 0 else tops[parent]
+        return tops
+
+    def size_by_top_level(self):
+        """Returns a dict of the total size of the files beneath each
+        top-level directory, by name; '' totals the files of the root
+        itself."""
+        tops = self.top_directories()
+        if self.use_numpy:
+            file_tops = numpy.frombuffer(tops, dtype=tops.typecode)[
+                self.column('directory')]
+            totals = numpy.zeros(len(tops), dtype='int64')
+            numpy.add.at(totals, file_tops, self.column('size'))
+            totals = totals.tolist()
+        else:
+            totals = [0] * len(tops)
+            for directory, size in zip(self.directory, self.size):
+                totals[tops[directory]] += size
+        by_name = {'': totals[0]}
+        for directory in range(1, len(tops)):
+            if self.dir_parent[directory] == 0:
+                by_name[self.string(self.dir_name[directory])] = (
+                    totals[directory])
+        return by_name
+
+
+def walk_table(root, exclude_dirs=(), scandir=os.scandir, use_numpy=None):
+    """walk_table(root, exclude_dirs=(), scandir=os.scandir,
+    use_numpy=None) -> FileTable
+
+    Walks the directory tree root as dir_walker.walk_entries does,
+    excluding the directories exclude_dirs, into a FileTable. The
+    messages of the directories that could not be listed and the files
+    that could not be stat'ed are kept in its errors; the walk goes on
+    without them. Returns the table compacted (see FileTable.compact).
+    """
+    table = FileTable(root, use_numpy)
+    excluded = excluder(root, exclude_dirs)
+
+    def onerror(error):
+        table.errors.append(str(error))
+
+    stack = [(0, iter(list_dir(scandir, root, excluded,
+                               onerror=onerror)))]
+    while stack:
+        directory, listing = stack[-1]
+        item = next(listing, None)
+        if item is None:
+            stack.pop()
+            continue
+        entry, is_file = item
+        if is_file:
+            try:
+                file_stat = entry.stat()
+            except OSError as error:
+                onerror(error)
+                continue
+            table.add_file(directory, entry.name, file_stat.st_size,
+                           file_stat.st_mtime_ns, file_stat.st_mode)
+        else:
+            subdir = table.add_directory(directory, entry.name)
+            stack.append((subdir, iter(list_dir(scandir, entry.path,
+                                                excluded,
+                                                onerror=onerror))))
+    table.compact()
+    return table
+
+
+if __name__ == '__main__':
+    usage = """%prog [options] dir_name
+
+    Print the total size of the files beneath each top-level directory
+    of dir_name.
+    """
+    parser = OptionParser(usage=usage)
+    parser.add_option('-x', '--exclude', action='append', default=[],
+                      help='Exclude directories with this name.')
+    parser.add_option('-n', '--newer', type='float', default=None,
+                      help='Also count the files modified in the last NEWER'
+                      ' days.')
+    opts, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('Exactly one dir_name required.')
+
+    start = time.time()
+    table = walk_table(args[0], opts.exclude)
+    if opts.newer is not None:
+        since_ns = int((time.time() - opts.newer * 86400) * 1e9)
+        newer = table.newer_than(since_ns)
+        print('{0} files modified in the last {1} days, {2} bytes.'.format(
+            len(newer), opts.newer, table.total(rows=newer)))
+    for name, size in sorted(table.size_by_top_level().items()):
+        print('{0:>16} {1}'.format(size, name or '.'))
+    print('{0} files, {1} table bytes, in {2:.3f} seconds.'.format(
+        len(table), table.nbytes(), time.time() - start))
+    for message in table.errors:
+        sys.stderr.write(message + '\n')
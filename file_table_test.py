@@ -0,0 +1,129 @@
+#! env python
+
+
+"""Defines and runs the unit tests for the file_table module."""
+
+
+import os
+import shutil
+import unittest
+
+import dir_walker
+import file_table
+from path_matcher import PathMatcher
+
+
+class FileTableTest(unittest.TestCase):
+    """Defines the unit tests for the columnar file table."""
+
+    use_numpy = False
+
+    def setUp(self):
+        """Set up the test fixture."""
+        self._root = 'tabulare'
+        self._cleanFixtures()
+        self._files = [os.path.join(self._root, 'primus'),
+                       os.path.join(self._root, 'via', 'secundus'),
+                       os.path.join(self._root, 'via', 'alta', 'primus'),
+                       os.path.join(self._root, 'iter', 'quartus'),
+                       os.path.join(self._root, '.svn', 'entries')]
+        for number, pathname in enumerate(self._files):
+            if not os.path.isdir(os.path.dirname(pathname)):
+                os.makedirs(os.path.dirname(pathname))
+            with open(pathname, 'w') as f:
+                f.write('x' * (10 ** number))
+            os.utime(pathname, ns=(number * 10 ** 9, number * 10 ** 9))
+        self._table = file_table.walk_table(self._root, ['.svn'],
+                                            use_numpy=self.use_numpy)
+
+    def tearDown(self):
+        """Tear down the test fixture."""
+        self._cleanFixtures()
+
+    def _cleanFixtures(self):
+        """Remove all test fixtures from the OS filesystem."""
+        if os.path.isdir(self._root):
+            shutil.rmtree(self._root)
+
+    def testTableHoldsWalkedFiles(self):
+        """The table holds the files walk yields, in walk order."""
+        self.assertEqual(list(dir_walker.walk(self._root, ['.svn'])),
+                         list(self._table.paths()))
+        self.assertEqual(4, len(self._table))
+        row = list(self._table.paths()).index(self._files[1])
+        self.assertEqual(self._files[1], self._table.path(row))
+        self.assertEqual(os.stat(self._files[1]).st_mode,
+                         self._table.mode[row])
+
+    def testNamesArePooled(self):
+        """Names repeated in the tree share one pooled string."""
+        strings = self._table.strings()
+        self.assertEqual(1, strings.count('primus'))
+        self.assertEqual(len(''.join(strings)), len(self._table.pool))
+        self.assertEqual(4 * (4 + 4 + 8 + 8 + 4) + 4 * (4 + 4) +
+                         len(self._table.pool) + 8 * (len(strings) + 1),
+                         self._table.nbytes())
+
+    def testUnreadableDirectoriesAreRecorded(self):
+        """A directory that cannot be listed is recorded and skipped."""
+        via = os.path.join(self._root, 'via')
+
+        def scandir(path):
+            if path == via:
+                raise PermissionError(13, 'Permission denied', path)
+            return os.scandir(path)
+
+        table = file_table.walk_table(self._root, ['.svn'], scandir,
+                                      use_numpy=self.use_numpy)
+        self.assertEqual(sorted([self._files[0], self._files[3]]),
+                         sorted(table.paths()))
+        self.assertEqual(1, len(table.errors))
+        self.assertTrue(via in table.errors[0])
+        self.assertEqual([], self._table.errors)
+
+    def testWhereAndNewerThan(self):
+        """Filters return the rows selected, in order."""
+        newer = self._table.newer_than(1 * 10 ** 9)
+        self.assertEqual(sorted(self._files[2:4]),
+                         sorted(self._table.paths(newer)))
+        large = self._table.where('size', '>=', 10)
+        self.assertEqual(3, len(large))
+        self.assertEqual(sorted(large), list(large))
+        self.assertEqual(1110, self._table.total(rows=large))
+        self.assertRaises(ValueError, self._table.where, 'path', '==', 0)
+
+    def testAggregations(self):
+        """Totals over the whole table and by top-level directory."""
+        self.assertEqual(1111, self._table.total())
+        self.assertEqual({'': 1, 'via': 110, 'iter': 1000},
+                         self._table.size_by_top_level())
+
+    def testPathMatcherExcludes(self):
+        """Tables honour PathMatcher exclusions too."""
+        matcher = PathMatcher()
+        matcher.add_gitignore(['.svn/', 'alta/'])
+        table = file_table.walk_table(self._root, matcher,
+                                      use_numpy=self.use_numpy)
+        self.assertEqual(sorted([self._files[0], self._files[1],
+                                 self._files[3]]),
+                         sorted(table.paths()))
+
+
+@unittest.skipUnless(file_table.numpy is not None, 'Requires NumPy.')
+class NumpyFileTableTest(FileTableTest):
+    """Defines the unit tests for the file table using NumPy."""
+
+    use_numpy = True
+
+
+def suite():
+    """Returns the suite of unit tests in this module."""
+    suites = [
+        unittest.TestLoader().loadTestsFromTestCase(FileTableTest),
+        unittest.TestLoader().loadTestsFromTestCase(NumpyFileTableTest),
+        ]
+    return unittest.TestSuite(suites)
+
+
+if __name__ == '__main__':
+    unittest.main()
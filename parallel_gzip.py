@@ -0,0 +1,196 @@
+"""Writes a gzip stream by deflating fixed-size blocks in parallel.
+
+The technique is the one used by pigz: the uncompressed stream is cut
+into blocks, each block is deflated on its own (primed with the last
+32 KiB of the previous block so the compression ratio hardly suffers)
+and ended with a sync flush, and the compressed blocks are written in
+order into a single, standard gzip member.
+"""
+
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import os
+import struct
+import time
+import zlib
+
+
+# The default amount of uncompressed data deflated by one worker.
+BLOCK_SIZE = 1 << 20
+
+# The size of the deflate window and, so, of the priming dictionary.
+WINDOW_SIZE = 1 << 15
+
+
+def deflate_block(block, dictionary, level, is_last):
+    """deflate_block(block, dictionary, level, is_last) -> bytes
+
+    Returns the raw deflate data for block. If is_last is False, the
+    data ends with a sync flush so that the next block can follow it
+    directly."""
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS,
+                                      zlib.DEF_MEM_LEVEL,
+                                      zlib.Z_DEFAULT_STRATEGY, dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    flush_mode = zlib.Z_FINISH if is_last else zlib.Z_SYNC_FLUSH
+    return compressor.compress(block) + compressor.flush(flush_mode)
+
+
+def crc32_combine(crc1, crc2, length2):
+    """crc32_combine(crc1, crc2, length2) -> int
+
+    Returns the CRC-32 of the concatenation A + B given crc1, the
+    CRC-32 of A, crc2, the CRC-32 of B, and length2, the length of B.
+    This is zlib's crc32_combine(), which the zlib module lacks."""
+    if length2 <= 0:
+        return crc1
+    # The operator appending one zero bit, then two and four bits.
+    odd = [0xedb88320] + [1 << bit for bit in range(31)]
+    even = _gf2_matrix_square(odd)
+    odd = _gf2_matrix_square(even)
+    # Append length2 zero bytes to crc1, squaring the operator for each
+    # bit of length2.
+    while True:
+        even = _gf2_matrix_square(odd)
+        if length2 & 1:
+            crc1 = _gf2_matrix_times(even, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+        odd = _gf2_matrix_square(even)
+        if length2 & 1:
+            crc1 = _gf2_matrix_times(odd, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+    return crc1 ^ crc2
+
+
+def _gf2_matrix_times(matrix, vector):
+    """Returns the product of the GF(2) matrix and vector."""
+    product = 0
+    row = 0
+    while vector:
+        if vector & 1:
+            product ^= matrix[row]
+        vector >>= 1
+        row += 1
+    return product
+
+
+def _gf2_matrix_square(matrix):
+    """Returns the square of the GF(2) matrix."""
+    return [_gf2_matrix_times(matrix, row) for row in matrix]
+
+
+class ParallelGzipFile(object):
+    """A write-only file object producing a gzip stream on many cores."""
+
+    def __init__(self, fileobj, jobs=None, block_size=BLOCK_SIZE,
+                 compresslevel=9, checkpoint_spacing=None):
+        """ParallelGzipFile(fileobj, jobs=None, block_size, ...) -> o
+
+        Constructs an instance writing the gzip stream into fileobj,
+        which only needs a write() method. Jobs is the number of worker
+        threads (None means one per CPU). If checkpoint_spacing is
+        supplied, a block start is recorded in checkpoints, as the
+        tuple (compressed_offset, uncompressed_offset, window), every
+        checkpoint_spacing uncompressed bytes or so. Decompression can
+        start from any checkpoint, priming raw inflate with the window.
+        """
+        if block_size < WINDOW_SIZE:
+            raise ValueError('Block size must be at least {0}.'.
+                             format(WINDOW_SIZE))
+        self.fileobj = fileobj
+        self.jobs = jobs if jobs else (os.cpu_count() or 1)
+        self.block_size = block_size
+        self.compresslevel = compresslevel
+
+        self._executor = ThreadPoolExecutor(max_workers=self.jobs)
+        self._pending = deque()
+        self._buffer = bytearray()
+        self._dictionary = b''
+        self._crc = 0
+        self._size = 0
+        self._compressed_size = 0
+        self.checkpoint_spacing = checkpoint_spacing
+        self.checkpoints = []
+        self._next_checkpoint = 0
+        self.closed = False
+
+        self._write_header()
+
+    def _write(self, data):
+        """Write data into my fileobj, counting the bytes written."""
+        self.fileobj.write(data)
+        self._compressed_size += len(data)
+
+    def _write_header(self):
+        """Write the gzip member header."""
+        extra_flags = b'\002' if self.compresslevel == 9 else b'\000'
+        self._write(b'\037\213\010\000' +
+                    struct.pack('<L', int(time.time())) +
+                    extra_flags + b'\377')
+
+    def _write_block(self, pending):
+        """Write the compressed block of a pending (future, checkpoint)."""
+        future, checkpoint = pending
+        if checkpoint:
+            self.checkpoints.append((self._compressed_size,) + checkpoint)
+        self._write(future.result())
+
+    def write(self, data):
+        """Compress data into the stream; returns len(data)."""
+        if self.closed:
+            raise ValueError('write() on closed ParallelGzipFile')
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[:self.block_size])
+            del self._buffer[:self.block_size]
+            self._submit(block, False)
+        return len(data)
+
+    def tell(self):
+        """Returns the number of uncompressed bytes written."""
+        return self._size + len(self._buffer)
+
+    def _submit(self, block, is_last):
+        """Queue block for compression, writing any finished blocks."""
+        checkpoint = None
+        if (self.checkpoint_spacing and
+            (self._size >= self._next_checkpoint)):
+            checkpoint = (self._size, self._dictionary)
+            self._next_checkpoint = self._size + self.checkpoint_spacing
+        self._crc = zlib.crc32(block, self._crc)
+        self._size += len(block)
+        self._pending.append((self._executor.submit(
+            deflate_block, block, self._dictionary, self.compresslevel,
+            is_last), checkpoint))
+        self._dictionary = block[-WINDOW_SIZE:]
+        # Keep a couple of blocks per worker in flight and no more.
+        while len(self._pending) > 2 * self.jobs:
+            self._write_block(self._pending.popleft())
+
+    def close(self):
+        """Finish the gzip stream. Does not close my fileobj."""
+        if self.closed:
+            return
+        try:
+            self._submit(bytes(self._buffer), True)
+            self._buffer = bytearray()
+            while self._pending:
+                self._write_block(self._pending.popleft())
+            self._write(struct.pack('<LL', self._crc,
+                                    self._size & 0xffffffff))
+        finally:
+            self.closed = True
+            self._executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,84 @@
+"""Defines and runs the unit tests for the parallel_gzip module."""
+
+
+import gzip
+import io
+import random
+import unittest
+import zlib
+
+import parallel_gzip
+
+
+class ParallelGzipFileTest(unittest.TestCase):
+    """Defines the unit tests for ParallelGzipFile."""
+
+    def setUp(self):
+        """Set up the test fixture."""
+        # Compressible text spanning many (minimum-sized) blocks.
+        words = [line.strip() for line in open('latin_words.txt')]
+        generator = random.Random(1995)
+        self._data = ' '.join(generator.choice(words) for
+                              _ in range(40000)).encode('utf-8')
+
+    def gzipped(self, data, **kwargs):
+        """Return data gzipped by a ParallelGzipFile."""
+        stream = io.BytesIO()
+        gzip_file = parallel_gzip.ParallelGzipFile(stream, **kwargs)
+        # Write in uneven pieces so blocks straddle the writes.
+        for start in range(0, len(data), 7919):
+            gzip_file.write(data[start:start + 7919])
+        gzip_file.close()
+        return stream.getvalue()
+
+    def testEmptyStreamDecompresses(self):
+        """An empty stream is a valid, empty gzip stream."""
+        self.assertEqual(b'', gzip.decompress(self.gzipped(b'', jobs=2)))
+
+    def testManyBlocksDecompress(self):
+        """A stream of many blocks decompresses to the original data."""
+        compressed = self.gzipped(self._data, jobs=4, block_size=1 << 15)
+        self.assertEqual(self._data, gzip.decompress(compressed))
+        self.assertTrue(len(compressed) < len(self._data) // 2)
+
+    def testSingleMember(self):
+        """The stream is a single gzip member."""
+        compressed = self.gzipped(self._data, jobs=4, block_size=1 << 15)
+        self.assertEqual(1, compressed.count(b'\037\213\010'))
+
+    def testTellCountsUncompressedBytes(self):
+        """Tell returns the number of uncompressed bytes written."""
+        gzip_file = parallel_gzip.ParallelGzipFile(io.BytesIO(), jobs=2,
+                                                   block_size=1 << 15)
+        gzip_file.write(self._data)
+        self.assertEqual(len(self._data), gzip_file.tell())
+        gzip_file.close()
+
+    def testSmallBlockSizeRaisesError(self):
+        """Blocks smaller than the deflate window raise an error."""
+        self.assertRaises(ValueError, parallel_gzip.ParallelGzipFile,
+                          io.BytesIO(), 2, 1024)
+
+    def testWriteAfterCloseRaisesError(self):
+        """Writing to a closed stream raises an error."""
+        gzip_file = parallel_gzip.ParallelGzipFile(io.BytesIO())
+        gzip_file.close()
+        self.assertRaises(ValueError, gzip_file.write, b'sit')
+
+    def testCrc32CombineMatchesCrc32OfConcatenation(self):
+        """Combining CRCs of two parts gives the CRC of the whole."""
+        first = b'Lorem ipsum dolor sit amet' * 1000
+        for second in [b'', b'x', b'consectetur adipiscing elit' * 3000]:
+            self.assertEqual(zlib.crc32(first + second),
+                             parallel_gzip.crc32_combine(
+                                 zlib.crc32(first), zlib.crc32(second),
+                                 len(second)))
+
+
+def suite():
+    """Returns the suite of unit tests in this module."""
+    return unittest.TestLoader().loadTestsFromTestCase(ParallelGzipFileTest)
+
+
+if __name__ == '__main__':
+    unittest.main()
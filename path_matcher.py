@@ -0,0 +1,272 @@
+"""Decides which paths a set of glob, regex and .gitignore rules match.
+
+The rules of a PathMatcher are compiled into one regular expression
+per kind of path (file or directory) holding an alternative per rule,
+the last rule first. Matching a path is a single call to re.match and
+the alternative that matched names the deciding rule: as in .gitignore
+files, the last rule matching a path decides, and a negated rule ('!'
+in .gitignore files) un-matches it.
+
+Rules whose pattern holds groups (which would clash with the groups
+of the combined expression) are matched on their own, after it.
+
+Paths are relative to the root of a walk and use '/' as separator.
+Rules only see the path itself; the walkers prune the directories
+matched so nothing beneath them is ever seen, as git does.
+"""
+
+
+from collections import namedtuple
+import os
+import re
+
+
+# The global flags that may start a regular expression, as in (?i).
+GLOBAL_FLAGS = re.compile(r'\(\?([aiLmsux]+)\)')
+
+# The flags of compiled patterns kept by translate_regex.
+FLAG_LETTERS = [(re.ASCII, 'a'), (re.IGNORECASE, 'i'), (re.MULTILINE, 'm'),
+                (re.DOTALL, 's'), (re.VERBOSE, 'x')]
+
+
+class Rule(namedtuple('Rule', ['body', 'negated', 'dir_only', 'source',
+                               'alone'])):
+    """A rule of a PathMatcher.
+
+    Body is the regular expression matching, from the start, the paths
+    the rule matches. If dir_only is True, the rule only applies to
+    directories. Source is the pattern the rule came from. Alone is
+    the compiled body of a rule matched on its own, or None if the rule
+    is part of the combined expression."""
+    __slots__ = ()
+
+    def __new__(cls, body, negated, dir_only, source, alone=None):
+        return super(Rule, cls).__new__(cls, body, negated, dir_only,
+                                        source, alone)
+
+
+def translate_glob(pattern):
+    """translate_glob(pattern) -> str
+
+    Returns the regular expression matching the paths matched by the
+    .gitignore-style glob pattern. A pattern holding no '/' (but a
+    trailing one) matches a name at any depth; others are anchored to
+    the root. '*' and '?' do not match '/' whereas '**/' matches any
+    number of directories and a trailing '/**' everything inside."""
+    anchored = '/' in pattern
+    if pattern.startswith('/'):
+        pattern = pattern[1:]
+    parts = []
+    position = 0
+    length = len(pattern)
+    while position < length:
+        char = pattern[position]
+        at_component = (position == 0) or (pattern[position - 1] == '/')
+        if pattern.startswith('**', position) and at_component:
+            if position + 2 == length:
+                parts.append('.*')
+                position += 2
+                continue
+            if pattern[position + 2] == '/':
+                parts.append('(?:.*/)?')
+                position += 3
+                continue
+        if char == '*':
+            parts.append('[^/]*')
+        elif char == '?':
+            parts.append('[^/]')
+        elif char == '[':
+            end = pattern.find(']', position + 2)
+            if end < 0:
+                parts.append(re.escape(char))
+            else:
+                members = pattern[position + 1:end]
+                if members[0] in '!^':
+                    members = '^' + members[1:]
+                parts.append('[' + members.replace('\\', '\\\\') + ']')
+                position = end
+        elif char == '\\' and position + 1 < length:
+            position += 1
+            parts.append(re.escape(pattern[position]))
+        else:
+            parts.append(re.escape(char))
+        position += 1
+    body = ''.join(parts)
+    if not anchored:
+        body = '(?:.*/)?' + body
+    return body + r'\Z'
+
+
+def translate_regex(regex):
+    """translate_regex(regex) -> str
+
+    Returns the regular expression matching, from the start, the paths
+    that regex, a pattern string or a compiled pattern, finds anywhere
+    in them (as re.search does). The global flags of regex, whether
+    compiled in or leading its pattern as in (?i), are scoped to it."""
+    letters = set()
+    if isinstance(regex, str):
+        pattern = regex
+    else:
+        pattern = regex.pattern
+        letters.update(letter for flag, letter in FLAG_LETTERS if
+                       regex.flags & flag)
+    match = GLOBAL_FLAGS.match(pattern)
+    while match:
+        letters.update(match.group(1))
+        pattern = pattern[match.end():]
+        match = GLOBAL_FLAGS.match(pattern)
+    if letters:
+        pattern = '(?{0}:{1})'.format(''.join(sorted(letters)), pattern)
+    return '(?s:.*?)(?:{0})'.format(pattern)
+
+
+def parse_gitignore(lines):
+    """Yield (pattern, negated, dir_only) for each rule of the lines of
+    a .gitignore file."""
+    for line in lines:
+        line = line.rstrip('\n').rstrip('\r')
+        # Trailing spaces are ignored unless escaped.
+        stripped = line.rstrip(' ')
+        if stripped.endswith('\\') and len(stripped) < len(line):
+            stripped += ' '
+        line = stripped
+        if not line or line.startswith('#'):
+            continue
+        negated = line.startswith('!')
+        if negated:
+            line = line[1:]
+        elif line.startswith('\\#') or line.startswith('\\!'):
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if line:
+            yield line, negated, dir_only
+
+
+class PathMatcher(object):
+    """Matches paths against an ordered list of rules."""
+
+    def __init__(self):
+        """PathMatcher() -> o
+
+        Constructs an instance without rules, matching no path."""
+        self.rules = []
+        self._compiled = None
+
+    @classmethod
+    def from_gitignore(cls, filename):
+        """Returns a PathMatcher of the rules of the .gitignore file
+        filename."""
+        matcher = cls()
+        with open(filename) as gitignore:
+            matcher.add_gitignore(gitignore)
+        return matcher
+
+    def add_rule(self, rule):
+        """Add rule, a Rule, after my other rules.
+
+        Its body is compiled at once so that a bad pattern raises
+        re.error here. A body holding groups is matched alone."""
+        compiled = re.compile(rule.body)
+        if compiled.groups:
+            rule = rule._replace(alone=compiled)
+        self.rules.append(rule)
+        self._compiled = None
+
+    def add_glob(self, pattern, negated=False, dir_only=False):
+        """Add a rule matching the paths matched by the glob pattern
+        (see translate_glob). As in .gitignore files, a trailing '/'
+        makes the rule only apply to directories."""
+        glob = pattern
+        if glob.endswith('/'):
+            glob = glob.rstrip('/')
+            dir_only = True
+        self.add_rule(Rule(translate_glob(glob), negated, dir_only,
+                           pattern))
+
+    def add_regex(self, regex, negated=False, dir_only=False):
+        """Add a rule matching the paths in which the regular expression
+        regex, a pattern string or a compiled pattern, is found (see
+        translate_regex)."""
+        self.add_rule(Rule(translate_regex(regex), negated, dir_only,
+                           regex))
+
+    def add_gitignore(self, lines):
+        """Add the rules of the lines of a .gitignore file."""
+        for pattern, negated, dir_only in parse_gitignore(lines):
+            self.add_glob(pattern, negated, dir_only)
+
+    def _compile(self):
+        """Returns the compiled (file, directory) matchers (see
+        _combine)."""
+        if self._compiled is None:
+            self._compiled = (self._combine(False), self._combine(True))
+        return self._compiled
+
+    def _combine(self, is_dir):
+        """Returns (combined, alone) for my rules applying to directories
+        (if is_dir is True) or to files: the regular expression of the
+        rules combined, or None, and the numbers of the rules matched
+        alone, last first."""
+        rules = [(number, rule) for number, rule in
+                 reversed(list(enumerate(self.rules))) if
+                 is_dir or not rule.dir_only]
+        alternatives = ['(?P<r{0}>{1})'.format(number, rule.body) for
+                        number, rule in rules if rule.alone is None]
+        combined = None
+        if alternatives:
+            combined = re.compile('|'.join(alternatives))
+        return combined, [number for number, rule in rules if
+                          rule.alone is not None]
+
+    def verdict(self, path, is_dir=False):
+        """Returns True if the last of my rules matching path, a file or
+        a directory if is_dir is True, matches it, False if that rule is
+        negated and None if none matches."""
+        combined, alone = self._compile()[is_dir]
+        deciding = None
+        if combined is not None:
+            match = combined.match(path)
+            if match is not None:
+                deciding = int(match.lastgroup[1:])
+        for number in alone:
+            if (deciding is not None) and (number < deciding):
+                break
+            if self.rules[number].alone.match(path):
+                deciding = number
+                break
+        if deciding is None:
+            return None
+        return not self.rules[deciding].negated
+
+    def matches(self, path, is_dir=False):
+        """Determines if my rules match path (see verdict)."""
+        return bool(self.verdict(path, is_dir))
+
+    def __len__(self):
+        return len(self.rules)
+
+
+def excluder(root, exclude_dirs):
+    """excluder(root, exclude_dirs) -> callable
+
+    Returns the predicate excluded(path, is_dir) of the paths beneath
+    root a walker skips. Exclude_dirs is either the names of the
+    directories to skip or a PathMatcher matching the paths, relative
+    to root, of the files and directories to skip."""
+    if isinstance(exclude_dirs, PathMatcher):
+        matcher = exclude_dirs
+        start = len(os.path.join(root, ''))
+
+        def excluded(path, is_dir):
+            path = path[start:]
+            if os.sep != '/':
+                path = path.replace(os.sep, '/')
+            return matcher.matches(path, is_dir)
+    else:
+        names = frozenset(exclude_dirs)
+
+        def excluded(path, is_dir):
+            return is_dir and (os.path.basename(path) in names)
+    return excluded
@@ -0,0 +1,159 @@
+#! env python
+
+
+"""Defines and runs the unit tests for the path_matcher module."""
+
+
+import os
+import re
+import unittest
+
+from path_matcher import (PathMatcher, excluder, parse_gitignore,
+                          translate_regex)
+
+
+class PathMatcherTest(unittest.TestCase):
+    """Defines the unit tests for matching paths against rules."""
+
+    def gitignore(self, *lines):
+        """Return a PathMatcher of the .gitignore lines."""
+        matcher = PathMatcher()
+        matcher.add_gitignore(lines)
+        return matcher
+
+    def testNoRulesMatchNothing(self):
+        """Without rules, no path is matched."""
+        self.assertEqual(None, PathMatcher().verdict('bin', True))
+        self.assertFalse(PathMatcher().matches('bin'))
+
+    def testNameMatchesAtAnyDepth(self):
+        """A pattern without '/' matches names at any depth."""
+        matcher = self.gitignore('*.pyc')
+        self.assertTrue(matcher.matches('a.pyc'))
+        self.assertTrue(matcher.matches('src/deep/a.pyc'))
+        self.assertFalse(matcher.matches('a.py'))
+        self.assertFalse(matcher.matches('a.pyc/b'))
+
+    def testSlashAnchorsPattern(self):
+        """A pattern holding '/' matches from the root only."""
+        matcher = self.gitignore('/build', 'doc/*.html')
+        self.assertTrue(matcher.matches('build', True))
+        self.assertFalse(matcher.matches('src/build', True))
+        self.assertTrue(matcher.matches('doc/index.html'))
+        self.assertFalse(matcher.matches('doc/api/index.html'))
+        self.assertFalse(matcher.matches('src/doc/index.html'))
+
+    def testDoubleStar(self):
+        """'**' matches any number of directories."""
+        matcher = self.gitignore('**/logs', 'a/**/z', 'out/**')
+        self.assertTrue(matcher.matches('logs', True))
+        self.assertTrue(matcher.matches('x/y/logs', True))
+        self.assertTrue(matcher.matches('a/z'))
+        self.assertTrue(matcher.matches('a/b/c/z'))
+        self.assertTrue(matcher.matches('out/x/y'))
+        self.assertFalse(matcher.matches('out', True))
+
+    def testDirectoryOnlyRules(self):
+        """A trailing '/' restricts a rule to directories."""
+        matcher = self.gitignore('bin/')
+        self.assertTrue(matcher.matches('src/bin', True))
+        self.assertFalse(matcher.matches('src/bin', False))
+
+    def testGlobTrailingSlashMatchesDirectories(self):
+        """add_glob treats a trailing '/' as a .gitignore file does."""
+        matcher = PathMatcher()
+        matcher.add_glob('build/')
+        self.assertTrue(matcher.matches('build', True))
+        self.assertTrue(matcher.matches('src/build', True))
+        self.assertFalse(matcher.matches('build', False))
+        self.assertEqual('build/', matcher.rules[0].source)
+
+    def testLastMatchingRuleDecides(self):
+        """A later negated rule un-matches a path; a later rule again
+        matches it."""
+        matcher = self.gitignore('*.log', '!keep.log')
+        self.assertTrue(matcher.matches('debug.log'))
+        self.assertEqual(False, matcher.verdict('keep.log'))
+        matcher.add_glob('keep.*')
+        self.assertTrue(matcher.matches('keep.log'))
+
+    def testCharacterClassesAndEscapes(self):
+        """Classes, negated classes and escaped characters."""
+        matcher = self.gitignore('[ab].o', 'x[!0-9]', r'\#hash', r'\!bang')
+        self.assertTrue(matcher.matches('a.o'))
+        self.assertFalse(matcher.matches('c.o'))
+        self.assertTrue(matcher.matches('xy'))
+        self.assertFalse(matcher.matches('x1'))
+        self.assertTrue(matcher.matches('#hash'))
+        self.assertTrue(matcher.matches('!bang'))
+
+    def testParseGitignore(self):
+        """Comments and blank lines are skipped, trailing spaces too."""
+        self.assertEqual([('a', False, False), ('b', True, True),
+                          ('c\\ ', False, False)],
+                         list(parse_gitignore(['# comment\n', '\n',
+                                               'a  \n', '!b/\r\n',
+                                               'c\\ \n'])))
+
+    def testRegexRulesSearch(self):
+        """Regular expressions are searched, keeping their flags."""
+        matcher = PathMatcher()
+        matcher.add_regex('bin')
+        matcher.add_regex(re.compile('^OBJ$', re.IGNORECASE))
+        self.assertTrue(matcher.matches('src/binaries', True))
+        self.assertTrue(matcher.matches('obj', True))
+        self.assertFalse(matcher.matches('src/obj', True))
+
+    def testRegexGlobalFlagsAreScoped(self):
+        """Leading inline flags apply to their own rule only."""
+        matcher = PathMatcher()
+        matcher.add_regex('(?i)bin')
+        matcher.add_regex(re.compile('(?x) o b j $'))
+        matcher.add_regex('lib')
+        self.assertTrue(matcher.matches('g0/x/BIN', True))
+        self.assertTrue(matcher.matches('src/obj', True))
+        self.assertFalse(matcher.matches('src/LIB', True))
+        self.assertEqual('(?s:.*?)(?:(?i:bin))',
+                         translate_regex(re.compile('(?i)bin')))
+
+    def testRegexGroupsAreMatchedAlone(self):
+        """Rules with groups keep their names and back-references."""
+        matcher = PathMatcher()
+        matcher.add_regex('(?P<r0>tmp)')
+        matcher.add_regex(r'(\w)\1$')
+        matcher.add_regex('!keep', negated=True)
+        matcher.add_regex('(?P<ignored>ign)')
+        self.assertTrue(matcher.matches('a/tmp'))
+        self.assertTrue(matcher.matches('a/bb'))
+        self.assertFalse(matcher.matches('a/ab'))
+        self.assertFalse(matcher.matches('a/tmp!keep'))
+        self.assertTrue(matcher.matches('a/tmp!keep/ign'))
+
+    def testBadRegexIsRejectedWhenAdded(self):
+        """A pattern that cannot compile raises re.error at once."""
+        matcher = PathMatcher()
+        self.assertRaises(re.error, matcher.add_regex, 'a(?i)b')
+        self.assertRaises(re.error, matcher.add_regex, '(unclosed')
+        self.assertEqual(0, len(matcher))
+
+    def testExcluder(self):
+        """Excluders skip named directories or matched paths."""
+        named = excluder('top', ['.git'])
+        self.assertTrue(named(os.path.join('top', 'a', '.git'), True))
+        self.assertFalse(named(os.path.join('top', '.git'), False))
+        matched = excluder('top', self.gitignore('/a/*.tmp'))
+        self.assertTrue(matched(os.path.join('top', 'a', 'b.tmp'), False))
+        self.assertFalse(matched(os.path.join('top', 'c', 'a', 'b.tmp'),
+                                 False))
+
+
+def suite():
+    """Returns the suite of unit tests in this module."""
+    suites = [
+        unittest.TestLoader().loadTestsFromTestCase(PathMatcherTest),
+        ]
+    return unittest.TestSuite(suites)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,6 +7,8 @@ import os
 import re
 import shutil
 
+from path_matcher import PathMatcher, excluder
+
 
 __author__ = 'ljones'
 
@@ -22,28 +24,40 @@ def print_rm_error_fn(is_verbose):
                                                             path, function))
     return print_rm_error
 
-def rm_directory_if(starting_at, included_in, excluded_by, is_verbose):
-    """Remove directories in start included_in but not excluded_by"""
+def rm_directory_if(starting_at, included_in, excluded_by, is_verbose,
+                    ignored=None):
+    """Remove directories in start included_in but not excluded_by
+
+    The regular expressions of included_in and excluded_by are each
+    combined into a single path_matcher.PathMatcher. Directories
+    matched by ignored, a PathMatcher of paths relative to starting_at
+    (of a .gitignore file, say), are skipped too."""
+
+    include = PathMatcher()
+    for regex in included_in:
+        include.add_regex(regex)
+    exclude = PathMatcher()
+    for regex in excluded_by:
+        exclude.add_regex(regex)
+    is_ignored = excluder(starting_at, ignored or ())
 
     for root, directory_names, file_names in os.walk(starting_at):
         all_to_remove = set()
         all_to_skip = set()
         for directory_name in directory_names:
+            pathname = os.path.join(root, directory_name)
             # if directory_name by itself is to be excluded
-            if any([exclude.search(directory_name) for exclude in
-                    excluded_by]):
+            if (exclude.matches(directory_name, True) or
+                    is_ignored(pathname, True)):
                 # add it to the set to be skipped
                 if is_verbose:
-                    print('Skipping {0}.'.format(os.path.join(root,
-                                                              directory_name)))
+                    print('Skipping {0}.'.format(pathname))
                 all_to_skip.add(directory_name)
 
             # if directory_name is included but not excluded
-            if any([include.search(directory_name) for include in
-                    included_in]):
-                if not any([exclude.search(os.path.join(root,
-                                                        directory_name))
-                            for exclude in excluded_by]):
+            if include.matches(directory_name, True):
+                if not (exclude.matches(pathname, True) or
+                        is_ignored(pathname, True)):
                     all_to_remove.add(directory_name)
 
         # Remove matching directories
@@ -69,6 +83,9 @@ if __name__ == '__main__':
                         help='Include pattern(s).')
     parser.add_argument('-x', '--exclude', nargs='+', default=[],
                         help='Exclude pattern(s).')
+    parser.add_argument('-g', '--gitignore', default=None,
+                        help='Also skip the directories this .gitignore'
+                        ' file ignores.')
     parser.add_argument('-v', '--verbose', action='store_true',
                         default=False, help='Show verbose output.')
     parser.add_argument('where', nargs='*', default='.',
@@ -78,6 +95,9 @@ if __name__ == '__main__':
     exclude_if = [re.compile(x) for x in args.exclude] + \
                  [re.compile(default.replace('.', r'\.')) for default in
                   default_exclude]
+    ignored = None
+    if args.gitignore:
+        ignored = PathMatcher.from_gitignore(args.gitignore)
     for start in args.where:
-        rm_directory_if(start, include_if, exclude_if, args.verbose)
+        rm_directory_if(start, include_if, exclude_if, args.verbose, ignored)
 
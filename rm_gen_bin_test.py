@@ -0,0 +1,60 @@
+#! env python
+
+
+"""Defines and runs the unit tests for the rm_gen_bin module."""
+
+
+import os
+import re
+import shutil
+import unittest
+
+import rm_gen_bin
+
+
+class RmDirectoryIfTest(unittest.TestCase):
+    """Defines the unit tests for removing generated directories."""
+
+    def setUp(self):
+        """Set up the test fixture."""
+        self._root = 'generata'
+        self._cleanFixtures()
+        for pathname in [os.path.join(self._root, 'x', 'BIN', 'a.o'),
+                         os.path.join(self._root, 'x', 'obj', 'b.o'),
+                         os.path.join(self._root, '.git', 'bin', 'c'),
+                         os.path.join(self._root, 'src', 'main.c')]:
+            os.makedirs(os.path.dirname(pathname))
+            with open(pathname, 'w') as f:
+                f.write(os.path.basename(pathname))
+
+    def tearDown(self):
+        """Tear down the test fixture."""
+        self._cleanFixtures()
+
+    def _cleanFixtures(self):
+        """Remove all test fixtures from the OS filesystem."""
+        if os.path.isdir(self._root):
+            shutil.rmtree(self._root)
+
+    def testInlineFlagsApply(self):
+        """Included regexes may start with inline flags such as (?i)."""
+        rm_gen_bin.rm_directory_if(self._root, [re.compile('(?i)bin')],
+                                   [re.compile(r'\.git')], False)
+        self.assertFalse(os.path.exists(os.path.join(self._root, 'x',
+                                                     'BIN')))
+        self.assertTrue(os.path.isdir(os.path.join(self._root, 'x', 'obj')))
+        self.assertTrue(os.path.isdir(os.path.join(self._root, '.git',
+                                                   'bin')))
+        self.assertTrue(os.path.isdir(os.path.join(self._root, 'src')))
+
+
+def suite():
+    """Returns the suite of unit tests in this module."""
+    suites = [
+        unittest.TestLoader().loadTestsFromTestCase(RmDirectoryIfTest),
+        ]
+    return unittest.TestSuite(suites)
+
+
+if __name__ == '__main__':
+    unittest.main()
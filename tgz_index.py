@@ -0,0 +1,312 @@
+"""Random access to the members of a .tgz archive.
+
+A TgzIndex records gzip decompression checkpoints and the offset of
+each member in the uncompressed tar stream. Reading a member then only
+decompresses the data between the nearest checkpoint and the member
+instead of everything in front of it.
+
+A checkpoint is either the start of a gzip member or, for streams
+written by parallel_gzip.ParallelGzipFile, the start of a deflate
+block together with the 32 KiB window preceding it.
+"""
+
+
+import base64
+from bisect import bisect_right
+from collections import namedtuple
+import json
+import tarfile
+import zlib
+
+
+# The amount of compressed data read at a time.
+CHUNK_SIZE = 1 << 16
+
+# The default distance, in uncompressed bytes, between checkpoints.
+CHECKPOINT_SPACING = 4 << 20
+
+# The size of a gzip member trailer (CRC and size).
+TRAILER_SIZE = 8
+
+
+class Checkpoint(namedtuple('Checkpoint', ['compressed_offset',
+                                           'uncompressed_offset',
+                                           'window'])):
+    """A place from which decompression may start.
+
+    If window is None, compressed_offset is the start of a gzip
+    member. Otherwise, it is the start of a raw deflate block and
+    window holds the uncompressed data preceding it."""
+    __slots__ = ()
+
+
+class TgzIndex(object):
+    """An index of the checkpoints and members of a .tgz archive."""
+
+    EXT = '.idx'
+
+    VERSION = 1
+
+    def __init__(self, checkpoints, members):
+        """TgzIndex(checkpoints, members) -> o
+
+        Constructs an instance from a list of Checkpoints, ordered by
+        offset, and a dictionary mapping member names to the
+        uncompressed offset of their (first) header."""
+        self.checkpoints = sorted(checkpoints,
+                                  key=lambda c: c.uncompressed_offset)
+        self._offsets = [c.uncompressed_offset for c in self.checkpoints]
+        self.members = members
+
+    @classmethod
+    def build(cls, tgz_filename):
+        """Build the index of the existing archive tgz_filename.
+
+        The archive is read once. Checkpoints are placed at the start
+        of every gzip member so an archive made of a single member
+        only gains the member offsets."""
+        checkpoints = []
+
+        def add_checkpoint(compressed_offset, uncompressed_offset):
+            checkpoints.append(Checkpoint(compressed_offset,
+                                          uncompressed_offset, None))
+
+        members = {}
+        with open(tgz_filename, 'rb') as tgz_file:
+            reader = GzipStreamReader(tgz_file, Checkpoint(0, 0, None),
+                                      on_member=add_checkpoint)
+            tar_file = tarfile.open(fileobj=reader, mode='r|')
+            try:
+                for member in tar_file:
+                    members[member.name] = member.offset
+            finally:
+                tar_file.close()
+        return cls(checkpoints, members)
+
+    @classmethod
+    def load(cls, filename):
+        """Returns the index saved in filename."""
+        with open(filename, 'r') as index_file:
+            document = json.load(index_file)
+        if document.get('version') != cls.VERSION:
+            raise ValueError('Unknown index version in {0}.'.
+                             format(filename))
+        checkpoints = [Checkpoint(compressed, uncompressed,
+                                  None if window is None else
+                                  zlib.decompress(base64.b64decode(window)))
+                       for compressed, uncompressed, window in
+                       document['checkpoints']]
+        return cls(checkpoints, document['members'])
+
+    def save(self, filename):
+        """Save this index into filename."""
+        checkpoints = [[c.compressed_offset, c.uncompressed_offset,
+                        None if c.window is None else
+                        base64.b64encode(zlib.compress(c.window)).
+                        decode('ascii')]
+                       for c in self.checkpoints]
+        with open(filename, 'w') as index_file:
+            json.dump({'version': TgzIndex.VERSION,
+                       'checkpoints': checkpoints,
+                       'members': self.members}, index_file)
+
+    def checkpoint_before(self, offset):
+        """Returns the last checkpoint at or before the offset."""
+        position = bisect_right(self._offsets, offset)
+        if position == 0:
+            raise ValueError('No checkpoint before offset {0}.'.
+                             format(offset))
+        return self.checkpoints[position - 1]
+
+    def open_stream(self, tgz_file, offset):
+        """Returns a reader of the uncompressed stream of tgz_file
+        positioned at the offset."""
+        checkpoint = self.checkpoint_before(offset)
+        reader = GzipStreamReader(tgz_file, checkpoint)
+        reader.skip(offset - checkpoint.uncompressed_offset)
+        return reader
+
+    def open_tar(self, tgz_file, name):
+        """Returns (tar_file, tar_info) for the member name of tgz_file.
+
+        Tar_file is a streaming TarFile whose next member is name."""
+        reader = self.open_stream(tgz_file, self.members[name])
+        tar_file = tarfile.open(fileobj=reader, mode='r|')
+        tar_info = tar_file.next()
+        if tar_info is None or tar_info.name != name:
+            tar_file.close()
+            raise ValueError('Index does not match the archive at {0}.'.
+                             format(name))
+        return tar_file, tar_info
+
+    def open_member(self, tgz_filename, name):
+        """Returns a MemberFile reading the member name of tgz_filename.
+
+        Raises KeyError if name is not in this index."""
+        tgz_file = open(tgz_filename, 'rb')
+        try:
+            tar_file, tar_info = self.open_tar(tgz_file, name)
+        except:
+            tgz_file.close()
+            raise
+        return MemberFile(tar_file, tar_info, tgz_file)
+
+
+class MemberFile(object):
+    """A read-only file object over one member of a .tgz archive."""
+
+    def __init__(self, tar_file, tar_info, tgz_file):
+        """MemberFile(tar_file, tar_info, tgz_file) -> o
+
+        Constructs an instance reading tar_info from the streaming
+        tar_file. Closing the instance closes tgz_file."""
+        self.tar_info = tar_info
+        self.name = tar_info.name
+        self._tar_file = tar_file
+        self._tgz_file = tgz_file
+        self._member_file = tar_file.extractfile(tar_info)
+        if self._member_file is None:
+            self.close()
+            raise ValueError('Member {0} is not a file.'.
+                             format(tar_info.name))
+
+    def read(self, size=-1):
+        """Returns up to size bytes (all by default) of the member."""
+        return self._member_file.read(size)
+
+    def close(self):
+        """Release the archive."""
+        self._tar_file.close()
+        self._tgz_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class GzipStreamReader(object):
+    """Reads the uncompressed stream of a gzip file from a checkpoint.
+
+    The stream continues across gzip members. Only read() and skip()
+    are supported, which is all a streaming TarFile needs."""
+
+    def __init__(self, fileobj, checkpoint, on_member=None):
+        """GzipStreamReader(fileobj, checkpoint, on_member=None) -> o
+
+        Constructs an instance reading the seekable fileobj from
+        checkpoint. If supplied, on_member(compressed_offset,
+        uncompressed_offset) is called at the start of every gzip
+        member."""
+        self._fileobj = fileobj
+        self._on_member = on_member
+        self._fileobj.seek(checkpoint.compressed_offset)
+        self._input = b''
+        self._input_offset = checkpoint.compressed_offset
+        self._output = bytearray()
+        self._position = checkpoint.uncompressed_offset
+        self._trailer = 0
+        self._eof = False
+        self._decompressor = None
+        self._raw = checkpoint.window is not None
+        if self._raw:
+            if checkpoint.window:
+                self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS,
+                                                        zdict=checkpoint.
+                                                        window)
+            else:
+                self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+
+    def read(self, size=-1):
+        """Returns up to size uncompressed bytes (all by default)."""
+        while (size < 0 or len(self._output) < size) and not self._eof:
+            self._decompress()
+        if size < 0:
+            size = len(self._output)
+        data = bytes(self._output[:size])
+        del self._output[:size]
+        self._position += len(data)
+        return data
+
+    def skip(self, count):
+        """Discard the next count uncompressed bytes."""
+        while count > 0:
+            data = self.read(min(count, CHUNK_SIZE))
+            if not data:
+                raise EOFError('Stream ended while skipping.')
+            count -= len(data)
+
+    def tell(self):
+        """Returns the offset in the uncompressed stream."""
+        return self._position
+
+    def _advance(self, count):
+        """Consume count bytes of my compressed input."""
+        self._input = self._input[count:]
+        self._input_offset += count
+
+    def _decompress(self):
+        """Decompress the next piece of the stream into my output."""
+        if not self._input:
+            self._input = self._fileobj.read(CHUNK_SIZE)
+            if not self._input:
+                if self._decompressor:
+                    # Collect any output zlib still holds back.
+                    self._output += self._decompressor.flush()
+                    if self._decompressor.eof:
+                        self._end_member()
+                        return
+                if self._decompressor or self._trailer:
+                    raise EOFError('Compressed file ended before the' +
+                                   ' end-of-stream marker was reached.')
+                self._eof = True
+                return
+
+        if self._trailer:
+            skipped = min(self._trailer, len(self._input))
+            self._advance(skipped)
+            self._trailer -= skipped
+            return
+
+        if self._decompressor is None:
+            # Gzip files may be padded with zeroes after a member.
+            padding = len(self._input) - len(self._input.lstrip(b'\000'))
+            if padding:
+                self._advance(padding)
+                return
+            if self._on_member:
+                self._on_member(self._input_offset,
+                                self._position + len(self._output))
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+        decompressor = self._decompressor
+        self._output += decompressor.decompress(self._input, CHUNK_SIZE)
+        if decompressor.eof:
+            rest = decompressor.unused_data
+            self._end_member()
+        else:
+            rest = decompressor.unconsumed_tail
+        self._advance(len(self._input) - len(rest))
+
+    def _end_member(self):
+        """Note the end of the deflate data of the current gzip member."""
+        self._decompressor = None
+        if self._raw:
+            # The gzip trailer follows the raw deflate data.
+            self._trailer = TRAILER_SIZE
+            self._raw = False
+
+
+class IndexingTarFile(tarfile.TarFile):
+    """A TarFile recording the offset at which each member is added."""
+
+    def __init__(self, *args, **kwargs):
+        super(IndexingTarFile, self).__init__(*args, **kwargs)
+        self.member_offsets = {}
+
+    def addfile(self, tarinfo, fileobj=None):
+        """Add tarinfo, recording the offset of its header."""
+        offset = self.offset
+        super(IndexingTarFile, self).addfile(tarinfo, fileobj)
+        self.member_offsets[self.members[-1].name] = offset
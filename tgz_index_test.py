@@ -0,0 +1,124 @@
+"""Defines and runs the unit tests for the tgz_index module."""
+
+
+import gzip
+import io
+import os
+import random
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+import parallel_gzip
+import tgz_index
+
+
+class TgzIndexTest(unittest.TestCase):
+    """Defines the unit tests for TgzIndex and GzipStreamReader."""
+
+    def setUp(self):
+        """Set up the test fixture."""
+        self._dirname = tempfile.mkdtemp(prefix='tgz_index_test')
+        words = [line.strip() for line in open('latin_words.txt')]
+        generator = random.Random(1995)
+        self._members = {}
+        for i in range(12):
+            name = 'membrum{0:02d}'.format(i)
+            self._members[name] = ' '.join(
+                generator.choice(words) for _ in range(2000 * (i + 1))
+            ).encode('utf-8')
+        self._tgzName = os.path.join(self._dirname, 'membra.tgz')
+
+    def tearDown(self):
+        """Tear down the test fixture."""
+        shutil.rmtree(self._dirname)
+
+    def addMembers(self, tarFile):
+        """Add my members to tarFile."""
+        for name in sorted(self._members):
+            tarInfo = tarfile.TarInfo(name)
+            tarInfo.size = len(self._members[name])
+            tarFile.addfile(tarInfo, io.BytesIO(self._members[name]))
+
+    def writeIndexed(self):
+        """Write my members into an archive with many checkpoints."""
+        with open(self._tgzName, 'wb') as tgzFile:
+            gzipFile = parallel_gzip.ParallelGzipFile(
+                tgzFile, jobs=2, block_size=1 << 15,
+                checkpoint_spacing=1 << 16)
+            tarFile = tgz_index.IndexingTarFile(fileobj=gzipFile, mode='w')
+            self.addMembers(tarFile)
+            tarFile.close()
+            gzipFile.close()
+        return tgz_index.TgzIndex([tgz_index.Checkpoint(*checkpoint) for
+                                   checkpoint in gzipFile.checkpoints],
+                                  tarFile.member_offsets)
+
+    def assertMembers(self, index):
+        """Verify every member reads back through index."""
+        self.assertEqual(sorted(self._members), sorted(index.members))
+        for name, content in self._members.items():
+            with index.open_member(self._tgzName, name) as member:
+                self.assertEqual(content, member.read())
+
+    def testIndexWrittenWhileArchiving(self):
+        """An index written while archiving finds every member."""
+        index = self.writeIndexed()
+        self.assertTrue(len(index.checkpoints) > 4)
+        self.assertMembers(index)
+
+    def testMemberStartsAfterCheckpoint(self):
+        """Reading a late member starts from a late checkpoint."""
+        index = self.writeIndexed()
+        checkpoint = index.checkpoint_before(index.members['membrum11'])
+        self.assertTrue(checkpoint.uncompressed_offset > 0)
+        self.assertTrue(checkpoint.window)
+
+    def testSavedIndexLoads(self):
+        """A saved index loads and still finds every member."""
+        indexName = self._tgzName + tgz_index.TgzIndex.EXT
+        self.writeIndexed().save(indexName)
+        self.assertMembers(tgz_index.TgzIndex.load(indexName))
+
+    def testBuildIndexOfSingleMember(self):
+        """Building the index of a tarfile archive finds its members."""
+        tarFile = tarfile.open(self._tgzName, 'w:gz')
+        self.addMembers(tarFile)
+        tarFile.close()
+        index = tgz_index.TgzIndex.build(self._tgzName)
+        self.assertEqual(1, len(index.checkpoints))
+        self.assertMembers(index)
+
+    def testBuildIndexOfConcatenatedMembers(self):
+        """Every gzip member of a concatenated archive is a checkpoint."""
+        buffer = io.BytesIO()
+        tarFile = tarfile.open(fileobj=buffer, mode='w')
+        self.addMembers(tarFile)
+        tarFile.close()
+        data = buffer.getvalue()
+        with open(self._tgzName, 'wb') as tgzFile:
+            for start in range(0, len(data), 1 << 16):
+                tgzFile.write(gzip.compress(data[start:start + (1 << 16)]))
+        index = tgz_index.TgzIndex.build(self._tgzName)
+        self.assertEqual((len(data) + (1 << 16) - 1) >> 16,
+                         len(index.checkpoints))
+        self.assertMembers(index)
+
+    def testTruncatedStreamRaisesError(self):
+        """Reading a truncated stream raises EOFError."""
+        self.writeIndexed()
+        with open(self._tgzName, 'rb') as tgzFile:
+            data = tgzFile.read()
+        reader = tgz_index.GzipStreamReader(io.BytesIO(data[:-100]),
+                                            tgz_index.Checkpoint(0, 0, None))
+        self.assertRaises(EOFError, reader.read)
+
+
+def suite():
+    """Returns the suite of unit tests in this module."""
+    return unittest.TestLoader().loadTestsFromTestCase(TgzIndexTest)
+
+
+if __name__ == '__main__':
+    unittest.main()
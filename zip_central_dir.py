@@ -0,0 +1,318 @@
+"""Lazy, memory-mapped access to the central directory of a .zip file.
+
+zipfile.ZipFile turns every central directory record into a ZipInfo
+when it opens an archive, which costs hundreds of bytes per member. A
+ZipCentralDirectory instead memory-maps the archive and parses records
+only when asked. Looking members up by name uses a compact index of
+16 bytes per member built, on first use, in a single pass.
+"""
+
+
+from array import array
+from bisect import bisect_left
+import mmap
+import struct
+import zipfile
+import zlib
+
+
+# The fixed part of a central directory record.
+CENTRAL_STRUCT = struct.Struct('<4s4B4HL2L5H2L')
+CENTRAL_SIGNATURE = b'PK\001\002'
+
+# The fixed part of a local file header.
+LOCAL_STRUCT = struct.Struct('<4s2B4HL2L2H')
+LOCAL_SIGNATURE = b'PK\003\004'
+
+# The end of central directory record and its zip64 counterparts.
+END_STRUCT = struct.Struct('<4s4H2LH')
+END_SIGNATURE = b'PK\005\006'
+END64_LOCATOR_STRUCT = struct.Struct('<4sLQL')
+END64_LOCATOR_SIGNATURE = b'PK\006\007'
+END64_STRUCT = struct.Struct('<4sQ2H2L4Q')
+END64_SIGNATURE = b'PK\006\006'
+
+# The flag bit marking UTF-8 encoded names.
+UTF8_FLAG = 0x800
+
+# The amount of member data decompressed at a time.
+CHUNK_SIZE = 1 << 20
+
+
+class ZipCentralDirectory(object):
+    """A read-only view of the members of a .zip file."""
+
+    def __init__(self, filename):
+        """ZipCentralDirectory(filename) -> o
+
+        Constructs an instance over the .zip file filename. Only the
+        end of the archive is read; records are parsed on demand.
+        Raises zipfile.BadZipFile if filename is not a .zip file."""
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise zipfile.BadZipFile('File is not a zip file')
+        try:
+            self._read_end()
+        except:
+            self.close()
+            raise
+        self._offsets = None
+        self._keys = None
+
+    def _read_end(self):
+        """Locate the central directory from the end records."""
+        data = self._map
+        # The whole end record, after a comment of up to 64 KiB, must
+        # fit in the file.
+        search_start = max(0, len(data) - END_STRUCT.size - 0xffff)
+        search_end = len(data) - END_STRUCT.size + len(END_SIGNATURE)
+        end_offset = data.rfind(END_SIGNATURE, search_start, search_end)
+        if end_offset < 0:
+            raise zipfile.BadZipFile('File is not a zip file')
+        (_, _, _, _, count, size, offset,
+         _) = END_STRUCT.unpack_from(data, end_offset)
+        cd_end = end_offset
+
+        locator_offset = end_offset - END64_LOCATOR_STRUCT.size
+        if ((locator_offset >= 0) and
+            (data[locator_offset:locator_offset + 4] ==
+             END64_LOCATOR_SIGNATURE)):
+            end64_offset = END64_LOCATOR_STRUCT.unpack_from(
+                data, locator_offset)[2]
+            if end64_offset + END64_STRUCT.size > len(data):
+                raise zipfile.BadZipFile('Corrupt zip64 end of directory')
+            (signature, _, _, _, _, _, _, count, size,
+             offset) = END64_STRUCT.unpack_from(data, end64_offset)
+            if signature != END64_SIGNATURE:
+                raise zipfile.BadZipFile('Corrupt zip64 end of directory')
+            cd_end = end64_offset
+
+        # Data may precede the archive (as in self-extracting files).
+        self._concat = cd_end - size - offset
+        self._start = offset + self._concat
+        self._end = self._start + size
+        self.count = count
+        if self._start < 0 or self._end > len(data):
+            raise zipfile.BadZipFile('Bad central directory offset')
+
+    def close(self):
+        """Release the archive."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """Yield the name of every member, in archive order."""
+        for offset in self._record_offsets():
+            yield self._record_name(offset)
+
+    def __contains__(self, name):
+        return self.exists(name)
+
+    def _record_offsets(self):
+        """Yield the offset of every central directory record."""
+        data = self._map
+        offset = self._start
+        while offset < self._end:
+            if data[offset:offset + 4] != CENTRAL_SIGNATURE:
+                raise zipfile.BadZipFile('Bad central directory record at' +
+                                         ' {0}'.format(offset))
+            yield offset
+            name_length, extra_length, comment_length = \
+                struct.unpack_from('<3H', data, offset + 28)
+            offset += (CENTRAL_STRUCT.size + name_length + extra_length +
+                       comment_length)
+
+    def _record_name(self, offset):
+        """Returns the decoded name of the record at offset."""
+        flags = struct.unpack_from('<H', self._map, offset + 8)[0]
+        name_length = struct.unpack_from('<H', self._map, offset + 28)[0]
+        start = offset + CENTRAL_STRUCT.size
+        return decode_name(self._map[start:start + name_length], flags)
+
+    def _name_bytes(self, offset):
+        """Returns the raw name of the record at offset."""
+        name_length = struct.unpack_from('<H', self._map, offset + 28)[0]
+        start = offset + CENTRAL_STRUCT.size
+        return self._map[start:start + name_length]
+
+    def _build_index(self):
+        """Build my compact name index in one pass over the records.
+
+        The index is an array of record offsets and a sorted array of
+        keys; each key holds the CRC-32 of a raw name in its upper 32
+        bits and the position of its record in the lower 32 bits."""
+        offsets = array('Q')
+        keys = []
+        for position, offset in enumerate(self._record_offsets()):
+            offsets.append(offset)
+            keys.append((zlib.crc32(self._name_bytes(offset)) << 32) |
+                        position)
+        keys.sort()
+        self._keys = array('Q', keys)
+        self._offsets = offsets
+
+    def _find_offset(self, name):
+        """Returns the offset of the record named name, or None."""
+        if self._keys is None:
+            self._build_index()
+        candidates = [name.encode('utf-8')]
+        try:
+            if name.encode('cp437') != candidates[0]:
+                candidates.append(name.encode('cp437'))
+        except UnicodeEncodeError:
+            pass
+        for raw_name in candidates:
+            key = zlib.crc32(raw_name) << 32
+            position = bisect_left(self._keys, key)
+            while ((position < len(self._keys)) and
+                   ((self._keys[position] >> 32) == (key >> 32))):
+                offset = self._offsets[self._keys[position] & 0xffffffff]
+                if self._record_name(offset) == name:
+                    return offset
+                position += 1
+        return None
+
+    def exists(self, name):
+        """Determines if the archive has a member named name."""
+        return self._find_offset(name) is not None
+
+    def entries(self):
+        """Yield a ZipInfo for every member, in archive order."""
+        for offset in self._record_offsets():
+            yield self._record_info(offset)
+
+    def getinfo(self, name):
+        """Returns the ZipInfo of the member name.
+
+        Raises KeyError if there is no such member."""
+        offset = self._find_offset(name)
+        if offset is None:
+            raise KeyError('There is no item named {0!r} in the archive'.
+                           format(name))
+        return self._record_info(offset)
+
+    def _record_info(self, offset):
+        """Returns a ZipInfo parsed from the record at offset."""
+        (_, create_version, create_system, extract_version, reserved,
+         flag_bits, compress_type, dos_time, dos_date, crc, compress_size,
+         file_size, name_length, extra_length, comment_length, _,
+         internal_attr, external_attr,
+         header_offset) = CENTRAL_STRUCT.unpack_from(self._map, offset)
+        start = offset + CENTRAL_STRUCT.size
+        name = decode_name(self._map[start:start + name_length], flag_bits)
+        start += name_length
+        extra = self._map[start:start + extra_length]
+        start += extra_length
+        comment = self._map[start:start + comment_length]
+
+        date_time = ((dos_date >> 9) + 1980, (dos_date >> 5) & 0xf,
+                     dos_date & 0x1f, dos_time >> 11,
+                     (dos_time >> 5) & 0x3f, (dos_time & 0x1f) * 2)
+        info = zipfile.ZipInfo(name, date_time)
+        info.create_version = create_version
+        info.create_system = create_system
+        info.extract_version = extract_version
+        info.reserved = reserved
+        info.flag_bits = flag_bits
+        info.compress_type = compress_type
+        info.CRC = crc
+        info.internal_attr = internal_attr
+        info.external_attr = external_attr
+        info.extra = extra
+        info.comment = comment
+        info.file_size, info.compress_size, info.header_offset = \
+            decode_zip64(extra, file_size, compress_size, header_offset)
+        info.header_offset += self._concat
+        return info
+
+    def read(self, name):
+        """Returns the uncompressed content of the member name.
+
+        Raises KeyError if there is no such member and
+        zipfile.BadZipFile if the content fails its CRC check."""
+        info = self.getinfo(name)
+        data = b''.join(self.read_chunks(info))
+        return data
+
+    def data_offset(self, info):
+        """Returns the offset of the compressed data of info."""
+        (signature, _, _, _, _, _, _, _, _, _, name_length,
+         extra_length) = LOCAL_STRUCT.unpack_from(self._map,
+                                                   info.header_offset)
+        if signature != LOCAL_SIGNATURE:
+            raise zipfile.BadZipFile('Bad local header for {0}.'.
+                                     format(info.filename))
+        return (info.header_offset + LOCAL_STRUCT.size + name_length +
+                extra_length)
+
+    def raw_data(self, info):
+        """Returns a memoryview of the compressed data of info.
+
+        The view shares the memory map; release it before closing."""
+        start = self.data_offset(info)
+        end = start + info.compress_size
+        if end > len(self._map):
+            raise zipfile.BadZipFile('Truncated member {0}.'.
+                                     format(info.filename))
+        return memoryview(self._map)[start:end]
+
+    def read_chunks(self, info):
+        """Yield the uncompressed content of info in chunks, checking
+        its CRC at the end."""
+        decompressor = zipfile._get_decompressor(info.compress_type)
+        crc = 0
+        with self.raw_data(info) as raw:
+            for start in range(0, len(raw), CHUNK_SIZE):
+                chunk = raw[start:start + CHUNK_SIZE]
+                if decompressor:
+                    chunk = decompressor.decompress(chunk)
+                else:
+                    chunk = bytes(chunk)
+                crc = zlib.crc32(chunk, crc)
+                yield chunk
+        if crc != info.CRC:
+            raise zipfile.BadZipFile('Bad CRC-32 for file {0!r}'.
+                                     format(info.filename))
+
+
+def decode_name(raw_name, flags):
+    """Decode a raw member name the way zipfile does."""
+    if flags & UTF8_FLAG:
+        return raw_name.decode('utf-8')
+    return raw_name.decode('cp437')
+
+
+def decode_zip64(extra, file_size, compress_size, header_offset):
+    """Returns (file_size, compress_size, header_offset) after applying
+    any zip64 extended information in extra."""
+    position = 0
+    while position + 4 <= len(extra):
+        tag, length = struct.unpack_from('<2H', extra, position)
+        if tag == 1:
+            values = iter(struct.unpack_from('<{0}Q'.format(length // 8),
+                                             extra, position + 4))
+            if file_size == 0xffffffff:
+                file_size = next(values)
+            if compress_size == 0xffffffff:
+                compress_size = next(values)
+            if header_offset == 0xffffffff:
+                header_offset = next(values)
+            break
+        position += 4 + length
+    return file_size, compress_size, header_offset
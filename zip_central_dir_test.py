@@ -0,0 +1,100 @@
+"""Defines and runs the unit tests for the zip_central_dir module."""
+
+
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import zip_central_dir
+
+
+class ZipCentralDirectoryTest(unittest.TestCase):
+    """Defines the unit tests for ZipCentralDirectory."""
+
+    def setUp(self):
+        """Set up the test fixture."""
+        self._dirname = tempfile.mkdtemp(prefix='zip_central_dir_test')
+        self._zipName = os.path.join(self._dirname, 'membra.zip')
+        self._members = {'scirit': b'tellus. Phasellus posuere,',
+                         'possible/existit': b'sit',
+                         'possible/publici/porcus': b'rutrum risus' * 100,
+                         u'possible/éléphanti': b'Nam pretium',
+                         'vacuum': b''}
+        zipFile = zipfile.ZipFile(self._zipName, 'w', zipfile.ZIP_DEFLATED)
+        for name in sorted(self._members):
+            zipFile.writestr(name, self._members[name])
+        zipFile.writestr('stored', b'odio', zipfile.ZIP_STORED)
+        zipFile.close()
+        self._members['stored'] = b'odio'
+
+    def tearDown(self):
+        """Tear down the test fixture."""
+        shutil.rmtree(self._dirname)
+
+    def testListsNamesInOrder(self):
+        """Iterating lists the member names in archive order."""
+        zipFile = zipfile.ZipFile(self._zipName)
+        expected = zipFile.namelist()
+        zipFile.close()
+        with zip_central_dir.ZipCentralDirectory(self._zipName) as listing:
+            self.assertEqual(expected, list(listing))
+            self.assertEqual(len(self._members), len(listing))
+
+    def testEntriesMatchZipFile(self):
+        """Parsed entries agree with zipfile's."""
+        zipFile = zipfile.ZipFile(self._zipName)
+        expected = [(i.filename, i.CRC, i.file_size, i.compress_size,
+                     i.header_offset, i.date_time, i.compress_type)
+                    for i in zipFile.infolist()]
+        zipFile.close()
+        with zip_central_dir.ZipCentralDirectory(self._zipName) as listing:
+            actual = [(i.filename, i.CRC, i.file_size, i.compress_size,
+                       i.header_offset, i.date_time, i.compress_type)
+                      for i in listing.entries()]
+        self.assertEqual(expected, actual)
+
+    def testExistsAndRead(self):
+        """Members are found and read by name."""
+        with zip_central_dir.ZipCentralDirectory(self._zipName) as listing:
+            for name, content in self._members.items():
+                self.assertTrue(name in listing)
+                self.assertEqual(content, listing.read(name))
+            self.assertFalse(listing.exists('nusquam'))
+            self.assertRaises(KeyError, listing.read, 'nusquam')
+
+    def testPrependedDataIsSkipped(self):
+        """An archive preceded by other data is still read."""
+        with open(self._zipName, 'rb') as zipFile:
+            data = zipFile.read()
+        with open(self._zipName, 'wb') as zipFile:
+            zipFile.write(b'#! self-extracting stub\n' + data)
+        with zip_central_dir.ZipCentralDirectory(self._zipName) as listing:
+            self.assertEqual(b'sit', listing.read('possible/existit'))
+
+    def testBadCrcRaisesError(self):
+        """A corrupt stored member fails its CRC check."""
+        with open(self._zipName, 'rb') as zipFile:
+            data = zipFile.read()
+        with open(self._zipName, 'wb') as zipFile:
+            zipFile.write(data.replace(b'odio', b'odIo'))
+        with zip_central_dir.ZipCentralDirectory(self._zipName) as listing:
+            self.assertRaises(zipfile.BadZipFile, listing.read, 'stored')
+
+    def testNotZipRaisesError(self):
+        """A file that is not a .zip file raises BadZipFile."""
+        with open(self._zipName, 'wb') as zipFile:
+            zipFile.write(b'Nam pretium justo nec magna')
+        self.assertRaises(zipfile.BadZipFile,
+                          zip_central_dir.ZipCentralDirectory, self._zipName)
+
+
+def suite():
+    """Returns the suite of unit tests in this module."""
+    return unittest.TestLoader().loadTestsFromTestCase(
+        ZipCentralDirectoryTest)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,8 +6,10 @@
 
 from optparse import OptionParser
 import os
+import sys
 
-from dir_archive import ZipDirArchive
+from dir_archive import (CompressionPolicy, JsonSummaryReporter, ZipArchive,
+                         ZipDirArchive)
 
 
 if __name__ == '__main__':
@@ -22,16 +24,68 @@ if __name__ == '__main__':
                       using the format <basename>.zip where <basename>
                       is the basename of the directory to be archived
                       and will place this file in the current directory.
+                      Use '-' to write the archive to standard output.
                       """)
+    parser.add_option('-j', '--jobs', type='int', default=1,
+                      help="""Compress files using this many worker
+                      processes (default 1).""")
+    parser.add_option('-c', '--codec', default='deflate',
+                      choices=sorted(CompressionPolicy.CODECS),
+                      help="""Compress files using this codec: store,
+                      deflate, bzip2 or lzma (default deflate).""")
+    parser.add_option('-l', '--level', type='int',
+                      help="""Compress files at this level (default: the
+                      codec's default).""")
+    parser.add_option('-s', '--store-compressed', action='store_true',
+                      default=False,
+                      help="""Store files that are already compressed
+                      (judging by extension or by a sample of their
+                      content) instead of compressing them again.""")
+    parser.add_option('-o', '--read-order', choices=['inode'],
+                      help="""Read files ahead in this order (inode) to
+                      spare seeks on slow disks; members are then written
+                      sorted by path.""")
+    parser.add_option('-v', '--volume-size', type='int',
+                      help="""Split the archive into volumes named
+                      <zipname>.001.zip, <zipname>.002.zip, ... each
+                      at most this many bytes long. A file too large
+                      for a volume of its own is an error.""")
+    parser.add_option('-n', '--volumes', type='int',
+                      help="""Split the archive into this many volumes
+                      of about the same size (not with -v).""")
+    parser.add_option('-r', '--report',
+                      help="""Write a JSON summary of the run (sizes,
+                      throughput and slowest members) into this file.""")
 
     opts, args = parser.parse_args()
     if len(args) != 1:
         parser.error("Exactly one dir_name required.")
+    if opts.volume_size and opts.volumes:
+        parser.error("Use either -v/--volume-size or -n/--volumes.")
 
     dirname = args[0]
     zipname = os.path.basename(dirname)
-    zipper = ZipDirArchive(dirname, zipname)
-    zipper.archive()
+    if opts.zipname and opts.zipname != '-':
+        zipname = opts.zipname
+        if zipname.endswith(ZipArchive.EXT):
+            zipname = zipname[:-len(ZipArchive.EXT)]
+    policy = None
+    if (opts.codec != 'deflate') or opts.level or opts.store_compressed:
+        if opts.store_compressed:
+            policy = CompressionPolicy(opts.codec, opts.level)
+        else:
+            policy = CompressionPolicy(opts.codec, opts.level,
+                                       compressed_exts=(), sample_size=0)
+    zipper = ZipDirArchive(dirname, zipname, jobs=opts.jobs, policy=policy,
+                           read_order=opts.read_order,
+                           volume_size=opts.volume_size,
+                           volumes=opts.volumes)
+    if opts.report:
+        zipper.add_observer(JsonSummaryReporter(opts.report))
+    if opts.zipname == '-':
+        zipper.archive(fileobj=sys.stdout.buffer)
+    else:
+        zipper.archive()
     
     
     